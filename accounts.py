@@ -0,0 +1,74 @@
+# 账户：监控列表、交易记录、持仓、批次和提醒规则都按 account_id 分区，相关索引都以 account_id 开头
+# 请求通过 X-Account-Id 请求头或 ?account= 参数指定账户，未指定时使用默认账户 1
+# 行情和提醒评估不分账户：同一代码无论被多少账户关注都只轮询一次
+import threading
+
+ACCOUNT_HEADER = 'X-Account-Id'
+ACCOUNT_PARAM = 'account'
+DEFAULT_ACCOUNT = 1
+
+ACCOUNTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+ACCOUNT_FIELDS = ('id', 'name', 'created_at')
+
+
+def create_tables(c):
+    c.execute(ACCOUNTS_SCHEMA)
+    c.execute("INSERT OR IGNORE INTO accounts (id, name) VALUES (?, 'default')", (DEFAULT_ACCOUNT,))
+
+
+def parse_account_id(value):
+    if value is None or value == '':
+        return DEFAULT_ACCOUNT
+    try:
+        account_id = int(value)
+    except ValueError:
+        raise ValueError('账户编号必须是整数')
+    if account_id <= 0:
+        raise ValueError('账户编号必须是正整数')
+    return account_id
+
+
+def create_account(c, name):
+    name = str(name or '').strip()
+    if not name:
+        raise ValueError('请输入账户名称')
+    c.execute('INSERT INTO accounts (name) VALUES (?)', (name,))
+    return c.lastrowid
+
+
+def get_account(c, account_id):
+    c.execute(f'SELECT {", ".join(ACCOUNT_FIELDS)} FROM accounts WHERE id = ?', (account_id,))
+    row = c.fetchone()
+    return dict(zip(ACCOUNT_FIELDS, row)) if row else None
+
+
+class AccountDirectory:
+    # 记住已确认存在的账户编号，每个请求校验账户只是一次集合查找
+    # 账户不会被删除，确认过的编号可以一直缓存；其他进程新建的账户在第一次访问时按主键查询
+    def __init__(self):
+        self._known = {DEFAULT_ACCOUNT}
+        self._lock = threading.Lock()
+
+    def exists(self, c, account_id):
+        if account_id in self._known:
+            return True
+        c.execute('SELECT 1 FROM accounts WHERE id = ?', (account_id,))
+        if c.fetchone() is None:
+            return False
+        self.add(account_id)
+        return True
+
+    def add(self, account_id):
+        with self._lock:
+            self._known.add(account_id)
+
+    @property
+    def count(self):
+        return len(self._known)
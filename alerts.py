@@ -0,0 +1,394 @@
+# 价格提醒引擎：规则按代码分组，阈值保存在有序数组中
+# 每次价格变化只用二分查找定位被穿越的规则，不需要扫描全部规则
+#   above 规则：价格 >= threshold 时触发，价格 < threshold - hysteresis 时解除
+#   below 规则：价格 <= threshold 时触发，价格 > threshold + hysteresis 时解除
+# cooldown 为同一条规则两次记录触发事件之间的最小间隔（秒）
+# 所有账户的规则在同一个引擎中按代码索引，每次价格变化的评估代价与账户数无关
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+import accounts
+
+_INF = float('inf')
+
+ALERT_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS alert_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        symbol TEXT NOT NULL,
+        direction TEXT NOT NULL CHECK (direction IN ('above', 'below')),
+        threshold REAL NOT NULL,
+        hysteresis REAL NOT NULL DEFAULT 0,
+        cooldown REAL NOT NULL DEFAULT 0,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        stock_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_alert_rules_symbol ON alert_rules (symbol)',
+    'CREATE INDEX IF NOT EXISTS idx_alert_rules_stock ON alert_rules (stock_id)',
+    # 提醒事件只追加不修改
+    '''
+    CREATE TABLE IF NOT EXISTS alert_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rule_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        event TEXT NOT NULL,
+        direction TEXT NOT NULL,
+        threshold REAL NOT NULL,
+        price REAL NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_alert_events_rule ON alert_events (rule_id, id)',
+    'CREATE INDEX IF NOT EXISTS idx_alert_events_symbol ON alert_events (symbol, id)',
+]
+
+# 迁移 7 添加 account_id 列后使用的索引
+ACCOUNT_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_alert_rules_account ON alert_rules (account_id, id)',
+    'DROP INDEX IF EXISTS idx_alert_events_symbol',
+    'CREATE INDEX IF NOT EXISTS idx_alert_events_account ON alert_events (account_id, id)',
+    'CREATE INDEX IF NOT EXISTS idx_alert_events_account_symbol ON alert_events (account_id, symbol, id)',
+]
+
+RULE_FIELDS = ('id', 'symbol', 'direction', 'threshold', 'hysteresis', 'cooldown', 'enabled', 'stock_id',
+               'account_id')
+
+
+def create_tables(c):
+    for sql in ALERT_SCHEMA:
+        c.execute(sql)
+
+
+def create_account_indexes(c):
+    for sql in ACCOUNT_INDEXES:
+        c.execute(sql)
+
+
+class AlertRule:
+    __slots__ = RULE_FIELDS + ('active', 'last_fired')
+
+    def __init__(self, id, symbol, direction, threshold, hysteresis=0.0, cooldown=0.0,
+                 enabled=True, stock_id=None, account_id=accounts.DEFAULT_ACCOUNT):
+        self.id = id
+        self.symbol = symbol
+        self.direction = direction
+        self.threshold = threshold
+        self.hysteresis = hysteresis or 0.0
+        self.cooldown = cooldown or 0.0
+        self.enabled = bool(enabled)
+        self.stock_id = stock_id
+        self.account_id = account_id
+        self.active = False
+        self.last_fired = None
+
+    @property
+    def trigger_key(self):
+        return self.threshold
+
+    @property
+    def clear_key(self):
+        if self.direction == 'above':
+            return self.threshold - self.hysteresis
+        return self.threshold + self.hysteresis
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in RULE_FIELDS}
+        data['enabled'] = self.enabled
+        data['active'] = self.active
+        data['last_fired'] = self.last_fired
+        return data
+
+
+class _SymbolIndex:
+    # 单个代码下的规则索引：四个按键值排序的 (键值, 规则id) 数组
+    __slots__ = ('above', 'above_clear', 'below', 'below_clear', 'last_price')
+
+    def __init__(self):
+        self.above = []
+        self.above_clear = []
+        self.below = []
+        self.below_clear = []
+        self.last_price = None
+
+    def lists_for(self, rule):
+        if rule.direction == 'above':
+            return self.above, self.above_clear
+        return self.below, self.below_clear
+
+    def __len__(self):
+        return len(self.above) + len(self.below)
+
+
+class AlertEngine:
+    def __init__(self):
+        self._rules = {}
+        self._index = {}
+        self._by_stock = {}
+        self._by_account = {}
+        self._lock = threading.Lock()
+
+    # ---- 规则维护 ----
+    def load(self, c):
+        # 从数据库加载全部规则，并用每条规则最后一个事件恢复触发状态
+        c.execute(f'SELECT {", ".join(RULE_FIELDS)} FROM alert_rules')
+        rules = [AlertRule(*row) for row in c.fetchall()]
+        c.execute('''
+            SELECT rule_id, event, created_at FROM alert_events
+            WHERE id IN (SELECT MAX(id) FROM alert_events GROUP BY rule_id)
+        ''')
+        last_events = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+        c.execute('''
+            SELECT rule_id, MAX(created_at) FROM alert_events
+            WHERE event = 'triggered' GROUP BY rule_id
+        ''')
+        last_fired = dict(c.fetchall())
+        with self._lock:
+            self._rules.clear()
+            self._index.clear()
+            self._by_stock.clear()
+            self._by_account.clear()
+            for rule in rules:
+                event = last_events.get(rule.id)
+                rule.active = event is not None and event[0] == 'triggered'
+                rule.last_fired = last_fired.get(rule.id)
+                self._add(rule)
+        return len(rules)
+
+    def _add(self, rule):
+        self._rules[rule.id] = rule
+        if rule.stock_id is not None:
+            self._by_stock.setdefault(rule.stock_id, set()).add(rule.id)
+        self._by_account.setdefault(rule.account_id, set()).add(rule.id)
+        if not rule.enabled:
+            return
+        index = self._index.setdefault(rule.symbol, _SymbolIndex())
+        triggers, clears = index.lists_for(rule)
+        insort(triggers, (rule.trigger_key, rule.id))
+        insort(clears, (rule.clear_key, rule.id))
+
+    def _remove(self, rule_id):
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        if rule.stock_id is not None:
+            ids = self._by_stock.get(rule.stock_id)
+            if ids:
+                ids.discard(rule_id)
+                if not ids:
+                    del self._by_stock[rule.stock_id]
+        ids = self._by_account.get(rule.account_id)
+        if ids:
+            ids.discard(rule_id)
+            if not ids:
+                del self._by_account[rule.account_id]
+        index = self._index.get(rule.symbol)
+        if index is not None and rule.enabled:
+            triggers, clears = index.lists_for(rule)
+            for keys, key in ((triggers, rule.trigger_key), (clears, rule.clear_key)):
+                i = bisect_left(keys, (key, rule_id))
+                if i < len(keys) and keys[i] == (key, rule_id):
+                    del keys[i]
+            if not len(index) and index.last_price is None:
+                del self._index[rule.symbol]
+        return rule
+
+    def upsert(self, rule, current_price=None, now=None):
+        # 新增或修改规则，并按当前价格立即评估，返回产生的事件
+        # current_price 用于该代码尚未收到过行情推送的情况
+        now = time.time() if now is None else now
+        with self._lock:
+            old = self._remove(rule.id)
+            if old is not None and (old.symbol, old.direction) == (rule.symbol, rule.direction):
+                rule.active = old.active
+                rule.last_fired = old.last_fired
+            self._add(rule)
+            index = self._index.get(rule.symbol)
+            if index is None or not rule.enabled:
+                return []
+            if index.last_price is None:
+                return self._tick(index, current_price, now) if current_price is not None else []
+            return self._evaluate(rule, index.last_price, now)
+
+    def remove(self, rule_id):
+        with self._lock:
+            return self._remove(rule_id)
+
+    def remove_stock(self, stock_id):
+        with self._lock:
+            for rule_id in list(self._by_stock.get(stock_id, ())):
+                self._remove(rule_id)
+
+    def get(self, rule_id):
+        return self._rules.get(rule_id)
+
+    def rules(self, symbol=None, account_id=None):
+        # 指定账户时只遍历该账户的规则
+        if account_id is None:
+            rules = list(self._rules.values())
+        else:
+            rules = [self._rules[rule_id] for rule_id in list(self._by_account.get(account_id, ()))]
+        if symbol is not None:
+            rules = [rule for rule in rules if rule.symbol == symbol]
+        return sorted(rules, key=lambda rule: rule.id)
+
+    def stock_rules(self, stock_id):
+        return [self._rules[rule_id] for rule_id in self._by_stock.get(stock_id, ())]
+
+    def stock_alert(self, stock_id):
+        ids = self._by_stock.get(stock_id)
+        if not ids:
+            return False
+        return any(self._rules[rule_id].active for rule_id in ids)
+
+    @property
+    def rule_count(self):
+        return len(self._rules)
+
+    # ---- 行情驱动 ----
+    def _evaluate(self, rule, price, now):
+        # 按当前价格直接判断单条规则的状态（用于首个价格或规则变更）
+        if rule.direction == 'above':
+            hit = price >= rule.threshold
+            clear = price < rule.clear_key
+        else:
+            hit = price <= rule.threshold
+            clear = price > rule.clear_key
+        if hit and not rule.active:
+            return self._fire(rule, price, now)
+        if clear and rule.active:
+            rule.active = False
+            return [(rule, 'cleared', price)]
+        return []
+
+    def _fire(self, rule, price, now):
+        rule.active = True
+        if rule.last_fired is not None and now - rule.last_fired < rule.cooldown:
+            return []
+        rule.last_fired = now
+        return [(rule, 'triggered', price)]
+
+    def on_price(self, symbol, price, now=None):
+        # 返回 [(规则, 'triggered'|'cleared', 价格)]
+        now = time.time() if now is None else now
+        with self._lock:
+            index = self._index.get(symbol)
+            if index is None:
+                return []
+            return self._tick(index, price, now)
+
+    def _tick(self, index, price, now):
+        prev = index.last_price
+        index.last_price = price
+        if prev is None:
+            events = []
+            for keys in (index.above, index.below):
+                for _, rule_id in keys:
+                    events.extend(self._evaluate(self._rules[rule_id], price, now))
+            return events
+        if price == prev:
+            return []
+
+        events = []
+        rules = self._rules
+        if price > prev:
+            # 上涨：穿越的 above 阈值触发，穿越的 below 解除线解除
+            for _, rule_id in index.above[bisect_right(index.above, (prev, _INF)):
+                                          bisect_right(index.above, (price, _INF))]:
+                rule = rules[rule_id]
+                if not rule.active:
+                    events.extend(self._fire(rule, price, now))
+            for _, rule_id in index.below_clear[bisect_left(index.below_clear, (prev, -1)):
+                                                bisect_left(index.below_clear, (price, -1))]:
+                rule = rules[rule_id]
+                if rule.active:
+                    rule.active = False
+                    events.append((rule, 'cleared', price))
+        else:
+            # 下跌：穿越的 below 阈值触发，穿越的 above 解除线解除
+            for _, rule_id in index.below[bisect_left(index.below, (price, -1)):
+                                          bisect_left(index.below, (prev, -1))]:
+                rule = rules[rule_id]
+                if not rule.active:
+                    events.extend(self._fire(rule, price, now))
+            for _, rule_id in index.above_clear[bisect_right(index.above_clear, (price, _INF)):
+                                                bisect_right(index.above_clear, (prev, _INF))]:
+                rule = rules[rule_id]
+                if rule.active:
+                    rule.active = False
+                    events.append((rule, 'cleared', price))
+        return events
+
+    def on_prices(self, prices, now=None):
+        # prices 为 {代码: 价格}，只处理设置了规则的代码
+        events = []
+        for symbol, price in prices.items():
+            if symbol in self._index:
+                events.extend(self.on_price(symbol, price, now))
+        return events
+
+
+def record_events(c, events, now=None):
+    now = time.time() if now is None else now
+    c.executemany('''
+        INSERT INTO alert_events (rule_id, account_id, symbol, event, direction, threshold, price, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(rule.id, rule.account_id, rule.symbol, event, rule.direction, rule.threshold, price, now)
+          for rule, event, price in events])
+
+
+def last_event_id(c):
+    return c.execute('SELECT COALESCE(MAX(id), 0) FROM alert_events').fetchone()[0]
+
+
+def list_events_since(c, after_id):
+    # 按 id 顺序返回 after_id 之后的事件 (id, rule_id, account_id, symbol, event, price)
+    c.execute('SELECT id, rule_id, account_id, symbol, event, price FROM alert_events WHERE id > ? ORDER BY id',
+              (after_id,))
+    return c.fetchall()
+
+
+def insert_rule(c, symbol, direction, threshold, hysteresis=0.0, cooldown=0.0,
+                enabled=True, stock_id=None, account_id=accounts.DEFAULT_ACCOUNT):
+    c.execute('''
+        INSERT INTO alert_rules (symbol, direction, threshold, hysteresis, cooldown, enabled, stock_id, account_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (symbol, direction, threshold, hysteresis, cooldown, int(bool(enabled)), stock_id, account_id))
+    return AlertRule(c.lastrowid, symbol, direction, threshold, hysteresis, cooldown, enabled, stock_id,
+                     account_id)
+
+
+def update_rule(c, rule):
+    c.execute('''
+        UPDATE alert_rules SET symbol = ?, direction = ?, threshold = ?, hysteresis = ?,
+                               cooldown = ?, enabled = ?
+        WHERE id = ?
+    ''', (rule.symbol, rule.direction, rule.threshold, rule.hysteresis, rule.cooldown,
+          int(rule.enabled), rule.id))
+
+
+def delete_rules(c, rule_ids, account_id):
+    # 只删除本账户的规则，返回删除的行数
+    c.executemany('DELETE FROM alert_rules WHERE id = ? AND account_id = ?',
+                  [(rule_id, account_id) for rule_id in rule_ids])
+    return c.rowcount
+
+
+def list_events(c, account_id, symbol=None, rule_id=None, limit=100):
+    sql = 'SELECT id, rule_id, symbol, event, direction, threshold, price, created_at FROM alert_events'
+    conditions = ['account_id = ?']
+    params = [account_id]
+    if symbol is not None:
+        conditions.append('symbol = ?')
+        params.append(symbol)
+    if rule_id is not None:
+        conditions.append('rule_id = ?')
+        params.append(rule_id)
+    sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    c.execute(sql, params)
+    keys = ('id', 'rule_id', 'symbol', 'event', 'direction', 'threshold', 'price', 'created_at')
+    return [dict(zip(keys, row)) for row in c.fetchall()]
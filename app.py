@@ -1,543 +1,1211 @@
-from flask import Flask, request, jsonify
-import sqlite3
+from flask import Flask, Response, g, request, jsonify
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.routing import Rule
 from datetime import datetime
 import os
-import json
+import math
+import threading
+import time
+import accounts
+import db
+import alerts
+import atexit
+import functools
+import click
+import contextlib
+import history
+import importer
+import journal
+import listing
+import lots
+import metrics
+import positions
+import quotes
+import recovery
+import respcache
+import poller
+import shared
+import stream
+import symbols
 
 app = Flask(__name__)
 
-# 使用SQLite内存数据库
-def init_db():
-    conn = sqlite3.connect(':memory:')
-    c = conn.cursor()
-    
-    c.execute('''
-        CREATE TABLE IF NOT (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            symbol TEXT NOT NULL,
-            name TEXT,
-            high_price REAL,
-            low_price REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            symbol TEXT NOT NULL,
-            type TEXT,
-            price REAL,
-            quantity INTEGER,
-            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    return conn
-
-db_conn = init_db()
-
-# 股票价格获取函数（模拟数据，您可替换为真实接口）
+# 数据库默认保存在本地文件（WAL 模式），DB_PATH=:memory: 时使用进程退出时删除的临时库
+# 持仓成本法由 COST_METHOD 配置（fifo / lifo / average），与库中批次数据不一致时启动时全量重建
+cost_method = lots.method_from_env()
+
+# 操作日志：文件库默认在 <DB_PATH>.journal 目录记录每个写操作，JOURNAL=0 关闭；内存库设置 JOURNAL_DIR 后启用
+#   JOURNAL_FSYNC_INTERVAL     没有请求等待时后台 fsync 的间隔秒数，默认 0.05
+#   JOURNAL_SNAPSHOT_INTERVAL  写快照的间隔秒数，默认 300，日志没有新记录时跳过
+#   JOURNAL_KEEP_SNAPSHOTS     保留的快照个数，默认 3；早于最旧快照的日志段随之删除
+# 启动时从库中记录的日志位置（空库从最近的快照）开始重放日志尾部
+journal_dir = journal.directory_from_env(os.environ.get('DB_PATH', db.DEFAULT_PATH))
+recovery_state = {'snapshot': None, 'replayed': 0, 'lsn': 0, 'seconds': 0.0}
+
+# 启动优化模式（FAST_START=1，用于按需启动、空闲时缩容到零的容器）：
+# 迁移、日志恢复以及提醒规则和证券主数据的加载放到后台线程，导入完成即可响应 /health，其他请求等待准备完成
+# 看板页面、通知和响应格式等只在处理请求时用到的模块也在后台载入（见 load_deferred），路由的 URL 构造函数按需编译
+# 行情轮询等后台线程在第一个请求处理完之后才启动，并立即刷新一次全部代码的报价预热缓存
+# 命令行命令（flask --app app ...）先等待准备完成
+FAST_START = os.environ.get('FAST_START', '0') == '1'
+READY_TIMEOUT = float(os.environ.get('READY_TIMEOUT', 30))
+
+class LazyBuilderRule(Rule):
+    # 路由的 URL 构造函数（url_for 使用）在第一次构造该路由的 URL 时才编译，注册路由时只编译匹配部分
+    def _compile_builder(self, append_unknown=True):
+        compile_builder = super()._compile_builder
+
+        def build(rule, *args, **kwargs):
+            builder = compile_builder(append_unknown).__get__(rule, None)
+            setattr(rule, '_build_unknown' if append_unknown else '_build', builder)
+            return builder(*args, **kwargs)
+        return build
+
+if FAST_START:
+    app.url_rule_class = LazyBuilderRule
+
+def prepare_db():
+    import migrations
+    # 迁移 9 改写已有数据中的代码写法；从版本 8 升级且开启日志时，改名也记入日志，重放之前的记录时同样改名
+    version = database.conn().execute('PRAGMA user_version').fetchone()[0]
+    renames = migrations.symbol_renames_v9(database.cursor()) if version == 8 and journal_dir is not None else {}
+    database.migrate(migrations.MIGRATIONS)
+    lsn = None
+    with database.transaction() as c:
+        c.execute('BEGIN IMMEDIATE')
+        if journal_dir is not None:
+            start = time.perf_counter()
+            os.makedirs(journal_dir, exist_ok=True)
+            recovery_state.update(recovery.recover(c, journal_dir, cost_method))
+            recovery_state['seconds'] = time.perf_counter() - start
+            if renames:
+                lsn = journal_append(c, 'symbols', {'renames': renames})
+        lots.ensure_method(c, cost_method)
+    journal_sync(lsn)
+
+app_ready = threading.Event()
+first_response = threading.Event()
+
+op_journal = None
+if journal_dir is not None:
+    op_journal = journal.Journal(journal_dir, float(os.environ.get('JOURNAL_FSYNC_INTERVAL', 0.05)))
+    op_journal.start()
+    atexit.register(op_journal.close)
+
+# 本线程当前写事务追加的日志记录 LSN，事务回滚时据此写作废标记
+journal_pending = threading.local()
+
+@contextlib.contextmanager
+def write_transaction():
+    # 带操作日志的写事务；提交失败回滚时，本事务已追加的日志记录由一条作废标记撤销，恢复和重建时跳过
+    journal_pending.lsns = lsns = []
+    try:
+        with database.transaction() as c:
+            yield c
+    except BaseException:
+        if lsns:
+            op_journal.append(journal.ABORT_OP, {'lsns': lsns})
+        raise
+    finally:
+        journal_pending.lsns = None
+
+def journal_append(c, op, data):
+    # 在写事务内、所有写语句成功之后、提交前调用：追加一条操作日志并更新库中的日志位置，返回 LSN
+    return journal_write(c, [journal.encode(op, data, time.time())])
+
+def journal_write(c, records):
+    # 一次追加多条 journal.encode 编码好的记录，返回最后一条的 LSN
+    if op_journal is None or not records:
+        return None
+    lsns = op_journal.write(records)
+    pending = getattr(journal_pending, 'lsns', None)
+    if pending is not None:
+        pending.extend(lsns)
+    recovery.set_lsn(c, lsns[-1])
+    return lsns[-1]
+
+def journal_sync(lsn):
+    # 事务提交后等待日志落盘再返回，同时到达的写请求共享一次 fsync
+    if lsn is not None and not op_journal.wait(lsn):
+        app.logger.warning('操作日志 fsync 超时，LSN %s', lsn)
+
+database = db.open_from_env()
+if not FAST_START:
+    prepare_db()
+
+# 多进程模式：serve.py 启动多个 worker 时设置 SHARED_STATE=1
+# 各 worker 共用数据库文件，数据版本放在共享内存映射文件中，行情轮询和提醒评估只由 leader 进程执行
+SHARED_STATE = os.environ.get('SHARED_STATE', '0') == '1'
+if SHARED_STATE and database.memory:
+    raise RuntimeError('多进程模式需要使用数据库文件，不能使用 :memory:')
+leader = shared.LeaderLock(database.path + '.leader') if SHARED_STATE else None
+
+def is_leader():
+    return leader is None or leader.held
+
+# 启动准备完成前只响应 /health
+@app.before_request
+def wait_until_ready():
+    if app_ready.is_set() or request.path == '/health':
+        return None
+    if not app_ready.wait(READY_TIMEOUT):
+        return jsonify({'success': False, 'message': '服务正在启动'}), 503
+    return None
+
+@app.after_request
+def mark_first_response(response):
+    if not first_response.is_set():
+        response.call_on_close(first_response.set)
+    return response
+
+# 请求结束时把本线程的连接归还连接池
+@app.teardown_appcontext
+def release_db(exc):
+    database.release()
+
+# 账户：/api/ 请求由 X-Account-Id 请求头或 ?account= 参数指定，未指定时为默认账户
+# 已确认存在的账户编号缓存在内存中，校验代价与账户总数无关
+account_directory = accounts.AccountDirectory()
+
+@app.before_request
+def resolve_account():
+    if not request.path.startswith('/api/'):
+        return None
+    try:
+        account_id = accounts.parse_account_id(
+            request.headers.get(accounts.ACCOUNT_HEADER) or request.args.get(accounts.ACCOUNT_PARAM))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if not account_directory.exists(database.cursor(), account_id):
+        return jsonify({'success': False, 'message': '账户不存在'}), 404
+    g.account_id = account_id
+    return None
+
+# 按路由记录请求数与耗时；路由使用 URL 规则（如 /api/alerts/<int:rule_id>），避免标签无限增长
+@app.before_request
+def start_request_timer():
+    request.environ['stock_monitor.start'] = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = request.environ.get('stock_monitor.start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route, request.method)
+        metrics.HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+    return response
+
+# 股票价格通过共享缓存获取，报价源由 QUOTE_PROVIDER 等环境变量配置
+quote_cache = quotes.create_cache_from_env()
+
+# 需要行情的代码：监控列表、未平仓的持仓和启用的提醒规则
+def watched_symbols():
+    c = database.cursor()
+    c.execute('SELECT symbol FROM stocks UNION SELECT symbol FROM positions WHERE quantity > 0 '
+              'UNION SELECT symbol FROM alert_rules WHERE enabled = 1')
+    return [row[0] for row in c.fetchall()]
+
+# 账户代码集合按监控列表、持仓和提醒的数据版本缓存，版本不变时不查询数据库
+account_symbols_cache = {}
+
+def account_symbols(account_id):
+    # 一个账户需要行情的代码，用于按账户推送报价和计算价格相关的缓存键
+    # 先取版本再查询：查询期间发生的写入会让缓存的版本落后，下次请求重新查询
+    versions = data_versions.key(('watchlist', 'ledger', 'alerts'))
+    cached = account_symbols_cache.get(account_id)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    c = database.cursor()
+    c.execute('SELECT symbol FROM stocks WHERE account_id = ? '
+              'UNION SELECT symbol FROM positions WHERE account_id = ? AND quantity > 0 '
+              'UNION SELECT symbol FROM alert_rules WHERE account_id = ? AND enabled = 1',
+              (account_id, account_id, account_id))
+    symbols = [row[0] for row in c.fetchall()]
+    account_symbols_cache[account_id] = (versions, symbols)
+    return symbols
+
+# 后台线程定期刷新报价，接口只读取内存快照
+price_snapshot, quote_poller = poller.create_poller_from_env(quote_cache, watched_symbols)
+
 def get_stock_price(symbol):
-    import random
-    return round(10 + random.random() * 20, 2)
+    return price_snapshot.price(symbol)
+
+# 看板页面生成一次，支持 ETag 条件请求和预压缩版本；在 load_deferred 中生成
+dashboard_page = None
 
 @app.route('/')
 def index():
-    html = f'''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width-scale=1.0">
-        <title>股票监控系统 - 腾讯云Web托管</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
-        <style>
-            body {{
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            }}
-            .container {{
-                max-width: 1200px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            .card {{
-                border-radius: 15px;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-                margin-bottom: 20px;
-                border: none;
-            }}
-            .card-header {{
-                border-radius: 15px 15px 0 0 !important;
-                border: none;
-                font-weight: 600;
-            }}
-            th {{
-                border-top: none;
-                font-weight: 600;
-            }}
-            .profit {{ color: #28a745; font-weight: bold; }}
-            .loss {{ color: #dc3545; font-weight: bold; }}
-            .btn-primary {{
-                background: linear-gradient(45deg, #667eea, #764ba2);
-                border: none;
-                border-radius: 8px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="text-center text-white mb-4">
-                <h1><i class="fas fa-chart-line me-2"></i>股票监控系统</h1>
-                <p class="lead">腾讯云Web托管部署版 - 实时监控股票价格</p>
-                <p class="textuted">服务器时间: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</p>
-            </div>
-
-            <div class="row">
-                <div class="col-md-6">
-                    <div class="card">
-                        <div class="card-header bg-primary text-white">
-                            <h5 class="mb-0"><i class="fas fa-plus-circle me-2"></i>添加监控股票</h5>
-                        </div>
-                        <div class="card-body">
-                            <div class="row g-2">
-                                <div class="col-5">
-                                    <inputtext" class="form-control" id="symbol" placeholder="股票代码">
-                                </div>
-                                <div class="col-5">
-                                    <input type="text" class="form-control" id="name" placeholder="股票名称">
-                                </div>
-                                <div class="col-2">
-                                    <button class="btn btn-primary w-100" onclick="addStock()">添加</button>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-
-                    <div class="card">
-                        <div class="card-header bg-success text-white">
-                            <h5 class="mb-0"><i class="fas fa-exchange-alt me-2"></i>交易记录</h5>
-                        </div>
-                        <div class="card-body">
-                            <div class="row g">
-                                <div class="col-3">
-                                    <input type="text" class="form-control" id="tSymbol" placeholder="代码">
-                                </div>
-                                <div class="col-3">
-                                    <select class="form-select" id="tType">
-                                        <option value="buy">买入</option>
-                                        <option value="sell">卖出</option>
-                                    </select>
-                                </div>
-                                <div class="col-2">
-                                    <input type="number" class="form-control" id="tPrice" placeholder="价格" step="0.01">
-                                </div>
-                                <div class="col-2">
-                                    <input type="number" class="form-control" id="tQuantity" placeholder="数量">
-                                </div>
-                                <div class="col-2">
-                                     class="btn btn-success w-100" onclick="addTransaction()">+</button>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-
-                <div class="col-md-6">
-                    <div class="card h-100">
-                        <div class="card-header bg-info text-white d-flex justify-content-between align-items-center">
-                            <h5 class="mb-0"><i class="fas fa-chart-bar me-2"></i>系统状态</h5>
-                            <button class="btn btn-light btn-sm" onclick="refreshAll()">
-                                <i class="fas fa-sync-alt"></i> 刷新
-                            </button>
-                        </div>
-                        <div class="card-body">
-                            <div id="status">
-                                <div class="alert alert-success">
-                                    <i class="fas fa-check-circle me-"></i>
-                                    <strong>系统运行正常</strong>
-                                    <div class="mt-2">
-                                        <small>最后刷新: <span id="lastUpdate">刚刚</span></small>
-                                    </div>
-                                </div>
-                            </div>
-                            <div class="mt-3">
-                                <h6>API端点:</h6>
-                                <ul class="list-unstyled small">
-                                    <li><code>GET /api/stocks</code> - 股票列表</li>
-                                    <li><code>POST /api/stock/add</code> - 添加股票</li>
-                                    <li><code /api/portfolio</code> - 持仓信息</li>
-                                </ul>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="card">
-                <div class="card-header bg-warning text-white d-flex justify-content-between align-items-center">
-                    <h5 class="mb-0"><i class="fas fa-list me-2"></i>监控列表</h5>
-                    <button class="btn btn-light btn-sm" onclick="loadStocks()">
-                        <i class="fas fa-sync-alt me-1"></i> 刷新
-                    </button>
-                </div>
-                <div class="card-body p-0">
-                    <div class="table-responsive">
-                        <table class="table table-hover mb-0">
-                            <thead class="table-light">
-                                <tr>
-                                    <th>代码</th>
-                                    <th>名称</th>
-                                    <th>当前价</th>
-                                    <th>高价提醒</th>
-                                    <th>低价提醒</th>
-                                    <th>状态</th>
-                                    <th>操作</th>
-                                </tr>
-                            </thead>
-                            <tbody id="stockList">
-                                <tr>
-                                    <td colspan="7" class="text-center py-4">
-                                        <div class="spinner-border text-primary" role="status">
-                                            <span class="visually-hidden">加载中...</span>
-                                        </div>
-                                        <p class="mt-2 text-muted">正在加载股票数据...</p>
-                                    </td>
-                                </tr>
-                            </tbody>
-                        </table>
-                    </div>
-                </div>
-            </div>
-
-            <div class="card">
-                <div class="card-header bg-purple text-white d-flex justify-content-between align-items-center">
-                    <h5 class="mb-0"><i class="fas fa-chart-pie me-2"></i>持仓和收益</h5>
-                    <button class="btn btn-light btn-sm" onclick="loadPortfolio()">
-                        <i class="fas fa-sync-alt me-1"></i> 刷新
-                    </button>
-                </div>
-                <div class="card-body p-0">
-                    <div class="table-responsive">
-                        <table class="table table-hover mb-0">
-                            <thead class="table-light">
-                                <tr>
-                                    <th>代码</th>
-                                    <th>持仓</th>
-                                    <th>成本</th>
-                                    <th>现价</th>
-                                    <th>市值</th>
-                                    <th>盈亏</th>
-                                    <th>收益率</th>
-                                </tr>
-                            </thead>
-                            <tbody id="portfolioList">
-                                <tr>
-                                    <td colspan="7" class="text-center py-4">
-                                        <div class="spinner-border text-primary" role="status">
-                                            <span class="visually-hidden">加载中...</span>
-                                        </div>
-                                        <p class="mt-2 text-muted">正在加载持仓数据...</p>
-                                    </td>
-                                </tr>
-                            </tbody>
-                        </table>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-        <script>
-            // 页面加载时初始化
-            document.addEventListener('DOMContentLoaded', function() {
-                loadStocks();
-                loadPortfolio();
-                setInterval(refreshAll, 30000); // 30秒自动刷新
-            });
-
-            function addStock() {
-                const symbol = document.getElementById('symbol').value.trim();
-                const name = document.getElementById('name').value.trim();
-                
-                if (!symbol) {
-                    showAlert('请输入股票代码', 'warning');
-                    return;
-                }
-                
-                fetch('/api/stock/add', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({symbol: symbol, name: name || symbol})
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        showAlert('股票添加成功', 'success');
-                        document.getElementById('symbol').value = '';
-                        document.getElementById('name').value = '';
-                        loadStocks();
-                    } else {
-                        showAlert(data.message || '添加失败', 'error');
-                    }
-                })
-                .catch(error => {
-                    showAlert('网络错误: ' + error, 'error');
-                });
-            }
-
-            function addTransaction() {
-                const symbol = document.getElementById('tSymbol').value.trim();
-                const type = document.getElementById('tType').value;
-                const price = document.getElementById('tPrice').value;
-                const quantity = document.getElementById('tQuantity').value;
-                
-                if (!symbol || !price || !quantity) {
-                    showAlert('请填写完整的交易信息', 'warning');
-                    return;
-                }
-                
-                fetch('/api/transaction/add', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({
-                        symbol: symbol,
-                        type: type,
-                        price: parseFloat(price),
-                        quantity: parseInt(quantity)
-                    })
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        showAlert('交易记录添加成功', 'success');
-                        document.getElementById('tSymbol').value = '';
-                        document.getElementById('tPrice').value = '';
-                        document.getElementById('tQuantity').value = '';
-                        loadPortfolio();
-                    }
-                })
-                .catch(error => {
-                    showAlert('网络错误: ' + error, 'error');
-                });
-            }
-
-            function loadStocks() {
-                fetch('/api/stocks')
-                    .then(response => response.json())
-                    .then(data => {
-                        const tbody = document.getElementById('stockList');
-                        let html = '';
-                        
-                        if (data.length === 0) {
-                            html = '<tr><td colspan="7" class="text-center py-4 text-muted">暂无监控的股票</td></tr>';
-                        } else {
-                            data.forEach(stock => {
-                                const alertClass = stock.alert ? 'table-warning' : '';
-                                html += `
-                                    <tr class="${alertClass}">
-                                        <td><strong>${stock.symbol}</strong></td>
-                                        <td>${stock.name || '-'}</td>
-                                        <td>${stock.current_price ? stock.current_price.toFixed(2) : 'N/A'}</td>
-                                        <td>${stock.high_price || '-'}</td>
-                                        <td>${stock.low_price || '-'}</td>
-                                        <td>${stock.alert ? '<span class="badge bg-danger">预警</span>' : '<span class="badge bg-success">正常</span>'}</td>
-                                        <td>
-                                            <button class="btn btn-sm btn-outline-danger" onclick="deleteStock(${stock.id})">
-                                                <i class="fas fa-trash"></i>
-                                            </button>
-                                        </td>
-                                    </tr>
-                                `;
-                            });
-                        }
-                        tbody.innerHTML = html;
-                        updateStatus('数据加载成功');
-                    })
-                    .catch(error => {
-                        console.error('加载股票失败:', error);
-                        updateStatus('数据加载失败', 'error');
-                    });
-            }
-
-            function loadPortfolio() {
-                fetch('/api/portfolio')
-                    .then(response => response.json())
-                    .then(data => {
-                        const tbody = document.getElementById('portfolioList');
-                        let html = '';
-                        
-                        if (data.length === 0) {
-                            html = '<tr><td colspan="7" class="text-center py-4 text-muted">暂无持仓记录</td></tr>';
-                        } else {
-                            data.forEach(item => {
-                                const profitClass = item.profit >= 0 ? 'profit' : 'loss';
-                                html += `
-                                    <tr>
-                                        <td>${item.symbol}</td>
-                                        <td>${item.quantity}</td>
-                                        <td>${item.avg_cost.toFixed(2)}</td>
-                                        <td>${item.current_price ? item.current_price.toFixed(2) : 'N/A'}</td>
-                                        <td>${item.current_value.toFixed(2)}</td>
-                                        <td class="${profitClass}">${item.profit >= 0 ? '+' : ''}${item.profit.toFixed(2)}</td>
-                                        <td class="${profitClass}">${item.profit_rate.toFixed(2)}%</td>
-                                    </tr>
-                                `;
-                            });
-                        }
-                        tbody.innerHTML = html;
-                    })
-                    .catch(error => {
-                        console.error('加载持仓失败:', error);
-                    });
-            }
-
-            function deleteStock(stockId) {
-                if (confirm('确定要删除这只股票吗？')) {
-                    fetch('/api/stock/delete/' + stockId, {method: 'DELETE'})
-                        .then(() => loadStocks());
-                }
-            }
-
-            function refreshAll() {
-                loadStocks();
-                loadPortfolio();
-                updateStatus('数据已刷新');
-            }
-
-            function updateStatus(message, type = 'success') {
-                document.getElementById('lastUpdate').textContent = new Date().toLocaleTimeString();
-                const statusDiv = document.getElementById('status');
-                statusDiv.innerHTML = `
-                    <div class="alert alert-${type}">
-                        <i class="fas fa-${type === 'success' ? 'check' : 'exclamation'}-circle me-2"></i>
-                        <strong>${message}</strong>
-                        <div class="mt-2">
-                            <small>最后刷新: <span id="lastUpdate">${new Date().toLocaleTimeString()}</span></small>
-                        </div>
-                    </div>
-                `;
-            }
-
-            function showAlert(message, type) {
-                const alert = document.createElement('div');
-                alert.className = `alert alert-${type} alert-dismissible fade show position-fixed`;
-                alert.style.cssText = 'top: 20px; right: 20px; z-index: 1050; min-width: 300px;';
-                alert.innerHTML = `
-                    ${message}
-                    <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
-                `;
-                document.body.appendChild(alert);
-                setTimeout(() => alert.remove(), 3000);
-            }
-        </script>
-    </body>
-    </html>
-    '''
-    return html
+    page = dashboard_page
+    encoding = page.choose_encoding(request.accept_encodings)
+    if page.is_fresh(request.if_none_match):
+        return Response(status=304, headers=page.headers(encoding))
+    return Response(page.variants[encoding], content_type=page.content_type,
+                    headers=page.headers(encoding))
 
 # API路由
-@app.route('/api/stocks')
-def get_stocks():
-    c = db_conn.cursor()
-    c.execute('SELECT * FROM stocks ORDER BY created_at DESC')
-    stocks = c.fetchall()
-    
-    result = []
-    for stock in stocks:
-        price = get_stock_price(stock[1])
-        alert = False
-        if price and stock[3] and price >= stock[3]:
-            alert = True
-        if price and stock[4] and price <= stock[4]:
-            alert = True
-            
-        result.append({
-            'id': stock[0],
-            'symbol': stock[1],
-            'name': stock[2],
+def stock_row(stock, entry):
+    quote = price_snapshot.describe(entry)
+    price = quote['current_price']
+    return {
+        'id': stock[0],
+        'symbol': stock[1],
+        'name': stock[2],
+        'current_price': price,
+        'price_time': quote['price_time'],
+        'stale': quote['stale'],
+        'high_price': stock[3],
+        'low_price': stock[4],
+        'alert': alert_engine.stock_alert(stock[0])
+    }
+
+def position_row(symbol, quantity, cost, realized, entry):
+    quote = price_snapshot.describe(entry)
+    current_price = quote['current_price']
+    avg_cost = cost / quantity
+    current_value = current_price * quantity if current_price else 0
+    profit = current_value - cost
+    profit_rate = (profit / cost) * 100 if cost > 0 else 0
+    return {
+        'symbol': symbol,
+        'quantity': quantity,
+        'avg_cost': round(avg_cost, 2),
+        'current_price': current_price,
+        'price_time': quote['price_time'],
+        'stale': quote['stale'],
+        'current_value': round(current_value, 2),
+        'profit': round(profit, 2),
+        'profit_rate': round(profit_rate, 2),
+        'realized_pnl': round(realized, 2)
+    }
+
+STOCK_FIELDS = ('id', 'symbol', 'name', 'current_price', 'price_time', 'stale',
+                'high_price', 'low_price', 'alert')
+# 取自价格快照的字段；fields= 不包含这些字段时响应与行情无关
+STOCK_PRICE_FIELDS = ('current_price', 'price_time', 'stale')
+
+def stock_rows(stocks):
+    quotes_by_symbol = price_snapshot.get_many([stock[1] for stock in stocks])
+    return [stock_row(stock, quotes_by_symbol.get(stock[1])) for stock in stocks]
+
+def build_stocks(account_id):
+    stocks, _ = listing.query_stocks(database.cursor(), account_id)
+    return stock_rows(stocks)
+
+def build_portfolio(account_id, symbols=None):
+    c = database.cursor()
+    # 直接读取物化的持仓表，只访问本账户的分区
+    holdings = positions.open_positions(c, account_id)
+    if symbols is not None:
+        holdings = [h for h in holdings if h[0] in symbols]
+    quotes_by_symbol = price_snapshot.get_many([h[0] for h in holdings])
+    return [position_row(symbol, quantity, cost, realized, quotes_by_symbol.get(symbol))
+            for symbol, quantity, cost, realized in holdings]
+
+def build_pnl(account_id):
+    # 按代码和合计的已实现 / 未实现盈亏；没有行情的持仓不计未实现盈亏
+    rows = positions.pnl_positions(database.cursor(), account_id)
+    quotes_by_symbol = price_snapshot.get_many([row[0] for row in rows])
+    items = []
+    total = {'realized': 0.0, 'unrealized': 0.0, 'market_value': 0.0, 'cost': 0.0}
+    for symbol, quantity, cost, realized in rows:
+        price = price_snapshot.describe(quotes_by_symbol.get(symbol))['current_price']
+        market_value = price * quantity if price else None
+        unrealized = market_value - cost if market_value is not None else None
+        items.append({
+            'symbol': symbol,
+            'quantity': quantity,
+            'cost': round(cost, 2),
             'current_price': price,
-            'high_price': stock[3],
-            'low_price': stock[4],
-            'alert': alert
+            'market_value': round(market_value, 2) if market_value is not None else None,
+            'realized': round(realized, 2),
+            'unrealized': round(unrealized, 2) if unrealized is not None else None,
         })
-    
-    return jsonify(result)
+        total['realized'] += realized
+        total['cost'] += cost
+        if market_value is not None:
+            total['market_value'] += market_value
+            total['unrealized'] += unrealized
+    return {
+        'method': cost_method,
+        'symbols': items,
+        'total': {name: round(value, 2) for name, value in total.items()},
+    }
+
+# 数据版本：写操作递增对应的计数器，价格版本取自快照
+# watchlist 监控列表，ledger 交易记录和持仓，alerts 提醒状态
+if SHARED_STATE:
+    data_versions = shared.SharedVersions(database.path + '.versions')
+else:
+    data_versions = respcache.DataVersions()
+response_cache = respcache.ResponseCache(int(os.environ.get('RESPONSE_CACHE_SIZE', 256)))
+
+def cached_json(name, depends_on, build, uses_prices=True):
+    # 以 (接口, 账户, 查询参数, 响应格式, 相关数据版本, 价格版本, 过期判定时间段) 为键缓存序列化结果
+    # 过期判定时间段保证行情中断时 stale 标记仍会按时更新
+    # 价格版本取该账户关注、持有或设置提醒的代码的最新写入版本，其他代码的报价不会让缓存失效
+    # uses_prices 为假（响应不含行情）时键中不包含价格版本和时间段
+    # 响应格式见 formats：json（默认）、columnar 按列 JSON、msgpack 二进制
+    try:
+        fmt = formats.negotiate(request.args.get('format'), request.accept_mimetypes)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 406
+    if uses_prices:
+        prices_key = (price_snapshot.symbols_version(account_symbols(g.account_id)), int(time.time() * 5 / price_snapshot.stale_after))
+    else:
+        prices_key = None
+    key = (name, g.account_id, request.query_string, fmt, data_versions.key(depends_on), prices_key)
+    entry = response_cache.get(key)
+    if entry is None:
+        try:
+            data = build()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        entry = response_cache.put(key, formats.encode(data, fmt))
+    headers = {
+        'ETag': f'"{entry.etag}"',
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept',
+    }
+    if uses_prices:
+        headers['X-Snapshot-Version'] = str(prices_key[0])
+    if request.if_none_match.contains(entry.etag):
+        return Response(status=304, headers=headers)
+    return Response(entry.body, mimetype=formats.MIMETYPES[fmt], headers=headers)
+
+# 新建账户，返回账户编号；之后的请求用 X-Account-Id 指定该账户
+@app.route('/api/accounts', methods=['POST'])
+def create_account():
+    try:
+        with write_transaction() as c:
+            account_id = accounts.create_account(c, (request.json or {}).get('name'))
+            lsn = journal_append(c, 'account', accounts.get_account(c, account_id))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    journal_sync(lsn)
+    account_directory.add(account_id)
+    return jsonify({'success': True, 'id': account_id})
+
+@app.route('/api/account')
+def get_account():
+    return jsonify(accounts.get_account(database.cursor(), g.account_id))
+
+# 不带 limit/cursor 时返回完整列表（看板使用）；带上后返回 {items, next_cursor} 分页结果
+# 过滤参数：symbol、from、to（created_at 范围），fields= 指定返回字段
+@app.route('/api/stocks')
+def get_stocks():
+    def build():
+        args = request.args
+        paged = 'limit' in args or 'cursor' in args
+        fields = listing.parse_fields(args.get('fields'), STOCK_FIELDS)
+        limit = listing.parse_limit(args.get('limit')) if paged else None
+        stocks, next_cursor = listing.query_stocks(
+            database.cursor(), g.account_id, symbol=symbol_param(args.get('symbol')), date_from=args.get('from'),
+            date_to=args.get('to'), cursor=args.get('cursor'), limit=limit)
+        items = listing.project(stock_rows(stocks), fields)
+        return {'items': items, 'next_cursor': next_cursor} if paged else items
+    fields = request.args.get('fields')
+    uses_prices = not fields or any(field.strip() in STOCK_PRICE_FIELDS for field in fields.split(','))
+    return cached_json('stocks', ('watchlist', 'alerts'), build, uses_prices)
+
+# 交易记录分页查询：symbol、type、from、to 过滤，按成交时间倒序
+@app.route('/api/transactions')
+def list_transactions():
+    args = request.args
+    try:
+        fields = listing.parse_fields(args.get('fields'), listing.TRANSACTION_FIELDS)
+        items, next_cursor = listing.query_transactions(
+            database.cursor(), g.account_id, symbol=symbol_param(args.get('symbol')), trade_type=args.get('type'),
+            date_from=args.get('from'), date_to=args.get('to'), cursor=args.get('cursor'),
+            limit=listing.parse_limit(args.get('limit')))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'items': listing.project(items, fields), 'next_cursor': next_cursor})
+
+# 证券主数据：监控列表、交易记录和提醒规则的代码按主数据校验，规范化为带交易所的标准写法（600000.SH）
+# 同一证券的不同写法（sh600000、SH:600000 等）存为同一个代码，交易和提醒与监控列表中的代码一致
+# 已有数据由迁移 9 改为标准写法，启动时和主数据文件修改后再按主数据规范化一次（normalize_stored_symbols）
+# 文件修改后由后台线程重新加载，SYMBOLS_RELOAD_INTERVAL 为检查周期（秒）
+symbol_master = symbols.create_master_from_env(load=not FAST_START)
+symbols_stop = threading.Event()
+
+def normalize_stored_symbols():
+    # 库中已有的代码按当前主数据改为标准写法，同一证券的不同写法合并（见 recovery.rename_symbols）
+    # 启动时以及主数据文件修改后执行；主数据中找不到的代码保持不变
+    renames = {}
+    for symbol in recovery.stored_symbols(database.cursor()):
+        try:
+            normalized = symbol_master.resolve(symbol)[0]
+        except ValueError:
+            continue
+        if normalized != symbol:
+            renames[symbol] = normalized
+    if renames:
+        with write_transaction() as c:
+            c.execute('BEGIN IMMEDIATE')
+            recovery.rename_symbols(c, renames, cost_method)
+            lsn = journal_append(c, 'symbols', {'renames': renames})
+        journal_sync(lsn)
+        app.logger.info('%s 个代码已改为标准写法', len(renames))
+        alert_engine.load(database.cursor())
+        data_versions.bump('watchlist', 'ledger', 'alerts')
+        quote_poller.request_refresh(sorted(set(renames.values())))
+    database.release()
+    return renames
+
+def symbol_param(value):
+    # 路径和查询参数中的代码按主数据规范化为库中保存的写法；代码无效时抛出 ValueError，不传时返回 None
+    return symbol_master.resolve(value)[0] if value else None
+
+def on_symbols_reloaded():
+    # 多进程模式下改名可能由其他进程完成，提醒规则总是重新加载
+    if not normalize_stored_symbols():
+        alert_engine.load(database.cursor())
+        database.release()
+
+# 代码 / 名称 / 拼音首字母前缀搜索，按匹配程度排序，用于添加股票时的自动补全
+@app.route('/api/symbols/search')
+def search_symbols():
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', symbols.DEFAULT_LIMIT, type=int), symbols.MAX_LIMIT))
+    return jsonify({'query': query,
+                    'results': [dict(entry._asdict(), symbol=symbols.qualify(entry.code, entry.exchange))
+                                for _, entry in symbol_master.search(query, limit)]})
 
 @app.route('/api/stock/add', methods=['POST'])
 def add_stock():
-    data = request.json
-    c = db_conn.cursor()
-    
-    # 检查是否已存在
-    c.execute('SELECT id FROM stocks WHERE symbol = ?', (data['symbol'],))
-    if c.fetchone():
-        return jsonify({'success': False, 'message': '股票已存在'})
-    
-    c.execute('INSERT INTO stocks (symbol, name) VALUES (?, ?)', 
-              (data['symbol'], data.get('name', data['symbol'])))
-    db_conn.commit()
-    return jsonify({'success': True, 'message': '添加成功'})
+    data = request.json or {}
+    account_id = g.account_id
+    raw = str(data.get('symbol') or '')
+    # 名称为空或与输入的代码相同时使用主数据中的名称
+    name = str(data.get('name') or '').strip()
+    try:
+        symbol, name = symbol_master.resolve(raw, None if name == raw.strip() else name or None)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    created_at = importer.timestamp()
+    with write_transaction() as c:
+        # (account_id, symbol) 上有唯一索引，本账户已有该代码时不插入
+        c.execute('INSERT INTO stocks (account_id, symbol, name, created_at) VALUES (?, ?, ?, ?) '
+                  'ON CONFLICT(account_id, symbol) DO NOTHING',
+                  (account_id, symbol, name, created_at))
+        if not c.rowcount:
+            return jsonify({'success': False, 'message': '股票已存在'})
+        stock_id = c.lastrowid
+        lsn = journal_append(c, 'stocks', {'account': account_id,
+                                           'rows': [[stock_id, symbol, name, created_at]]})
+    journal_sync(lsn)
+    data_versions.bump('watchlist')
+    quote_poller.request_refresh([symbol])
+    if event_broker.subscriber_count:
+        c.execute('SELECT * FROM stocks WHERE id = ?', (stock_id,))
+        stock = c.fetchone()
+        event_broker.publish('stock_added', stock_row(stock, price_snapshot.get(stock[1])), account_id)
+    return jsonify({'success': True, 'message': '添加成功', 'symbol': symbol, 'name': name})
 
 @app.route('/api/stock/delete/<int:stock_id>', methods=['DELETE'])
 def delete_stock(stock_id):
-    c = db_conn.cursor()
-    c.execute('DELETE FROM stocks WHERE id = ?', (stock_id,))
-    db_conn.commit()
+    account_id = g.account_id
+    with write_transaction() as c:
+        c.execute('DELETE FROM stocks WHERE id = ? AND account_id = ?', (stock_id, account_id))
+        deleted = c.rowcount
+        if deleted:
+            c.execute('DELETE FROM alert_rules WHERE stock_id = ?', (stock_id,))
+            lsn = journal_append(c, 'stock_delete', {'account': account_id, 'id': stock_id})
+    if deleted:
+        journal_sync(lsn)
+        alert_engine.remove_stock(stock_id)
+        data_versions.bump('watchlist', 'alerts')
+        event_broker.publish('stock_removed', {'id': stock_id}, account_id)
     return jsonify({'success': True})
 
 @app.route('/api/transaction/add', methods=['POST'])
 def add_transaction():
-    data = request.json
-    c = db_conn.cursor()
-    c.execute('INSERT INTO transactions (symbol, type, price, quantity) VALUES (?, ?, ?, ?)',
-              (data['symbol'], data['type'], data['price'], data['quantity']))
-    db_conn.commit()
-    return jsonify({'success': True})
+    try:
+        symbol, trade_type, price, quantity, _ = importer.parse_transaction(request.json or {}, symbol_master.resolve)
+        account_id = g.account_id
+        with write_transaction() as c:
+            # 先拿写锁再读取批次，多个进程同时写同一代码时不会基于旧持仓计算
+            c.execute('BEGIN IMMEDIATE')
+            # 超卖时抛出 OversellError，事务回滚，交易记录不写入
+            realized = lots.apply_trade(c, symbol, trade_type, price, quantity, cost_method, account_id)
+            # 持仓表与交易记录在同一个事务中提交
+            date = importer.timestamp()
+            c.execute('INSERT INTO transactions (account_id, symbol, type, price, quantity, date) '
+                      'VALUES (?, ?, ?, ?, ?, ?)', (account_id, symbol, trade_type, price, quantity, date))
+            lsn = journal_append(c, 'trades', {'account': account_id,
+                                               'rows': [[c.lastrowid, symbol, trade_type, price, quantity, date]]})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    journal_sync(lsn)
+    data_versions.bump('ledger')
+    if price_snapshot.get(symbol) is None:
+        quote_poller.request_refresh([symbol])
+    if event_broker.subscriber_count:
+        publish_positions(account_id, [symbol])
+    return jsonify({'success': True, 'realized_pnl': round(realized, 2)})
+
+# 批量导入：请求体为 CSV（带表头）或 NDJSON，格式取自 Content-Type 或 ?format=csv|ndjson
+# 交易记录字段：symbol, type, price, quantity[, date]；监控列表字段：symbol[, name]
+# 每个写入的分块记一条操作日志（journal_op 为对应的日志记录类型），分块写完即追加，内存占用与上传大小无关
+def run_import(import_func, version_name, journal_op):
+    fmt = importer.detect_format(request.content_type, request.args.get('format'))
+    if fmt is None:
+        return jsonify({'success': False, 'message': '不支持的导入格式，请使用 CSV 或 NDJSON'}), 415
+    chunk_size = max(1, min(request.args.get('chunk', 1000, type=int), 10000))
+    account_id = g.account_id
+    report = importer.ImportReport()
+    lsn = None
+    try:
+        with write_transaction() as c:
+            c.execute('BEGIN IMMEDIATE')
+
+            def record_chunk(rows):
+                # 导入中途失败回滚时，write_transaction 追加的作废标记使重放跳过这些记录
+                nonlocal lsn
+                lsn = journal_append(c, journal_op, {'account': account_id, 'rows': rows})
+
+            import_func(c, importer.iter_records(request.stream, fmt), chunk_size, report=report,
+                        account_id=account_id, on_chunk=record_chunk if op_journal is not None else None)
+    except ClientDisconnected:
+        # 上传没有传完（客户端断开或内容长度不符），整个导入回滚
+        return jsonify({'success': False, 'message': f'上传中断，已读取 {report.total} 行，导入未执行'}), 400
+    journal_sync(lsn)
+    data_versions.bump(version_name)
+    if report.symbols:
+        quote_poller.request_refresh(report.symbols)
+        event_broker.publish('resync', {}, g.account_id)
+    return jsonify(report.to_dict())
+
+@app.route('/api/transactions/import', methods=['POST'])
+def import_transactions():
+    return run_import(functools.partial(importer.import_transactions, method=cost_method,
+                                        normalize=symbol_master.resolve), 'ledger', 'trades')
+
+@app.route('/api/stocks/import', methods=['POST'])
+def import_stocks():
+    return run_import(functools.partial(importer.import_stocks, normalize=symbol_master.resolve),
+                      'watchlist', 'stocks')
 
 @app.route('/api/portfolio')
 def get_portfolio():
-    c = db_conn.cursor()
-    c.execute('SELECT * FROM transactions')
-    transactions = c.fetchall()
-    
-    holdings = {}
-    for t in transactions:
-        symbol = t[1]
-        if symbol not in holdings:
-            holdings[symbol] = {'quantity': 0, 'cost': 0}
-        
-        if t[2] == 'buy':
-            holdings[symbol]['quantity'] += t[4]
-            holdings[symbol]['cost'] += t[3] * t[4]
-        else:
-            holdings[symbol]['quantity'] -= t[4]
-            holdings[symbol]['cost'] -= t[3] * t[4]
-    
-    result = []
-    for symbol, data in holdings.items():
-        if data['quantity'] > 0:
-            current_price = get_stock_price(symbol)
-            avg_cost = data['cost'] / data['quantity']
-            current_value = current_price * data['quantity'] if current_price else 0
-            profit = current_value - data['cost']
-            profit_rate = (profit / data['cost']) * 100 if data['cost'] > 0 else 0
-            
-            result.append({
-                'symbol': symbol,
-                'quantity': data['quantity'],
-                'avg_cost': round(avg_cost, 2),
-                'current_price': current_price,
-                'current_value': round(current_value, 2),
-                'profit': round(profit, 2),
-                'profit_rate': round(profit_rate, 2)
-            })
-    
-    return jsonify(result)
+    return cached_json('portfolio', ('ledger',), lambda: build_portfolio(g.account_id))
+
+# 盈亏汇总：各代码的已实现 / 未实现盈亏及合计
+@app.route('/api/pnl')
+def get_pnl():
+    return cached_json('pnl', ('ledger',), lambda: build_pnl(g.account_id))
+
+# 某个代码的未平仓批次，按建仓顺序排列
+@app.route('/api/lots/<symbol>')
+def get_lots(symbol):
+    try:
+        symbol = symbol_param(symbol)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'symbol': symbol, 'method': cost_method,
+                    'lots': lots.open_lots(database.cursor(), g.account_id, symbol)})
+
+# 实时推送：替代前端 30 秒轮询
+event_broker = stream.EventBroker()
+
+def publish_positions(account_id, symbols):
+    # 交易后推送该账户受影响代码的最新持仓，已平仓的代码推送 quantity 为 0
+    rows = {row['symbol']: row for row in build_portfolio(account_id, set(symbols))}
+    for symbol in symbols:
+        event_broker.publish('position', rows.get(symbol, {'symbol': symbol, 'quantity': 0}), account_id)
+
+def on_price_update(changed, version):
+    if not event_broker.subscriber_count or not changed:
+        return
+    now = time.time()
+    described = {}
+    # 报价和持仓只推送给有连接的账户，且只包含该账户关注或持有的代码；代价与在线账户数成正比，与账户总数无关
+    for account_id in event_broker.topics():
+        symbols = [symbol for symbol in account_symbols(account_id) if symbol in changed]
+        if symbols:
+            for symbol in symbols:
+                if symbol not in described:
+                    described[symbol] = price_snapshot.describe(changed[symbol], now)
+            event_broker.publish('price', {
+                'version': version,
+                'quotes': {symbol: described[symbol] for symbol in symbols},
+            }, account_id)
+        for row in build_portfolio(account_id, set(changed)):
+            event_broker.publish('position', row, account_id)
+
+price_snapshot.subscribe(on_price_update)
+
+# 价格提醒：规则常驻内存，每次价格更新只检查被穿越的规则，触发和解除记录到 alert_events
+alert_engine = alerts.AlertEngine()
+if not FAST_START:
+    alert_engine.load(database.cursor())
+
+# 提醒通知：配置了 webhook 或邮件时，提醒事件由后台线程异步发送（见 notify.py）；在 load_deferred 中创建
+# 准备完成、行情轮询启动之前不会产生提醒事件
+notifier = None
+
+def handle_alert_events(events):
+    if not events:
+        return
+    with database.transaction() as c:
+        alerts.record_events(c, events)
+    data_versions.bump('alerts')
+    if notifier is not None:
+        notifier.submit_events(events)
+    for rule, event, price in events:
+        event_broker.publish('alert', {
+            'id': rule.stock_id,
+            'rule_id': rule.id,
+            'symbol': rule.symbol,
+            'event': event,
+            'price': price,
+            'alert': alert_engine.stock_alert(rule.stock_id) if rule.stock_id is not None else rule.active,
+        }, rule.account_id)
+
+def on_price_alerts(changed, version):
+    # 多进程模式下只有 leader 评估提醒，避免每个 worker 各记录一遍事件
+    if not is_leader():
+        return
+    handle_alert_events(alert_engine.on_prices({symbol: entry[0] for symbol, entry in changed.items()}))
+
+price_snapshot.subscribe(on_price_alerts)
+
+def parse_number(data, key, minimum=0.0, allow_zero=True):
+    value = data.get(key)
+    if value is None or value == '':
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} 必须是数字')
+    # nan 与任何数比较都为假，inf 的规则永远不会触发，都不接受
+    if not math.isfinite(value):
+        raise ValueError(f'{key} 必须是有限的数字')
+    if value < minimum or (not allow_zero and value == minimum):
+        raise ValueError(f'{key} 超出范围')
+    return value
+
+def parse_rule(data, rule=None):
+    # 校验并合并提醒规则字段；rule 不为空时表示修改已有规则，未提供的字段保持原值
+    symbol = str(data['symbol']).strip() if 'symbol' in data else (rule.symbol if rule else '')
+    if not symbol:
+        raise ValueError('请输入股票代码')
+    if 'symbol' in data:
+        symbol = symbol_master.resolve(symbol)[0]
+    direction = data.get('direction', rule.direction if rule else None)
+    if direction not in ('above', 'below'):
+        raise ValueError('direction 必须是 above 或 below')
+    threshold = parse_number(data, 'threshold', allow_zero=False)
+    if threshold is None:
+        if rule is None:
+            raise ValueError('请输入提醒价格')
+        threshold = rule.threshold
+    hysteresis = parse_number(data, 'hysteresis')
+    cooldown = parse_number(data, 'cooldown')
+    enabled = bool(data.get('enabled', rule.enabled if rule else True))
+    return alerts.AlertRule(
+        rule.id if rule else None, symbol, direction, threshold,
+        hysteresis if hysteresis is not None else (rule.hysteresis if rule else 0.0),
+        cooldown if cooldown is not None else (rule.cooldown if rule else 0.0),
+        enabled, rule.stock_id if rule else None, rule.account_id if rule else g.account_id)
+
+def account_rule(rule_id):
+    # 只能访问本账户的提醒规则
+    rule = alert_engine.get(rule_id)
+    return rule if rule is not None and rule.account_id == g.account_id else None
+
+@app.route('/api/alerts')
+def list_alert_rules():
+    try:
+        symbol = symbol_param(request.args.get('symbol'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify([rule.to_dict() for rule in alert_engine.rules(symbol, g.account_id)])
+
+@app.route('/api/alerts', methods=['POST'])
+def add_alert_rule():
+    try:
+        rule = parse_rule(request.json or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    with write_transaction() as c:
+        rule = alerts.insert_rule(c, rule.symbol, rule.direction, rule.threshold,
+                                  rule.hysteresis, rule.cooldown, rule.enabled, account_id=rule.account_id)
+        lsn = journal_append(c, 'rule', {'rule': recovery.rule_record(c, rule.id)})
+    journal_sync(lsn)
+    handle_alert_events(alert_engine.upsert(rule, price_snapshot.price(rule.symbol)))
+    data_versions.bump('alerts')
+    quote_poller.request_refresh([rule.symbol])
+    return jsonify({'success': True, 'rule': rule.to_dict()})
+
+@app.route('/api/alerts/<int:rule_id>', methods=['PUT'])
+def update_alert_rule(rule_id):
+    existing = account_rule(rule_id)
+    if existing is None:
+        return jsonify({'success': False, 'message': '提醒规则不存在'}), 404
+    try:
+        rule = parse_rule(request.json or {}, existing)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    with write_transaction() as c:
+        alerts.update_rule(c, rule)
+        lsn = journal_append(c, 'rule', {'rule': recovery.rule_record(c, rule.id)})
+    journal_sync(lsn)
+    handle_alert_events(alert_engine.upsert(rule, price_snapshot.price(rule.symbol)))
+    data_versions.bump('alerts')
+    return jsonify({'success': True, 'rule': rule.to_dict()})
+
+@app.route('/api/alerts/<int:rule_id>', methods=['DELETE'])
+def delete_alert_rule(rule_id):
+    with write_transaction() as c:
+        if not alerts.delete_rules(c, [rule_id], g.account_id):
+            return jsonify({'success': False, 'message': '提醒规则不存在'}), 404
+        lsn = journal_append(c, 'rule_delete', {'ids': [rule_id]})
+    journal_sync(lsn)
+    alert_engine.remove(rule_id)
+    data_versions.bump('alerts')
+    return jsonify({'success': True})
+
+@app.route('/api/alerts/events')
+def list_alert_events():
+    rule_id = request.args.get('rule_id', type=int)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    try:
+        symbol = symbol_param(request.args.get('symbol'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(alerts.list_events(database.cursor(), g.account_id, symbol, rule_id, limit))
+
+# 设置监控列表的高/低价提醒，对应 above/below 两条提醒规则
+@app.route('/api/stock/<int:stock_id>/thresholds', methods=['PUT'])
+def set_stock_thresholds(stock_id):
+    data = request.json or {}
+    try:
+        high_price = parse_number(data, 'high_price', allow_zero=False)
+        low_price = parse_number(data, 'low_price', allow_zero=False)
+        hysteresis = parse_number(data, 'hysteresis')
+        cooldown = parse_number(data, 'cooldown')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    changed = []
+    removed = []
+    account_id = g.account_id
+    with write_transaction() as c:
+        c.execute('SELECT symbol FROM stocks WHERE id = ? AND account_id = ?', (stock_id, account_id))
+        row = c.fetchone()
+        if row is None:
+            return jsonify({'success': False, 'message': '股票不存在'}), 404
+        symbol = row[0]
+        c.execute('UPDATE stocks SET high_price = ?, low_price = ? WHERE id = ?',
+                  (high_price, low_price, stock_id))
+        existing = {rule.direction: rule for rule in alert_engine.stock_rules(stock_id)}
+        for direction, threshold in (('above', high_price), ('below', low_price)):
+            rule = existing.get(direction)
+            if threshold is None:
+                if rule is not None:
+                    removed.append(rule.id)
+                continue
+            if rule is None:
+                changed.append(alerts.insert_rule(c, symbol, direction, threshold, hysteresis or 0.0,
+                                                  cooldown or 0.0, stock_id=stock_id, account_id=account_id))
+            else:
+                rule = alerts.AlertRule(
+                    rule.id, symbol, direction, threshold,
+                    rule.hysteresis if hysteresis is None else hysteresis,
+                    rule.cooldown if cooldown is None else cooldown,
+                    rule.enabled, stock_id, account_id)
+                alerts.update_rule(c, rule)
+                changed.append(rule)
+        alerts.delete_rules(c, removed, account_id)
+        lsn = journal_append(c, 'thresholds', {
+            'account': account_id, 'stock_id': stock_id, 'high_price': high_price, 'low_price': low_price,
+            'rules': [recovery.rule_record(c, rule.id) for rule in changed], 'removed': removed,
+        })
+    journal_sync(lsn)
+
+    for rule_id in removed:
+        alert_engine.remove(rule_id)
+    data_versions.bump('watchlist', 'alerts')
+    events = []
+    for rule in changed:
+        events.extend(alert_engine.upsert(rule, price_snapshot.price(symbol)))
+    handle_alert_events(events)
+    if event_broker.subscriber_count:
+        c.execute('SELECT * FROM stocks WHERE id = ?', (stock_id,))
+        stock = c.fetchone()
+        event_broker.publish('stock_updated', stock_row(stock, price_snapshot.get(symbol)), account_id)
+    return jsonify({'success': True})
+
+@app.route('/api/stream')
+def stream_events():
+    account_id = g.account_id
+    q = event_broker.subscribe(account_id)
+    initial = {
+        'version': price_snapshot.version,
+        'stocks': build_stocks(account_id),
+        'portfolio': build_portfolio(account_id),
+    }
+    response = Response(event_broker.stream(q, initial), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 持仓表维护命令: flask --app app rebuild-positions / verify-positions
+@app.cli.command('rebuild-positions')
+def rebuild_positions_command():
+    app_ready.wait()
+    with database.transaction() as c:
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            count, rejected = lots.rebuild(c, cost_method)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    print(f'持仓表已重建，共 {count} 行，成本法 {cost_method}')
+    if rejected:
+        print(f'有 {rejected} 笔超过持仓的卖出未计入')
+
+@app.cli.command('verify-positions')
+def verify_positions_command():
+    app_ready.wait()
+    try:
+        mismatches = lots.verify(database.cursor(), cost_method)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for (account_id, symbol), expected, actual in mismatches:
+        print(f'账户 {account_id} {symbol}: 期望 {expected}，实际 {actual}')
+    if mismatches:
+        raise SystemExit(1)
+    print('持仓表与交易记录一致')
+
+# 快照：leader 定期把当前状态写成快照，下次启动只需重放快照之后的日志；退出时再写一次
+SNAPSHOT_INTERVAL = float(os.environ.get('JOURNAL_SNAPSHOT_INTERVAL', 300))
+KEEP_SNAPSHOTS = int(os.environ.get('JOURNAL_KEEP_SNAPSHOTS', 3))
+snapshot_stop = threading.Event()
+
+def write_journal_snapshot():
+    # 各表在一个读事务内读取，与库中记录的日志位置一致
+    # 日志没有新记录且最近的快照是当前版本时不重复写，返回快照路径或 None
+    c = database.cursor()
+    try:
+        c.execute('BEGIN')
+        try:
+            lsn, tables = recovery.capture(c)
+        finally:
+            c.connection.rollback()
+    finally:
+        database.release()
+    snapshots = journal.snapshot_files(journal_dir)
+    if (snapshots and snapshots[-1][0] >= lsn
+            and journal.snapshot_header(snapshots[-1][1]).get('version') == journal.SNAPSHOT_VERSION):
+        return None
+    path = journal.write_snapshot(journal_dir, lsn, tables)
+    journal.prune_snapshots(journal_dir, KEEP_SNAPSHOTS)
+    # 早于保留的最旧快照的日志段不再需要
+    journal.prune_segments(journal_dir, journal.snapshot_files(journal_dir)[0][0])
+    return path
+
+def run_snapshots():
+    # 启动后先补一次快照（第一次开启日志时库中已有的数据也要有快照），之后按间隔检查
+    interval = 0
+    while not snapshot_stop.wait(interval):
+        interval = SNAPSHOT_INTERVAL
+        if not is_leader():
+            continue
+        try:
+            write_journal_snapshot()
+        except Exception:
+            app.logger.exception('写快照失败')
+
+# 日志维护命令: flask --app app journal-snapshot / journal-reconstruct --at 时间 --output 文件
+@app.cli.command('journal-snapshot')
+def journal_snapshot_command():
+    app_ready.wait()
+    if op_journal is None:
+        raise click.ClickException('操作日志未开启')
+    path = write_journal_snapshot()
+    print(f'快照已写入 {path}' if path else '自上次快照后没有新的日志记录')
+
+@app.cli.command('journal-reconstruct')
+@click.option('--at', 'at', required=True, help='时间点：Unix 时间戳或 ISO 格式')
+@click.option('--output', required=True, help='重建结果写入的新数据库文件')
+@click.option('--full', is_flag=True, help='不使用快照，从日志开头重放')
+def journal_reconstruct_command(at, output, full):
+    app_ready.wait()
+    if op_journal is None:
+        raise click.ClickException('操作日志未开启')
+    if os.path.exists(output):
+        raise click.ClickException(f'{output} 已存在')
+    try:
+        until_ts = parse_time(at)
+    except ValueError:
+        raise click.ClickException('时间格式错误')
+    target = db.open_from_env(output)
+    try:
+        import migrations
+        target.migrate(migrations.MIGRATIONS)
+        with target.transaction() as c:
+            c.execute('BEGIN IMMEDIATE')
+            lsn, replayed = recovery.reconstruct(c, journal_dir, until_ts, cost_method, full)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        target.close()
+    print(f'已重建到 {datetime.fromtimestamp(until_ts).isoformat()}（日志位置 {lsn}，重放 {replayed} 条记录）: {output}')
+
+# 价格历史：每次报价变化记入内存环形缓冲区，后台线程定期刷写磁盘
+history_store = history.create_store_from_env()
+price_snapshot.subscribe(lambda changed, version: history_store.record(changed))
+history_stop = threading.Event()
+
+def start_history_flusher():
+    threading.Thread(target=history_store.run_flusher, name='history-flusher', daemon=True,
+                     args=(float(os.environ.get('HISTORY_FLUSH_INTERVAL', 60)), history_stop)).start()
+
+def flush_history():
+    # 多进程模式下只有 leader 写历史文件，其他 worker 只在内存中保留最近报价供查询
+    if is_leader():
+        history_store.flush()
+
+atexit.register(flush_history)
+
+def parse_time(value):
+    # 支持 Unix 时间戳或 ISO 格式的时间
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/history/<symbol>')
+def get_history(symbol):
+    try:
+        symbol = symbol_param(symbol)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    interval = request.args.get('interval', 'raw')
+    if interval != 'raw' and interval not in history.INTERVALS:
+        return jsonify({'success': False, 'message': 'interval 必须是 raw、1m、5m、1h 或 1d'}), 400
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError:
+        return jsonify({'success': False, 'message': '时间格式错误'}), 400
+    ts, prices = history_store.query(symbol, start, end)
+    if interval == 'raw':
+        # 原始报价只返回最近的 limit 条
+        limit = max(1, min(request.args.get('limit', 10000, type=int), 100000))
+        data = {'time': ts[-limit:].tolist(), 'price': prices[-limit:].tolist()}
+    else:
+        data = history.ohlc(ts, prices, history.INTERVALS[interval])
+    return jsonify({'symbol': symbol, 'interval': interval, **data})
+
+# 运行指标：表行数按 METRICS_ROW_COUNT_TTL 秒缓存，大表上 COUNT(*) 不会拖慢每次抓取
+METRICS_TABLES = ('accounts', 'stocks', 'transactions', 'positions', 'lots', 'alert_rules', 'alert_events')
+ROW_COUNT_TTL = float(os.environ.get('METRICS_ROW_COUNT_TTL', 30))
+row_counts = {'time': None, 'values': []}
+
+def table_row_counts():
+    now = time.monotonic()
+    if row_counts['time'] is None or now - row_counts['time'] >= ROW_COUNT_TTL:
+        c = database.cursor()
+        row_counts['values'] = [((table,), c.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0])
+                                for table in METRICS_TABLES]
+        row_counts['time'] = now
+    return row_counts['values']
+
+metrics.REGISTRY.gauge('stock_monitor_table_rows', '数据表行数', table_row_counts, ('table',))
+metrics.REGISTRY.gauge('stock_monitor_quote_cache_requests_total', '报价缓存命中/未命中次数',
+                       lambda: [(('hit',), quote_cache.hits), (('miss',), quote_cache.misses)],
+                       ('result',), kind='counter')
+metrics.REGISTRY.gauge('stock_monitor_response_cache_requests_total', '接口响应缓存命中/未命中次数',
+                       lambda: [(('hit',), response_cache.hits), (('miss',), response_cache.misses)],
+                       ('result',), kind='counter')
+metrics.REGISTRY.gauge('stock_monitor_price_snapshot_version', '价格快照版本号', lambda: price_snapshot.version)
+metrics.REGISTRY.gauge('stock_monitor_stream_subscribers', '实时推送连接数',
+                       lambda: event_broker.subscriber_count)
+metrics.REGISTRY.gauge('stock_monitor_symbols', '证券主数据条数', lambda: len(symbol_master.index))
+metrics.REGISTRY.gauge('stock_monitor_alert_rules', '已加载的提醒规则数', lambda: alert_engine.rule_count)
+metrics.REGISTRY.gauge('stock_monitor_history_symbols', '内存中有价格历史的代码数',
+                       lambda: history_store.symbol_count)
+if op_journal is not None:
+    metrics.REGISTRY.gauge('stock_monitor_journal_records_total', '本进程追加的操作日志记录数',
+                           lambda: op_journal.records, kind='counter')
+    metrics.REGISTRY.gauge('stock_monitor_journal_fsyncs_total', '操作日志 fsync 次数',
+                           lambda: op_journal.fsyncs, kind='counter')
+    metrics.REGISTRY.gauge('stock_monitor_journal_recovery_seconds', '启动时恢复（载入快照并重放日志）的耗时',
+                           lambda: recovery_state['seconds'])
+    metrics.REGISTRY.gauge('stock_monitor_journal_replayed_records', '启动时重放的日志记录数',
+                           lambda: recovery_state['replayed'])
+def load_deferred():
+    # 请求处理才用到的模块和对象：启动优化模式下在后台准备阶段载入，否则在导入时载入
+    # 看板页面、通知发送器（notify 依赖 smtplib 等）以及响应格式编码（formats 可能导入 orjson、msgpack）
+    global dashboard_page, notifier, formats
+    import dashboard
+    import formats
+    import notify
+    dashboard_page = dashboard.load_page()
+    notifier = notify.create_dispatcher_from_env()
+    if notifier is None:
+        return
+    atexit.register(notifier.close)
+    metrics.REGISTRY.gauge('stock_monitor_notifications_total', '各目标的通知发送结果（sent / failed / dropped）',
+                           lambda: [((name, result), stats[result]) for name, stats in notifier.stats().items()
+                                    for result in ('sent', 'failed', 'dropped')],
+                           ('destination', 'result'), kind='counter')
+    metrics.REGISTRY.gauge('stock_monitor_notification_retries_total', '各目标的通知重试次数',
+                           lambda: [((name,), stats['retries']) for name, stats in notifier.stats().items()],
+                           ('destination',), kind='counter')
+    metrics.REGISTRY.gauge('stock_monitor_notification_queue_depth', '各目标队列中待发送的通知数',
+                           lambda: [((name,), stats['queued']) for name, stats in notifier.stats().items()],
+                           ('destination',))
+    metrics.REGISTRY.gauge('stock_monitor_notifications_suppressed_total', '去重或限流未发送的通知数',
+                           lambda: [(('dedup',), notifier.deduplicated), (('rate_limit',), notifier.rate_limited)],
+                           ('reason',), kind='counter')
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# 采样分析：PROFILER_ENABLED=1 时开放，GET /debug/profile?seconds=10 返回折叠格式的热点调用栈
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '0') == '1'
+
+@app.route('/debug/profile')
+def debug_profile():
+    if not PROFILER_ENABLED:
+        return jsonify({'success': False, 'message': '采样分析未开启'}), 404
+    seconds = request.args.get('seconds', 10, type=float)
+    interval = max(request.args.get('interval', 0.005, type=float), 0.001)
+    import profiler
+    sampler = profiler.profile(seconds, interval)
+    if sampler is None:
+        return jsonify({'success': False, 'message': '已有采样正在进行'}), 409
+    return Response(sampler.collapsed(), mimetype='text/plain',
+                    headers={'X-Profile-Samples': str(sampler.samples)})
+
+# 多进程同步：leader 把每次刷新的报价写入 quotes 表；其他 worker 周期性拉取报价、提醒状态和数据变化
+SYNC_INTERVAL = float(os.environ.get('SHARED_SYNC_INTERVAL', 0.2))
+sync_stop = threading.Event()
+sync_state = {'seq': 0, 'versions': {}, 'event_id': None}
+
+def replicate_quotes(prices, ts, version):
+    if not leader.held:
+        return
+    with database.transaction() as c:
+        shared.write_quotes(c, prices, ts)
+    data_versions.bump('prices')
+
+def become_leader():
+    # 上一任 leader 已刷写过的历史不再重复写入；重新加载提醒规则后开始轮询行情
+    history_store.discard_unflushed()
+    start_history_flusher()
+    alert_engine.load(database.cursor())
+    quote_poller.start()
+
+def publish_remote_alerts(c):
+    # 把 leader 记录的新提醒事件推送给本 worker 的实时连接
+    for event_id, rule_id, account_id, symbol, event, price in alerts.list_events_since(c, sync_state['event_id']):
+        rule = alert_engine.get(rule_id)
+        stock_id = rule.stock_id if rule is not None else None
+        event_broker.publish('alert', {
+            'id': stock_id,
+            'rule_id': rule_id,
+            'symbol': symbol,
+            'event': event,
+            'price': price,
+            'alert': alert_engine.stock_alert(stock_id) if stock_id is not None else event == 'triggered',
+        }, account_id)
+        sync_state['event_id'] = event_id
+
+def sync_shared_state():
+    if not leader.held and leader.try_acquire():
+        become_leader()
+    remote = data_versions.remote_changes(sync_state['versions'])
+    if not remote:
+        return
+    c = database.cursor()
+    try:
+        if 'prices' in remote and not leader.held:
+            batches, sync_state['seq'] = shared.read_quotes(c, sync_state['seq'])
+            for ts, prices in batches:
+                price_snapshot.update(prices, ts)
+        if 'alerts' in remote:
+            alert_engine.load(c)
+            if not leader.held:
+                publish_remote_alerts(c)
+        if remote & {'watchlist', 'ledger'}:
+            event_broker.publish('resync', {})
+        if leader.held and remote & {'watchlist', 'ledger', 'alerts'}:
+            # 其他 worker 新增的代码尽快取到报价，不必等下一轮
+            missing = set(watched_symbols()) - set(price_snapshot.get_many(watched_symbols()))
+            if missing:
+                quote_poller.request_refresh(missing)
+    finally:
+        database.release()
+
+def shutdown():
+    # 服务进程退出前调用：结束推送连接、停止后台线程、刷写历史并交出 leader
+    event_broker.close()
+    sync_stop.set()
+    quote_poller.stop(timeout=5)
+    history_stop.set()
+    symbols_stop.set()
+    flush_history()
+    if notifier is not None:
+        notifier.close()
+    if op_journal is not None:
+        snapshot_stop.set()
+        if is_leader():
+            write_journal_snapshot()
+        op_journal.close()
+    if leader is not None:
+        leader.release()
+
+def start_background():
+    # 所有价格监听器注册完成后再启动后台行情线程
+    threading.Thread(target=symbol_master.run_watcher, name='symbols-watcher', daemon=True,
+                     args=(float(os.environ.get('SYMBOLS_RELOAD_INTERVAL', 5)), symbols_stop,
+                           on_symbols_reloaded)).start()
+    if notifier is not None:
+        notifier.start()
+    if op_journal is not None:
+        threading.Thread(target=run_snapshots, name='journal-snapshot', daemon=True).start()
+    if SHARED_STATE:
+        sync_state['event_id'] = alerts.last_event_id(database.cursor())
+        price_snapshot.add_recorder(replicate_quotes)
+        threading.Thread(target=shared.run_sync, name='shared-sync', daemon=True,
+                         args=(sync_shared_state, SYNC_INTERVAL, sync_stop)).start()
+    else:
+        start_history_flusher()
+        if FAST_START:
+            quote_poller.request_refresh(watched_symbols())
+        quote_poller.start()
+
+def warm_up():
+    # 启动优化模式的后台准备：完成后放行请求，第一个请求处理完再启动后台线程
+    try:
+        prepare_db()
+        load_deferred()
+        alert_engine.load(database.cursor())
+        symbol_master.reload()
+        normalize_stored_symbols()
+    except Exception:
+        app.logger.exception('启动准备失败')
+        os._exit(1)
+    finally:
+        database.release()
+    app_ready.set()
+    first_response.wait()
+    start_background()
+
+if FAST_START:
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+else:
+    load_deferred()
+    normalize_stored_symbols()
+    app_ready.set()
+    start_background()
 
 # 健康检查端点
 @app.route('/health')
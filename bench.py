@@ -0,0 +1,634 @@
+# 负载与延迟基准测试
+# 按给定规模生成模拟的监控列表和交易记录，然后压测各个接口，输出吞吐量和 p50/p95/p99 延迟
+# 两种模式：inproc 在进程内通过 Flask test_client 调用；server 启动本地服务后用多个 HTTP 客户端并发请求
+# 指定 --workers 时另外以不同 worker 数启动 serve.py，测试多进程的吞吐扩展性（--mode scaling 只测这一项）
+#
+# 用法示例：
+#   python bench.py --stocks 10,1000 --transactions 1000,100000 --mode both --output bench_results.json
+#   python bench.py --baseline bench_results.json      # 与上一次结果对比
+#   python bench.py --mode scaling --workers 1,2,4 --concurrency 32
+#   python bench.py --accounts 10000 --stocks 100000 --transactions 1000000   # 多账户，请求随机分布到各账户
+#   python bench.py --formats columnar,msgpack     # 列表接口另外按这些响应格式压测，并报告字节数和编码耗时
+#   python bench.py --mode cold-start --cold-start 10  # 只测冷启动：进程启动到 /health 首个响应的时间（目标 300ms），both 模式也会测
+import argparse
+import gzip
+import functools
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINTS = ('/', '/api/stocks', '/api/portfolio', '/api/pnl', '/api/stock/add', '/api/transaction/add', '/health')
+
+# 冷启动测试的启动方式：(名称, 启动脚本, 额外环境变量)
+COLD_START_TARGET_MS = 300
+COLD_START_CONFIGS = (
+    ('app', 'app.py', {'FAST_START': '0'}),
+    ('app-fast', 'app.py', {'FAST_START': '1'}),
+    ('serve', 'serve.py', {'FAST_START': '0', 'WORKERS': '1'}),
+    ('serve-fast', 'serve.py', {'FAST_START': '1', 'WORKERS': '1'}),
+)
+
+# 支持 ?format= 的列表接口，--formats 中的每种格式另外作为一个压测路径
+FORMAT_ENDPOINTS = ('/api/stocks', '/api/portfolio')
+
+# 压测时使用固定报价的本地报价源，避免随机数和后台线程干扰结果
+BENCH_ENV = {
+    'HISTORY_DIR': '',
+    'QUOTE_POLL_INTERVAL': '5',
+}
+
+
+# 新增股票接口使用的未关注代码个数；代码列表经环境变量传给压测子进程，不宜过多
+NEW_SYMBOLS = 5000
+
+
+def symbol_pool(count):
+    # 压测使用的代码须能通过服务端的代码校验：服务加载了证券主数据（SYMBOLS_FILE，相对于项目目录）时取自主数据，
+    # 否则为 600000 起的连续代码；主数据条数不足时返回的代码少于 count 个
+    sys.path.insert(0, ROOT)
+    import symbols as symbols_module
+    master = symbols_module.SymbolMaster(os.path.join(ROOT, os.environ.get('SYMBOLS_FILE', 'symbols.csv')))
+    master.reload()
+    entries = master.index.entries
+    if entries:
+        return [symbols_module.qualify(entry.code, entry.exchange) for entry in entries[:count]]
+    return [f'{600000 + i:06d}' for i in range(min(count, 400000))]
+
+
+def seed(path, stocks, transactions, accounts=1, seed_value=42):
+    # 直接写入数据库文件：监控列表 stocks 只，交易记录 transactions 条，平均分到 accounts 个账户
+    # 各账户使用同一批代码；返回 {'trade': 已关注的代码, 'new': 未关注的代码（新增股票接口使用）}
+    sys.path.insert(0, ROOT)
+    import accounts as accounts_module
+    import db
+    import importer
+    import migrations
+
+    rng = random.Random(seed_value)
+    database = db.Database(path)
+    database.migrate(migrations.MIGRATIONS)
+    pool = symbol_pool(max(stocks, 1) + NEW_SYMBOLS)
+    symbols = pool[:max(stocks, 1)]
+    account_ids = [accounts_module.DEFAULT_ACCOUNT]
+    with database.transaction() as c:
+        for i in range(1, accounts):
+            account_ids.append(accounts_module.create_account(c, f'压测账户{i}'))
+
+    def share(total, index):
+        return total // accounts + (1 if index < total % accounts else 0)
+
+    def stock_records(count):
+        for i in range(count):
+            yield i + 1, {'symbol': symbols[i], 'name': f'测试股票{i}'}
+
+    def transaction_records(count):
+        for i in range(count):
+            # 买多卖少，保证大部分代码保持持仓；超过持仓的卖出由导入拒绝
+            yield i + 1, {
+                'symbol': symbols[rng.randrange(len(symbols))],
+                'type': 'buy' if rng.random() < 0.7 else 'sell',
+                'price': round(rng.uniform(5, 50), 2),
+                'quantity': rng.randint(1, 10) * 100,
+            }
+
+    with database.transaction() as c:
+        for index, account_id in enumerate(account_ids):
+            importer.import_stocks(c, stock_records(share(stocks, index)), chunk_size=5000, account_id=account_id)
+    with database.transaction() as c:
+        for index, account_id in enumerate(account_ids):
+            importer.import_transactions(c, transaction_records(share(transactions, index)), chunk_size=5000,
+                                         account_id=account_id)
+    database.close()
+    return {'trade': symbols, 'new': pool[len(symbols):] or symbols}
+
+
+def write_quotes(path, symbols, seed_value=7):
+    rng = random.Random(seed_value)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({symbol: round(rng.uniform(5, 50), 2) for symbol in symbols}, f)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, sizes, errors, elapsed):
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+        'avg_bytes': round(sum(sizes) / len(sizes)) if sizes else None,
+    }
+
+
+class RequestFactory:
+    # 为写接口生成请求体，每个请求随机选择一个账户；symbols 为 seed() 返回的代码
+    # 新增股票从未关注的代码中随机选取，交易使用已关注的代码
+    def __init__(self, symbols, worker_id, accounts=1):
+        self.symbols = symbols
+        self.worker_id = worker_id
+        self.accounts = accounts
+        self.counter = 0
+        self.rng = random.Random(worker_id)
+
+    def account(self):
+        return self.rng.randint(1, self.accounts)
+
+    def body(self, path):
+        self.counter += 1
+        if path == '/api/stock/add':
+            return {'symbol': self.rng.choice(self.symbols['new']), 'name': '压测'}
+        if path == '/api/transaction/add':
+            return {'symbol': self.rng.choice(self.symbols['trade']), 'type': 'buy',
+                    'price': round(self.rng.uniform(5, 50), 2), 'quantity': 100}
+        return None
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, path, body, account_id=1):
+        headers = {'Accept-Encoding': 'gzip', 'X-Account-Id': str(account_id)}
+        if body is None:
+            response = self.client.get(path, headers=headers)
+        else:
+            response = self.client.post(path, json=body, headers=headers)
+        return response.status_code, len(response.get_data())
+
+    def close(self):
+        pass
+
+
+class HTTPClient:
+    # 每个并发线程一个长连接
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+
+    def request(self, path, body, account_id=1):
+        headers = {'Accept-Encoding': 'gzip', 'X-Account-Id': str(account_id)}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request('POST' if body is not None else 'GET', path, payload, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            raise
+        return response.status, len(data)
+
+    def close(self):
+        self.conn.close()
+
+
+def drive_raw(client_factory, path, symbols, requests, concurrency, worker_offset=0, accounts=1):
+    # concurrency 个线程共发出 requests 个请求，返回 (延迟列表, 响应字节数列表, 错误数, 开始时间, 结束时间)
+    # 错误数只统计连接失败；返回非 2xx 状态说明请求本身无效，压测结果没有意义，直接抛出 RuntimeError
+    latencies = []
+    sizes = []
+    errors = [0]
+    failures = []
+    lock = threading.Lock()
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0)
+                  for i in range(concurrency)]
+
+    def worker(worker_id, count):
+        client = client_factory()
+        factory = RequestFactory(symbols, worker_id, accounts)
+        local_latencies = []
+        local_sizes = []
+        local_errors = 0
+        for _ in range(count):
+            body = factory.body(path)
+            start = time.perf_counter()
+            try:
+                status, size = client.request(path, body, factory.account())
+            except Exception:
+                local_errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+            if not 200 <= status < 300:
+                with lock:
+                    failures.append((status, body))
+                break
+            local_latencies.append(elapsed)
+            local_sizes.append(size)
+        client.close()
+        with lock:
+            latencies.extend(local_latencies)
+            sizes.extend(local_sizes)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(worker_offset + i, n))
+               for i, n in enumerate(per_worker) if n]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        status, body = failures[0]
+        raise RuntimeError(f'{path} 返回 {status}（请求体 {json.dumps(body, ensure_ascii=False)}），'
+                           f'共 {len(failures)} 个线程失败')
+    return latencies, sizes, errors[0], start, time.time()
+
+
+def drive(client_factory, path, symbols, requests, concurrency, accounts=1):
+    latencies, sizes, errors, start, end = drive_raw(client_factory, path, symbols, requests, concurrency,
+                                                     accounts=accounts)
+    return summarize(latencies, sizes, errors, end - start)
+
+
+def _drive_http_process(task):
+    host, port, path, symbols, requests, concurrency, offset, accounts = task
+    return drive_raw(lambda: HTTPClient(host, port), path, symbols, requests, concurrency, offset, accounts)
+
+
+def drive_processes(host, port, path, symbols, requests, concurrency, processes, accounts=1):
+    # 客户端分散到多个进程，避免压测端自身受 GIL 限制而低估多 worker 的吞吐
+    processes = max(1, min(processes, concurrency))
+    tasks = []
+    for i in range(processes):
+        n = requests // processes + (1 if i < requests % processes else 0)
+        c = concurrency // processes + (1 if i < concurrency % processes else 0)
+        tasks.append((host, port, path, symbols, n, c, i * 1000, accounts))
+    with multiprocessing.Pool(processes) as pool:
+        parts = pool.map(_drive_http_process, tasks)
+    latencies = [value for part in parts for value in part[0]]
+    sizes = [value for part in parts for value in part[1]]
+    errors = sum(part[2] for part in parts)
+    elapsed = max(part[4] for part in parts) - min(part[3] for part in parts)
+    return summarize(latencies, sizes, errors, elapsed)
+
+
+def run_endpoints(client_factory, symbols, endpoints, requests, concurrency, accounts=1, warmup=20):
+    results = {}
+    for path in endpoints:
+        drive(client_factory, path, symbols, min(warmup, requests), 1, accounts)
+        results[path] = drive(client_factory, path, symbols, requests, concurrency, accounts)
+    return results
+
+
+def bench_env(db_path, quotes_path):
+    env = dict(os.environ)
+    env.update(BENCH_ENV)
+    env.update({'DB_PATH': db_path, 'QUOTE_PROVIDER': 'file', 'QUOTE_SOURCE': quotes_path})
+    return env
+
+
+def expand_formats(endpoints, fmts):
+    # 列表接口后面追加各响应格式的路径，例如 /api/stocks?format=columnar
+    expanded = []
+    for path in endpoints:
+        expanded.append(path)
+        if path in FORMAT_ENDPOINTS:
+            expanded.extend(f'{path}?format={fmt}' for fmt in fmts if fmt != 'json')
+    return expanded
+
+
+def measure_formats(app_module, account_id=1, repeat=20):
+    # 对同一份列表数据分别编码，记录各格式的字节数（原始和 gzip 后）与编码耗时
+    # 直接调用编码函数，不经过响应缓存；flask_json 为原先 jsonify 使用的编码，作为对比基准
+    import formats
+    builders = {'/api/stocks': app_module.build_stocks, '/api/portfolio': app_module.build_portfolio}
+    encoders = {'flask_json': lambda data: app_module.app.json.dumps(data).encode('utf-8')}
+    encoders.update({fmt: functools.partial(formats.encode, fmt=fmt) for fmt in formats.MIMETYPES})
+    report = {'json_encoder': formats.JSON_ENCODER, 'msgpack_encoder': formats.MSGPACK_ENCODER}
+    for path, build in builders.items():
+        data = build(account_id)
+        stats = {'rows': len(data)}
+        for name, encode in encoders.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                body = encode(data)
+            elapsed = (time.perf_counter() - start) / repeat
+            stats[name] = {'bytes': len(body), 'gzip_bytes': len(gzip.compress(body, 6)),
+                           'encode_ms': round(elapsed * 1000, 3)}
+        report[path] = stats
+    return report
+
+
+def run_inprocess(args):
+    # 子进程入口：应用在导入时读取环境变量并连接数据库，每个规模单独起一个进程
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    symbols = json.loads(os.environ['BENCH_SYMBOLS_JSON'])
+    # 等待后台线程拿到第一轮报价
+    deadline = time.time() + 10
+    while app_module.price_snapshot.version == 0 and time.time() < deadline:
+        time.sleep(0.05)
+    results = run_endpoints(lambda: InProcessClient(app_module.app), symbols,
+                            args.endpoints, args.requests, args.concurrency, args.accounts)
+    print(json.dumps({'endpoints': results, 'formats': measure_formats(app_module)}))
+
+
+def wait_for_server(host, port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def start_server(env, port, command=None):
+    env = dict(env, PORT=str(port))
+    command = command or [sys.executable, os.path.join(ROOT, 'app.py')]
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_for_server('127.0.0.1', port):
+        process.kill()
+        raise RuntimeError('本地服务启动超时')
+    return process
+
+
+def first_response(host, port, path, started, timeout=30):
+    # 从 started 起到 path 第一次返回 200 的毫秒数；轮询间隔取得很短，避免把等待时间算进结果
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+            conn.request('GET', path)
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return round((time.perf_counter() - started) * 1000, 1)
+        except OSError:
+            pass
+        time.sleep(0.002)
+    return None
+
+
+def measure_cold_start(env, port, runs):
+    # 每种启动方式启动 runs 次：health_ms 为进程启动到 /health 首个响应，ready_ms 为到 /api/stocks 首个响应
+    report = {}
+    for name, script, extra in COLD_START_CONFIGS:
+        health, ready = [], []
+        for _ in range(runs):
+            started = time.perf_counter()
+            process = subprocess.Popen([sys.executable, os.path.join(ROOT, script)], cwd=ROOT,
+                                       env=dict(env, PORT=str(port), **extra),
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                health_ms = first_response('127.0.0.1', port, '/health', started)
+                ready_ms = first_response('127.0.0.1', port, '/api/stocks', started)
+            finally:
+                stop_server(process)
+            if health_ms is None or ready_ms is None:
+                raise RuntimeError(f'冷启动测试 {name} 启动超时')
+            health.append(health_ms)
+            ready.append(ready_ms)
+        health.sort()
+        ready.sort()
+        report[name] = {
+            'runs': runs,
+            'health_p50_ms': round(percentile(health, 50), 1),
+            'health_min_ms': health[0],
+            'ready_p50_ms': round(percentile(ready, 50), 1),
+            'ready_min_ms': ready[0],
+        }
+    return report
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_size(args, stocks, transactions, workdir):
+    db_path = os.path.join(workdir, f'bench_{stocks}_{transactions}.db')
+    quotes_path = os.path.join(workdir, f'quotes_{stocks}.json')
+    started = time.perf_counter()
+    symbols = seed(db_path, stocks, transactions, args.accounts)
+    seed_seconds = time.perf_counter() - started
+    write_quotes(quotes_path, symbols['trade'] + symbols['new'])
+    env = bench_env(db_path, quotes_path)
+    sample = {'trade': symbols['trade'][:1000], 'new': symbols['new']}
+    result = {'stocks': stocks, 'transactions': transactions, 'accounts': args.accounts,
+              'seed_s': round(seed_seconds, 3)}
+
+    if args.mode in ('inproc', 'both'):
+        child_env = dict(env, BENCH_SYMBOLS_JSON=json.dumps(sample))
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-inprocess',
+             '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+             '--accounts', str(args.accounts),
+             '--endpoints', ','.join(args.endpoints)],
+            env=child_env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        output = json.loads(output.strip().splitlines()[-1])
+        result['inproc'] = output['endpoints']
+        result['formats'] = output['formats']
+
+    if args.mode in ('both', 'cold-start') and args.cold_start:
+        result['cold_start'] = measure_cold_start(env, args.port, args.cold_start)
+
+    if args.mode in ('server', 'both'):
+        process = start_server(env, args.port)
+        try:
+            result['server'] = run_endpoints(lambda: HTTPClient('127.0.0.1', args.port), sample,
+                                             args.endpoints, args.requests, args.concurrency, args.accounts)
+        finally:
+            stop_server(process)
+
+    # 多 worker 扩展性：同一份数据分别以 1..N 个 worker 启动 serve.py，客户端分布在多个进程中
+    for workers in args.workers:
+        process = start_server(dict(env, WORKERS=str(workers)), args.port,
+                               [sys.executable, os.path.join(ROOT, 'serve.py')])
+        try:
+            result[f'workers_{workers}'] = {
+                path: drive_processes('127.0.0.1', args.port, path, sample, args.requests,
+                                      args.concurrency, args.client_processes, args.accounts)
+                for path in args.endpoints
+            }
+        finally:
+            stop_server(process)
+    return result
+
+
+def result_modes(result):
+    return [key for key in result if key in ('inproc', 'server') or key.startswith('workers_')]
+
+
+def compare(results, baseline):
+    # 打印与上次结果相比吞吐量和 p99 的变化百分比
+    previous = {(r['stocks'], r['transactions'], r.get('accounts', 1)): r for r in baseline.get('results', [])}
+    for result in results:
+        old = previous.get((result['stocks'], result['transactions'], result.get('accounts', 1)))
+        if old is None:
+            continue
+        for mode in result_modes(result):
+            for path, stats in result[mode].items():
+                before = old.get(mode, {}).get(path)
+                if not before or not before.get('throughput_rps') or not before.get('p99_ms'):
+                    continue
+                rps = (stats['throughput_rps'] / before['throughput_rps'] - 1) * 100
+                p99 = (stats['p99_ms'] / before['p99_ms'] - 1) * 100
+                print(f'{result["stocks"]:>7} {result["transactions"]:>9} {mode:<7} {path:<30} '
+                      f'吞吐 {rps:+7.1f}%  p99 {p99:+7.1f}%')
+
+
+def print_table(results):
+    print(f'{"stocks":>7} {"trades":>9} {"mode":<7} {"endpoint":<30} {"rps":>9} '
+          f'{"p50ms":>8} {"p95ms":>8} {"p99ms":>8} {"err":>5}')
+    for result in results:
+        for mode in result_modes(result):
+            for path, s in result[mode].items():
+                print(f'{result["stocks"]:>7} {result["transactions"]:>9} {mode:<7} {path:<30} '
+                      f'{s["throughput_rps"] or 0:>9} {s["p50_ms"] or 0:>8} {s["p95_ms"] or 0:>8} '
+                      f'{s["p99_ms"] or 0:>8} {s["errors"]:>5}')
+
+
+def print_scaling(results, workers):
+    # 各接口相对单 worker 的吞吐倍数
+    if len(workers) < 2:
+        return
+    base = workers[0]
+    print(f'\n扩展性（相对 {base} 个 worker 的吞吐倍数）')
+    for result in results:
+        reference = result.get(f'workers_{base}', {})
+        for path, stats in reference.items():
+            ratios = []
+            for n in workers[1:]:
+                rps = result.get(f'workers_{n}', {}).get(path, {}).get('throughput_rps')
+                ratios.append(f'{n}w x{rps / stats["throughput_rps"]:.2f}' if rps and stats['throughput_rps'] else f'{n}w -')
+            print(f'{result["stocks"]:>7} {result["transactions"]:>9} {path:<30} ' + '  '.join(ratios))
+
+
+def print_formats(results):
+    # 各响应格式相对原先 jsonify 输出的字节数和编码耗时变化
+    for result in results:
+        report = result.get('formats')
+        if not report:
+            continue
+        print(f'\n响应格式（{result["stocks"]} 只股票, {result["transactions"]} 条交易；'
+              f'JSON 编码 {report["json_encoder"]}，MessagePack 编码 {report["msgpack_encoder"]}）')
+        print(f'{"endpoint":<16} {"format":<11} {"rows":>7} {"bytes":>10} {"gzip":>9} {"encode_ms":>10} '
+              f'{"bytes%":>8} {"time%":>8}')
+        for path in FORMAT_ENDPOINTS:
+            stats = report.get(path)
+            if not stats:
+                continue
+            base = stats['flask_json']
+            for name in ('flask_json', 'json', 'columnar', 'msgpack'):
+                s = stats[name]
+                size = (s['bytes'] / base['bytes'] - 1) * 100 if base['bytes'] else 0
+                elapsed = (s['encode_ms'] / base['encode_ms'] - 1) * 100 if base['encode_ms'] else 0
+                print(f'{path:<16} {name:<11} {stats["rows"]:>7} {s["bytes"]:>10} {s["gzip_bytes"]:>9} '
+                      f'{s["encode_ms"]:>10} {size:>+7.1f}% {elapsed:>+7.1f}%')
+
+
+def print_cold_start(results):
+    # 冷启动时间：/health 首个响应与目标比较，ready 为数据库准备完成后第一个业务请求
+    for result in results:
+        report = result.get('cold_start')
+        if not report:
+            continue
+        print(f'\n冷启动（{result["stocks"]} 只股票, {result["transactions"]} 条交易；目标 {COLD_START_TARGET_MS}ms）')
+        print(f'{"config":<11} {"runs":>5} {"health_p50":>11} {"health_min":>11} {"ready_p50":>10} {"ready_min":>10}')
+        for name, s in report.items():
+            mark = '' if s['health_p50_ms'] <= COLD_START_TARGET_MS else '  超出目标'
+            print(f'{name:<11} {s["runs"]:>5} {s["health_p50_ms"]:>11} {s["health_min_ms"]:>11} '
+                  f'{s["ready_p50_ms"]:>10} {s["ready_min_ms"]:>10}{mark}')
+
+
+def parse_sizes(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='股票监控系统基准测试')
+    parser.add_argument('--stocks', type=parse_sizes, default=[10, 1000], help='监控列表规模，逗号分隔')
+    parser.add_argument('--transactions', type=parse_sizes, default=[1000, 100000], help='交易记录规模，逗号分隔')
+    parser.add_argument('--mode', choices=('inproc', 'server', 'both', 'scaling', 'cold-start'), default='both')
+    parser.add_argument('--requests', type=int, default=500, help='每个接口的请求数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--accounts', type=int, default=1, help='账户数，数据平均分到各账户')
+    parser.add_argument('--endpoints', type=lambda v: v.split(','), default=list(ENDPOINTS))
+    parser.add_argument('--formats', type=lambda v: [f for f in v.split(',') if f], default=['columnar', 'msgpack'],
+                        help='列表接口另外压测的响应格式，逗号分隔；为空时只测默认 JSON')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--workers', type=parse_sizes, default=[],
+                        help='扩展性测试的 worker 数，逗号分隔，例如 1,2,4；为空时不测试')
+    parser.add_argument('--client-processes', type=int, default=os.cpu_count() or 1,
+                        help='扩展性测试中压测客户端的进程数')
+    parser.add_argument('--cold-start', type=int, default=5,
+                        help='冷启动测试中每种启动方式的启动次数；0 表示不测试')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='上一次的结果文件，用于对比')
+    parser.add_argument('--workdir', help='存放压测数据库的目录，默认使用临时目录')
+    parser.add_argument('--run-inprocess', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_inprocess:
+        run_inprocess(args)
+        return
+
+    args.endpoints = expand_formats(args.endpoints, args.formats)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        for stocks in args.stocks:
+            for transactions in args.transactions:
+                print(f'压测规模: {stocks} 只股票, {transactions} 条交易, {args.accounts} 个账户', file=sys.stderr)
+                results.append(run_size(args, stocks, transactions, workdir))
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'workers': args.workers,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_table(results)
+    print_formats(results)
+    print_scaling(results, args.workers)
+    print_cold_start(results)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# 看板页面：启动时读取一次 templates/index.html，计算内容哈希 ETag 并预先压缩
+# 每次请求只需比较 ETag 或按 Accept-Encoding 返回现成的字节，不再拼接 HTML
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，没有时只提供 gzip
+    brotli = None
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html')
+
+
+class StaticPage:
+    def __init__(self, body, content_type='text/html; charset=utf-8', max_age=300):
+        self.content_type = content_type
+        self.cache_control = f'public, max-age={max_age}, must-revalidate'
+        # 各压缩版本使用不同的强 ETag，内容哈希相同
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        # 编码 -> 字节；identity 为未压缩的原文
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+
+    def choose_encoding(self, accept_encodings):
+        # accept_encodings 为 werkzeug 的 Accept 对象，按质量值挑选已有的压缩版本
+        best = 'identity'
+        best_quality = 0
+        for encoding in ('br', 'gzip'):
+            if encoding not in self.variants:
+                continue
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def etag_for(self, encoding):
+        return self.etag if encoding == 'identity' else f'{self.etag}-{encoding}'
+
+    def is_fresh(self, if_none_match):
+        # if_none_match 为 werkzeug 的 ETags 对象；客户端持有任一版本的 ETag 都说明内容未变
+        return any(if_none_match.contains(self.etag_for(encoding)) for encoding in self.variants) \
+            or if_none_match.star_tag
+
+    def headers(self, encoding):
+        headers = {
+            'ETag': f'"{self.etag_for(encoding)}"',
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return headers
+
+
+def load_page(path=TEMPLATE_PATH):
+    with open(path, 'rb') as f:
+        return StaticPage(f.read())
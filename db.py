@@ -0,0 +1,189 @@
+# SQLite 数据库访问：文件库 WAL 模式 + 每线程连接池 + 版本化迁移，所有语句按类型记录耗时
+# 配置通过环境变量完成：
+#   DB_PATH          数据库文件路径，默认 stock_monitor.db；设为 :memory: 使用进程私有的临时库（测试用）
+#   DB_SYNCHRONOUS   WAL 下的同步级别，默认 NORMAL
+#   DB_MMAP_SIZE     内存映射读取的字节数，默认 256MB
+#   DB_CACHE_SIZE    页缓存大小，负数表示 KB，默认 -65536（64MB）
+#   DB_BUSY_TIMEOUT  等待其他进程写锁的秒数，默认 5
+#   DB_POOL_SIZE     连接池保留的空闲连接数，默认 16
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import metrics
+
+DEFAULT_PATH = 'stock_monitor.db'
+
+_STATEMENT_KINDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'PRAGMA', 'BEGIN', 'CREATE'}
+_kind_cache = {}
+
+
+def statement_kind(sql):
+    # 语句类型按首个关键字归类；同一条 SQL 文本只解析一次
+    kind = _kind_cache.get(sql)
+    if kind is None:
+        words = sql.split(None, 1)
+        kind = words[0].upper() if words else 'OTHER'
+        if kind not in _STATEMENT_KINDS:
+            kind = 'OTHER'
+        if len(_kind_cache) < 4096:
+            _kind_cache[sql] = kind
+    return kind
+
+
+class TimedCursor(sqlite3.Cursor):
+    # 记录 execute 的耗时（SELECT 只包含执行到第一行为止的时间，后续 fetch 不计入）
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.DB_QUERY_LATENCY.observe(time.perf_counter() - start, statement_kind(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.DB_QUERY_LATENCY.observe(time.perf_counter() - start, statement_kind(sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class Database:
+    # 每个线程持有自己的连接；请求结束时通过 release() 归还到空闲池供后续线程复用
+    # 写操作统一走 transaction()，在进程内串行化，读操作不受写操作阻塞
+    def __init__(self, path, synchronous='NORMAL', mmap_size=256 * 1024 * 1024,
+                 cache_size=-65536, busy_timeout=5.0, pool_size=16):
+        self.path = path
+        self.memory = path == ':memory:'
+        if self.memory:
+            # 临时目录下的 WAL 库代替共享缓存内存库：读连接只看到已提交的数据，读写互不阻塞
+            # 不需要持久化，同步级别为 OFF；关闭或进程退出时删除
+            fd, temp_path = tempfile.mkstemp(prefix='stock_monitor_', suffix='.db')
+            os.close(fd)
+            self._target = 'file:' + temp_path
+            self._cleanup = weakref.finalize(self, _remove_database_files, temp_path)
+            synchronous = 'OFF'
+        else:
+            self._target = 'file:' + os.path.abspath(path)
+            self._cleanup = None
+        self.synchronous = synchronous
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.busy_timeout = busy_timeout
+        self.pool_size = pool_size
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._idle = []
+        self._idle_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self._target, uri=True, timeout=self.busy_timeout,
+                               check_same_thread=False, factory=TimedConnection)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._idle_lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def cursor(self):
+        return self.conn().cursor()
+
+    def release(self):
+        # 当前线程的连接归还空闲池；池满时直接关闭
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._idle_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def transaction(self):
+        conn = self.conn()
+        with self.write_lock:
+            try:
+                yield conn.cursor()
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def migrate(self, migrations):
+        # migrations 为 [(版本号, 函数(cursor))]，按版本号顺序执行尚未应用的部分
+        # 当前版本记录在 PRAGMA user_version 中，每个版本在单独的事务里提交
+        with self.write_lock:
+            conn = self.conn()
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            for version, migration in sorted(migrations, key=lambda m: m[0]):
+                if version <= current:
+                    continue
+                with self.transaction() as c:
+                    # 显式开启事务，让建表等 DDL 与版本号一起原子提交
+                    c.execute('BEGIN IMMEDIATE')
+                    # 多个进程同时启动时，拿到写锁后再确认一次，已被其他进程执行过的版本跳过
+                    current = c.execute('PRAGMA user_version').fetchone()[0]
+                    if version <= current:
+                        continue
+                    migration(c)
+                    c.execute(f'PRAGMA user_version = {int(version)}')
+                current = version
+        return current
+
+    def close(self):
+        self.release()
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        if self._cleanup is not None:
+            self._cleanup()
+
+
+def _remove_database_files(path):
+    for name in (path, path + '-wal', path + '-shm'):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def open_from_env(path=None):
+    return Database(
+        path or os.environ.get('DB_PATH', DEFAULT_PATH),
+        synchronous=os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+        mmap_size=int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+        cache_size=int(os.environ.get('DB_CACHE_SIZE', -65536)),
+        busy_timeout=float(os.environ.get('DB_BUSY_TIMEOUT', 5)),
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 16)),
+    )
@@ -0,0 +1,173 @@
+# 列表接口的响应格式，由 ?format= 参数或 Accept 请求头协商：
+#   json      默认，对象数组，每行重复全部字段名
+#   columnar  按列的 JSON：{"length": 行数, "columns": {字段: [各行的值]}}，字段名只出现一次
+#   msgpack   columnar 结构的 MessagePack 二进制编码
+# 返回 {items, next_cursor} 这类对象时，其中的列表按同样方式转为按列结构
+# orjson、msgpack 为可选依赖：没有 orjson 时使用标准库 json，没有 msgpack 时使用下面的纯 Python 编码
+import json
+import struct
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack 为可选依赖
+    msgpack = None
+
+JSON = 'json'
+COLUMNAR = 'columnar'
+MSGPACK = 'msgpack'
+
+MIMETYPES = {
+    JSON: 'application/json',
+    COLUMNAR: 'application/vnd.stock-monitor.columnar+json',
+    MSGPACK: 'application/msgpack',
+}
+
+# Accept 中可识别的类型，application/json 放在最前，Accept: */* 时仍返回 JSON
+_ACCEPT = {
+    'application/json': JSON,
+    MIMETYPES[COLUMNAR]: COLUMNAR,
+    'application/msgpack': MSGPACK,
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+}
+
+JSON_ENCODER = 'orjson' if orjson is not None else 'json'
+MSGPACK_ENCODER = 'msgpack' if msgpack is not None else 'builtin'
+
+
+def negotiate(requested, accept_mimetypes):
+    # ?format= 优先，取值不支持时抛出 ValueError；否则按 Accept 的质量值选择，都不匹配时返回 json
+    if requested:
+        requested = requested.lower()
+        if requested not in MIMETYPES:
+            raise ValueError('format 必须是 json、columnar 或 msgpack')
+        return requested
+    return _ACCEPT[accept_mimetypes.best_match(list(_ACCEPT), default='application/json')]
+
+
+def to_columns(rows):
+    # 各行的字段顺序相同（由同一个函数生成），按第一行的字段转置
+    if not rows:
+        return {'length': 0, 'columns': {}}
+    fields = list(rows[0])
+    return {
+        'length': len(rows),
+        'columns': dict(zip(fields, map(list, zip(*(row.values() for row in rows))))),
+    }
+
+
+def columnar(data):
+    if isinstance(data, list):
+        return to_columns(data)
+    if isinstance(data, dict):
+        return {key: to_columns(value) if isinstance(value, list) else value for key, value in data.items()}
+    return data
+
+
+def dumps_json(data):
+    # 键排序，与 Flask 默认的 JSON 输出一致，同样的数据得到同样的 ETag
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def encode(data, fmt):
+    if fmt == COLUMNAR:
+        return dumps_json(columnar(data))
+    if fmt == MSGPACK:
+        return pack(columnar(data))
+    return dumps_json(data)
+
+
+# ---- MessagePack ----
+
+def pack(obj):
+    if msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = []
+    _pack(obj, out)
+    return b''.join(out)
+
+
+_pack_double = struct.Struct('>Bd').pack
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(b'\xc0')
+    elif obj is True:
+        out.append(b'\xc3')
+    elif obj is False:
+        out.append(b'\xc2')
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(bytes((obj,)))
+        elif -0x20 <= obj < 0:
+            out.append(struct.pack('b', obj))
+        elif 0 <= obj < 0x100:
+            out.append(struct.pack('>BB', 0xcc, obj))
+        elif 0 <= obj < 0x10000:
+            out.append(struct.pack('>BH', 0xcd, obj))
+        elif 0 <= obj <= 0xffffffff:
+            out.append(struct.pack('>BI', 0xce, obj))
+        elif 0 <= obj <= 0xffffffffffffffff:
+            out.append(struct.pack('>BQ', 0xcf, obj))
+        elif -0x80000000 <= obj < 0:
+            out.append(struct.pack('>Bi', 0xd2, obj))
+        else:
+            out.append(struct.pack('>Bq', 0xd3, obj))
+    elif isinstance(obj, float):
+        out.append(_pack_double(0xcb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        n = len(data)
+        if n < 32:
+            out.append(bytes((0xa0 | n,)))
+        elif n < 0x100:
+            out.append(struct.pack('>BB', 0xd9, n))
+        elif n < 0x10000:
+            out.append(struct.pack('>BH', 0xda, n))
+        else:
+            out.append(struct.pack('>BI', 0xdb, n))
+        out.append(data)
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(bytes((0x90 | n,)))
+        elif n < 0x10000:
+            out.append(struct.pack('>BH', 0xdc, n))
+        else:
+            out.append(struct.pack('>BI', 0xdd, n))
+        if n and all(type(item) is float for item in obj):
+            # 价格等浮点列一次打包
+            out.append(struct.pack('>' + 'Bd' * n, *[value for item in obj for value in (0xcb, item)]))
+            return
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(bytes((0x80 | n,)))
+        elif n < 0x10000:
+            out.append(struct.pack('>BH', 0xde, n))
+        else:
+            out.append(struct.pack('>BI', 0xdf, n))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        if n < 0x100:
+            out.append(struct.pack('>BB', 0xc4, n))
+        elif n < 0x10000:
+            out.append(struct.pack('>BH', 0xc5, n))
+        else:
+            out.append(struct.pack('>BI', 0xc6, n))
+        out.append(bytes(obj))
+    else:
+        raise TypeError(f'无法编码为 MessagePack 的类型: {type(obj).__name__}')
@@ -0,0 +1,236 @@
+# 价格历史：每个代码一个定长环形缓冲区（array 存储，内存可预估），定期刷写到磁盘的列式文件
+# 磁盘布局：<HISTORY_DIR>/<代码>/<YYYYMMDD>.ts 与 .px，两个文件分别顺序追加时间戳和价格（float64）
+# 配置通过环境变量完成：
+#   HISTORY_DIR             历史数据目录，默认 history；设为空字符串只保留内存
+#   HISTORY_CAPACITY        每个代码内存中保留的最近报价条数，默认 4096（约 64KB/代码）
+#   HISTORY_FLUSH_INTERVAL  刷写磁盘的周期（秒），默认 60
+import importlib.util
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+
+# numpy 为可选依赖，没有时使用纯 Python 聚合；首次聚合 K 线时才导入，不计入启动时间
+np = None
+HAVE_NUMPY = importlib.util.find_spec('numpy') is not None
+
+
+def _load_numpy():
+    global np
+    if np is None and HAVE_NUMPY:
+        import numpy
+        np = numpy
+    return np
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+# K 线按本地时区对齐（日线从本地零点开始）
+_TZ_OFFSET = time.localtime().tm_gmtoff
+
+
+class RingBuffer:
+    # 定长环形缓冲区，时间戳和价格分列存储
+    __slots__ = ('capacity', 'ts', 'price', 'start', 'count', 'unflushed')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = array('d', bytes(8 * capacity))
+        self.price = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+        self.unflushed = 0
+
+    def append(self, ts, price):
+        i = (self.start + self.count) % self.capacity
+        self.ts[i] = ts
+        self.price[i] = price
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        self.unflushed = min(self.unflushed + 1, self.capacity)
+
+    def _columns(self, column, last=None):
+        # 按时间顺序返回最近 last 条（默认全部）
+        n = self.count if last is None else min(last, self.count)
+        begin = (self.start + self.count - n) % self.capacity
+        end = begin + n
+        if end <= self.capacity:
+            return column[begin:end]
+        return column[begin:] + column[:end - self.capacity]
+
+    def items(self, last=None):
+        return self._columns(self.ts, last), self._columns(self.price, last)
+
+
+def _day(ts):
+    return time.strftime('%Y%m%d', time.localtime(ts))
+
+
+class HistoryStore:
+    def __init__(self, directory=None, capacity=4096):
+        self.directory = directory or None
+        self.capacity = capacity
+        self._buffers = {}
+        self._flushed_until = {}  # 代码 -> 已写入磁盘的最后时间戳
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_needed = threading.Event()
+
+    def record(self, quotes):
+        # quotes 为 {代码: (价格, 时间戳)}，与价格快照的结构一致
+        with self._lock:
+            for symbol, (price, ts) in quotes.items():
+                buffer = self._buffers.get(symbol)
+                if buffer is None:
+                    buffer = self._buffers[symbol] = RingBuffer(self.capacity)
+                buffer.append(ts, price)
+                if buffer.unflushed >= self.capacity // 2:
+                    self._flush_needed.set()
+
+    @property
+    def symbol_count(self):
+        return len(self._buffers)
+
+    def _symbol_dir(self, symbol):
+        return os.path.join(self.directory, urllib.parse.quote(symbol, safe=''))
+
+    def flush(self):
+        # 把各代码尚未落盘的报价追加到对应日期的列式文件
+        if not self.directory:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                pending = []
+                for symbol, buffer in self._buffers.items():
+                    if buffer.unflushed:
+                        pending.append((symbol, buffer.items(buffer.unflushed)))
+                        buffer.unflushed = 0
+            written = 0
+            for symbol, (ts, prices) in pending:
+                path = self._symbol_dir(symbol)
+                os.makedirs(path, exist_ok=True)
+                # 同一批数据可能跨越日期，按天拆分
+                i = 0
+                while i < len(ts):
+                    day = _day(ts[i])
+                    j = i + 1
+                    while j < len(ts) and _day(ts[j]) == day:
+                        j += 1
+                    base = os.path.join(path, day)
+                    with open(base + '.ts', 'ab') as f:
+                        ts[i:j].tofile(f)
+                    with open(base + '.px', 'ab') as f:
+                        prices[i:j].tofile(f)
+                    i = j
+                self._flushed_until[symbol] = ts[-1]
+                written += len(ts)
+            return written
+
+    def discard_unflushed(self):
+        # 多进程模式下接任 leader 时调用：内存里的报价可能已由上一任写入磁盘，不再重复写
+        with self._lock:
+            for buffer in self._buffers.values():
+                buffer.unflushed = 0
+
+    def run_flusher(self, interval, stop_event):
+        # 后台刷写线程：按周期刷写，缓冲区快写满时提前刷写
+        while not stop_event.is_set():
+            self._flush_needed.wait(interval)
+            self._flush_needed.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('刷写价格历史失败')
+
+    def _read_disk(self, symbol, start, end):
+        if not self.directory:
+            return array('d'), array('d')
+        path = self._symbol_dir(symbol)
+        try:
+            names = sorted(name[:-3] for name in os.listdir(path) if name.endswith('.ts'))
+        except FileNotFoundError:
+            return array('d'), array('d')
+        first_day = _day(start) if start is not None else None
+        last_day = _day(end) if end is not None else None
+        ts = array('d')
+        prices = array('d')
+        for day in names:
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            base = os.path.join(path, day)
+            with open(base + '.ts', 'rb') as f:
+                day_ts = array('d', f.read())
+            with open(base + '.px', 'rb') as f:
+                day_prices = array('d', f.read())
+            n = min(len(day_ts), len(day_prices))
+            lo = bisect_left(day_ts, start, 0, n) if start is not None else 0
+            hi = bisect_right(day_ts, end, 0, n) if end is not None else n
+            ts.extend(day_ts[lo:hi])
+            prices.extend(day_prices[lo:hi])
+        return ts, prices
+
+    def query(self, symbol, start=None, end=None):
+        # 返回 [start, end] 范围内按时间排序的 (时间戳数组, 价格数组)，磁盘与内存数据合并去重
+        with self._lock:
+            buffer = self._buffers.get(symbol)
+            memory = buffer.items() if buffer is not None else (array('d'), array('d'))
+            flushed_until = self._flushed_until.get(symbol)
+        ts, prices = self._read_disk(symbol, start, end)
+        mem_ts, mem_prices = memory
+        # 内存中已落盘的部分以磁盘为准
+        lo = bisect_right(mem_ts, flushed_until) if flushed_until is not None and self.directory else 0
+        if ts:
+            lo = max(lo, bisect_right(mem_ts, ts[-1]))
+        if start is not None:
+            lo = max(lo, bisect_left(mem_ts, start))
+        hi = bisect_right(mem_ts, end) if end is not None else len(mem_ts)
+        if lo < hi:
+            ts.extend(mem_ts[lo:hi])
+            prices.extend(mem_prices[lo:hi])
+        return ts, prices
+
+
+def ohlc(ts, prices, seconds):
+    # 按 seconds 聚合为 K 线，返回列式字典 time/open/high/low/close/count
+    if not ts:
+        return {'time': [], 'open': [], 'high': [], 'low': [], 'close': [], 'count': []}
+    if _load_numpy() is not None:
+        t = np.frombuffer(ts, dtype=np.float64)
+        p = np.frombuffer(prices, dtype=np.float64)
+        buckets = np.floor((t + _TZ_OFFSET) / seconds) * seconds - _TZ_OFFSET
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(p)] - 1
+        return {
+            'time': buckets[starts].tolist(),
+            'open': p[starts].tolist(),
+            'high': np.maximum.reduceat(p, starts).tolist(),
+            'low': np.minimum.reduceat(p, starts).tolist(),
+            'close': p[ends].tolist(),
+            'count': (ends - starts + 1).tolist(),
+        }
+
+    bars = {'time': [], 'open': [], 'high': [], 'low': [], 'close': [], 'count': []}
+    bucket_of = lambda pair: (pair[0] + _TZ_OFFSET) // seconds * seconds - _TZ_OFFSET
+    for bucket, group in groupby(zip(ts, prices), key=bucket_of):
+        values = [price for _, price in group]
+        bars['time'].append(bucket)
+        bars['open'].append(values[0])
+        bars['high'].append(max(values))
+        bars['low'].append(min(values))
+        bars['close'].append(values[-1])
+        bars['count'].append(len(values))
+    return bars
+
+
+def create_store_from_env():
+    return HistoryStore(
+        directory=os.environ.get('HISTORY_DIR', 'history'),
+        capacity=int(os.environ.get('HISTORY_CAPACITY', 4096)),
+    )
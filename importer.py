@@ -0,0 +1,235 @@
+# 批量导入：流式解析 CSV / NDJSON 上传内容，分块 executemany 写入
+# 整个上传在调用方的一个事务中完成，内存占用只与分块大小有关，与上传大小无关
+import csv
+import functools
+import io
+import json
+import math
+from datetime import datetime
+
+import accounts
+import lots
+
+FORMATS = ('csv', 'ndjson')
+
+# 错误明细最多保留的条数，超过后只计数
+MAX_ERRORS = 1000
+
+# 单笔交易数量上限，保证数量和金额在 SQLite 整数和浮点数范围内
+MAX_QUANTITY = 10 ** 12
+
+
+class ImportReport:
+    def __init__(self, max_errors=MAX_ERRORS):
+        self.max_errors = max_errors
+        self.total = 0
+        self.inserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.symbols = set()
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'message': message})
+
+    def to_dict(self):
+        return {
+            'success': self.error_count == 0,
+            'total': self.total,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+        }
+
+
+def detect_format(content_type, requested=None):
+    if requested:
+        requested = requested.lower()
+        if requested in ('jsonl', 'json'):
+            return 'ndjson'
+        return requested if requested in FORMATS else None
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type:
+        return 'csv'
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+        return 'ndjson'
+    return None
+
+
+# 无法按 UTF-8 解码的字节替换为 U+FFFD，含有替换字符的行记为错误，不中断整个导入
+ENCODING_ERROR = '不是有效的 UTF-8 编码'
+
+
+def iter_records(stream, fmt):
+    # 逐行产出 (行号, 记录字典)；无法解析的行产出 (行号, 错误信息字符串)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        try:
+            for row in reader:
+                if any('\ufffd' in value for value in row.values() if isinstance(value, str)):
+                    yield reader.line_num, ENCODING_ERROR
+                    continue
+                yield reader.line_num, row
+        except csv.Error as e:
+            yield reader.line_num, f'CSV 格式错误: {e}'
+        return
+
+    for line_no, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if '\ufffd' in line:
+            yield line_no, ENCODING_ERROR
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, f'JSON 格式错误: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_no, '每行必须是一个 JSON 对象'
+            continue
+        yield line_no, record
+
+
+def _text(record, key):
+    value = record.get(key)
+    return str(value).strip() if value is not None else ''
+
+
+def parse_transaction(record, normalize=None):
+    # normalize 与 parse_stock 相同，交易记录只使用规范化后的代码
+    symbol = _text(record, 'symbol')
+    if not symbol:
+        raise ValueError('缺少股票代码')
+    if normalize is not None:
+        symbol = normalize(symbol)[0]
+    trade_type = _text(record, 'type').lower()
+    if trade_type not in ('buy', 'sell'):
+        raise ValueError('type 必须是 buy 或 sell')
+    try:
+        price = float(record.get('price'))
+        quantity_value = float(record.get('quantity'))
+    except (TypeError, ValueError):
+        raise ValueError('price 和 quantity 必须是数字')
+    if not math.isfinite(price) or price <= 0:
+        raise ValueError('price 必须是大于 0 的有限数字')
+    if not math.isfinite(quantity_value) or quantity_value <= 0 or quantity_value != int(quantity_value):
+        raise ValueError('quantity 必须是正整数')
+    if quantity_value > MAX_QUANTITY:
+        raise ValueError(f'quantity 不能超过 {MAX_QUANTITY}')
+    date = _text(record, 'date') or None
+    if date is not None:
+        # 统一存成与 CURRENT_TIMESTAMP 相同的格式，保证按时间范围查询时文本比较正确
+        try:
+            date = datetime.fromisoformat(date).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise ValueError('date 格式错误')
+    return symbol, trade_type, price, int(quantity_value), date
+
+
+def timestamp():
+    # 与 CURRENT_TIMESTAMP 相同的格式（UTC）；写入前在应用中生成，操作日志记录的时间与库中一致
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_stock(record, normalize=None):
+    # normalize(代码, 名称或 None) 返回规范化后的 (代码, 名称)，代码无效时抛出 ValueError
+    symbol = _text(record, 'symbol')
+    if not symbol:
+        raise ValueError('缺少股票代码')
+    if normalize is not None:
+        return normalize(symbol, _text(record, 'name') or None)
+    return symbol, _text(record, 'name') or symbol
+
+
+def _chunks(records, parse, report, chunk_size):
+    # 产出 [(行号, 解析结果)] 分块，解析失败的行记入报告
+    chunk = []
+    for line, record in records:
+        report.total += 1
+        if isinstance(record, str):
+            report.error(line, record)
+            continue
+        try:
+            chunk.append((line, parse(record)))
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _last_id(c, table):
+    c.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+def import_transactions(c, records, chunk_size=1000, report=None, method='fifo',
+                        account_id=accounts.DEFAULT_ACCOUNT, on_chunk=None, normalize=None):
+    # 按上传顺序逐笔核算批次，超过持仓的卖出记为错误且不写入
+    # on_chunk 收到每块写入的 [(id, symbol, type, price, quantity, date)]，用于记录操作日志；normalize 见 parse_stock
+    report = report or ImportReport()
+    book = lots.LotBook(c, method, account_id)
+    parse = functools.partial(parse_transaction, normalize=normalize)
+    for chunk in _chunks(records, parse, report, chunk_size):
+        accepted = []
+        for line, row in chunk:
+            try:
+                book.trade(*row[:4])
+            except lots.OversellError as e:
+                report.error(line, str(e))
+                continue
+            accepted.append((account_id,) + row[:4] + (row[4] or timestamp(),))
+        c.executemany('''
+            INSERT INTO transactions (account_id, symbol, type, price, quantity, date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', accepted)
+        book.flush()
+        if on_chunk is not None and accepted:
+            # 调用方持有写锁，AUTOINCREMENT 为这一块分配的是连续编号
+            first = _last_id(c, 'transactions') - len(accepted) + 1
+            on_chunk([(first + i,) + row[1:] for i, row in enumerate(accepted)])
+        report.inserted += len(accepted)
+        report.symbols.update(row[1] for row in accepted)
+    return report
+
+
+def import_stocks(c, records, chunk_size=1000, report=None, account_id=accounts.DEFAULT_ACCOUNT, on_chunk=None,
+                  normalize=None):
+    # 监控列表按账户内的代码 upsert：新代码插入，已存在的代码更新名称
+    # on_chunk 收到每块写入后的 [(id, symbol, name, created_at)]；normalize 见 parse_stock
+    report = report or ImportReport()
+    parse = functools.partial(parse_stock, normalize=normalize)
+    for chunk in _chunks(records, parse, report, chunk_size):
+        chunk = [row for _, row in chunk]
+        symbols = list({row[0] for row in chunk})
+        c.execute(f'SELECT symbol FROM stocks WHERE account_id = ? AND symbol IN ({",".join("?" * len(symbols))})',
+                  [account_id] + symbols)
+        existing = {row[0] for row in c.fetchall()}
+        c.executemany('''
+            INSERT INTO stocks (account_id, symbol, name) VALUES (?, ?, ?)
+            ON CONFLICT(account_id, symbol) DO UPDATE SET name = excluded.name
+        ''', [(account_id, symbol, name) for symbol, name in chunk])
+        for symbol, _ in chunk:
+            if symbol in existing:
+                report.updated += 1
+            else:
+                report.inserted += 1
+                existing.add(symbol)
+        report.symbols.update(symbols)
+        if on_chunk is not None:
+            c.execute(f'SELECT id, symbol, name, created_at FROM stocks '
+                      f'WHERE account_id = ? AND symbol IN ({",".join("?" * len(symbols))})',
+                      [account_id] + symbols)
+            on_chunk(c.fetchall())
+    return report
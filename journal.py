@@ -0,0 +1,328 @@
+# 操作日志：每个写操作（新增/删除股票、交易、阈值和提醒规则修改、导入等）追加一条记录
+# 日志只追加不修改，按段存放在 JOURNAL_DIR 下，段文件名为该段起始位置（全局字节偏移，即 LSN）
+# 记录格式：长度(4) + crc32(4) + 时间戳(8) + JSON 负载；读取时遇到不完整或校验失败的记录即视为日志末尾
+# 写入在调用方的数据库写事务内完成（持有 SQLite 写锁），多个进程追加到同一个段时顺序与提交顺序一致
+# 记录在事务的所有写语句成功之后、提交之前追加；提交失败回滚时追加一条作废标记，列出回滚事务的记录，重放时跳过
+# fsync 批量进行：后台线程一次 fsync 覆盖这段时间内所有进程写入的记录，等待持久化的请求共享同一次 fsync
+#
+# 快照：定期把压缩后的当前状态（监控列表、持仓、批次、提醒规则等）写成一个文件，连同对应的日志位置一起保存
+# 交易记录和提醒事件等历史只保存在数据库中，快照大小与历史长度无关
+# 早于保留的最旧快照的日志段随快照清理一起删除；启动时从库中记录的日志位置开始检查末尾，不扫描整段
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<IId')
+SEGMENT_SUFFIX = '.journal'
+SNAPSHOT_PREFIX = 'snapshot-'
+SNAPSHOT_SUFFIX = '.snap'
+# 版本 3 起快照只包含当前状态，不含交易记录和提醒事件；旧版本的快照读取时跳过
+SNAPSHOT_VERSION = 3
+
+# 作废标记的记录类型：{'op': 'abort', 'lsns': [回滚事务追加的记录 LSN]}
+ABORT_OP = 'abort'
+
+# 单个段的大小上限，超过后下一条记录写入新段
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+def directory_from_env(db_path):
+    # JOURNAL=0 关闭日志；JOURNAL_DIR 默认为数据库文件旁的 <DB_PATH>.journal 目录，内存库需要显式设置
+    if os.environ.get('JOURNAL', '1') != '1':
+        return None
+    directory = os.environ.get('JOURNAL_DIR')
+    if directory:
+        return directory
+    return None if db_path == ':memory:' else db_path + '.journal'
+
+
+def _segment_name(start):
+    return f'{start:016x}{SEGMENT_SUFFIX}'
+
+
+def segments(directory):
+    # 按起始位置排序的 [(起始位置, 路径)]
+    result = []
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX):
+            try:
+                result.append((int(name[:-len(SEGMENT_SUFFIX)], 16), os.path.join(directory, name)))
+            except ValueError:
+                continue
+    return sorted(result)
+
+
+def encode(op, data, ts):
+    payload = json.dumps(dict(data, op=op), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return _HEADER.pack(len(payload), zlib.crc32(payload), ts) + payload
+
+
+def _scan(buffer, start, base):
+    # 从 buffer[start:] 解析记录，产出 (记录结束位置 LSN, 时间戳, 记录)；遇到残缺记录停止
+    offset = start
+    end = len(buffer)
+    while offset + _HEADER.size <= end:
+        length, crc, ts = _HEADER.unpack_from(buffer, offset)
+        body_start = offset + _HEADER.size
+        body_end = body_start + length
+        if body_end > end:
+            return
+        payload = buffer[body_start:body_end]
+        if zlib.crc32(payload) != crc:
+            return
+        offset = body_end
+        yield base + offset, ts, json.loads(payload)
+
+
+def read(directory, after=0, until_ts=None):
+    # 按顺序读取 LSN 大于 after 的记录，产出 (LSN, 时间戳, 记录)；until_ts 之后的记录不再读取
+    # after 为记录边界（某条记录的 LSN 或段的起始位置），所在段从该位置开始解析
+    for start, path in segments(directory):
+        size = os.path.getsize(path)
+        if start + size <= after or size == 0:
+            continue
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for lsn, ts, record in _scan(buffer, max(after - start, 0), start):
+                if until_ts is not None and ts > until_ts:
+                    return
+                yield lsn, ts, record
+
+
+def valid_end(directory, after=0):
+    # 日志中最后一条完整记录的结束位置；截掉最后一段末尾的残缺记录，之后的追加才能被读到
+    # after 为已知完整的记录边界（库中记录的日志位置），落在最后一段内时只检查其后的部分
+    all_segments = segments(directory)
+    if not all_segments:
+        return 0
+    start, path = all_segments[-1]
+    size = os.path.getsize(path)
+    end = after - start if start <= after <= start + size else 0
+    if size > end:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for lsn, _, _ in _scan(buffer, end, start):
+                end = lsn - start
+    if end != size:
+        logger.warning('日志段 %s 末尾有 %s 字节残缺记录，已截断', path, size - end)
+        os.truncate(path, end)
+    return start + end
+
+
+def prune_segments(directory, before):
+    # 删除结束位置不超过 before（保留的最旧快照的 LSN）的日志段，最后一段总是保留；返回删除的段数
+    all_segments = segments(directory)
+    removed = 0
+    for (_, path), (next_start, _) in zip(all_segments, all_segments[1:]):
+        if next_start > before:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            break
+        removed += 1
+    return removed
+
+
+def start_segment(directory, start):
+    # 新建一个从 start 开始的空段，之后的追加从这里继续
+    open(os.path.join(directory, _segment_name(start)), 'ab').close()
+
+
+class Journal:
+    def __init__(self, directory, fsync_interval=0.05, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._fd = None
+        self._segment_start = None
+        self._cond = threading.Condition()
+        self._written = 0  # 本进程写入的最后一条记录的 LSN
+        self._synced = 0
+        self._sync_requested = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.records = 0
+        self.fsyncs = 0
+
+    def _open_segment(self):
+        # 当前段写满后切换到下一段；下一段的起始位置由当前段的大小决定，各进程切换到同一个文件
+        if self._fd is None:
+            all_segments = segments(self.directory)
+            start = all_segments[-1][0] if all_segments else 0
+        else:
+            size = os.fstat(self._fd).st_size
+            if size < self.segment_bytes:
+                return
+            start = self._segment_start + size
+            os.fsync(self._fd)
+            os.close(self._fd)
+        self._fd = os.open(os.path.join(self.directory, _segment_name(start)),
+                           os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment_start = start
+        # 其他进程可能已经写满并切换了这一段
+        self._open_segment()
+
+    def append(self, op, data, ts=None):
+        # 必须在持有数据库写锁时调用；返回记录的 LSN，持久化需要再调用 wait(lsn)
+        return self.write([encode(op, data, time.time() if ts is None else ts)])[-1]
+
+    def write(self, records):
+        # 一次写入多条 encode() 编码好的记录，返回各条记录的 LSN；调用要求同 append
+        payload = b''.join(records)
+        with self._cond:
+            self._open_segment()
+            os.write(self._fd, payload)
+            end = self._segment_start + os.lseek(self._fd, 0, os.SEEK_CUR)
+            lsns = []
+            lsn = end - len(payload)
+            for record in records:
+                lsn += len(record)
+                lsns.append(lsn)
+            self._written = end
+            self.records += len(records)
+            return lsns
+
+    def wait(self, lsn, timeout=5.0):
+        # 等待 lsn 之前的记录 fsync 完成；同时等待的请求由后台线程的同一次 fsync 一起确认
+        if lsn is None:
+            return True
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._synced < lsn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return self._synced >= lsn
+                self._sync_requested = True
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+        return True
+
+    def sync(self):
+        with self._cond:
+            fd = self._fd
+            target = self._written
+        if fd is None or target <= self._synced:
+            return
+        os.fsync(fd)
+        with self._cond:
+            self.fsyncs += 1
+            self._synced = max(self._synced, target)
+            self._cond.notify_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                if not self._sync_requested:
+                    self._cond.wait(self.fsync_interval)
+                self._sync_requested = False
+            try:
+                self.sync()
+            except OSError:
+                logger.exception('日志 fsync 失败')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='journal-fsync', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sync()
+        with self._cond:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._cond.notify_all()
+
+
+# ---- 快照 ----
+
+def snapshot_files(directory):
+    # 按 LSN 排序的 [(LSN, 路径)]
+    result = []
+    for name in os.listdir(directory):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX):
+            try:
+                result.append((int(name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)], 16),
+                               os.path.join(directory, name)))
+            except ValueError:
+                continue
+    return sorted(result)
+
+
+def write_snapshot(directory, lsn, tables, ts=None):
+    # tables 为 {表名: (列名列表, 行列表)}；先写临时文件并 fsync，再原子改名
+    # 文件第一行是 JSON 头（LSN、时间、各表列名和在文件中的位置），之后是各表的 JSON 行数组
+    ts = time.time() if ts is None else ts
+    bodies = []
+    index = {}
+    offset = 0
+    for name, (columns, rows) in tables.items():
+        body = json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        index[name] = {'columns': list(columns), 'offset': offset, 'length': len(body),
+                       'crc': zlib.crc32(body), 'rows': len(rows)}
+        bodies.append(body)
+        offset += len(body)
+    header = json.dumps({'version': SNAPSHOT_VERSION, 'lsn': lsn, 'ts': ts, 'tables': index},
+                        ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+    path = os.path.join(directory, f'{SNAPSHOT_PREFIX}{lsn:016x}{SNAPSHOT_SUFFIX}')
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        for body in bodies:
+            f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return path
+
+
+def snapshot_header(path):
+    # 只读取快照的头信息（LSN、时间、版本等）
+    with open(path, 'rb') as f:
+        return json.loads(f.readline())
+
+
+def load_snapshot(path):
+    # 内存映射读取快照，返回 (头信息, {表名: (列名列表, 行列表)})；校验失败抛出 ValueError
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        newline = buffer.find(b'\n')
+        if newline < 0:
+            raise ValueError(f'快照文件损坏: {path}')
+        header = json.loads(buffer[:newline])
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f'不支持的快照版本: {path}')
+        base = newline + 1
+        tables = {}
+        for name, info in header['tables'].items():
+            body = buffer[base + info['offset']:base + info['offset'] + info['length']]
+            if len(body) != info['length'] or zlib.crc32(body) != info['crc']:
+                raise ValueError(f'快照文件损坏: {path}')
+            tables[name] = (info['columns'], json.loads(body))
+    return header, tables
+
+
+def prune_snapshots(directory, keep):
+    # 只保留最近的 keep 个快照
+    files = snapshot_files(directory)
+    for _, path in files[:-keep] if keep > 0 else []:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,159 @@
+# 列表查询：基于游标的分页（keyset，不使用 OFFSET）、过滤条件和字段投影
+# 游标是上一页最后一行的排序键，经 base64 编码后对客户端不透明
+import base64
+import json
+from datetime import datetime, timedelta
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+LIST_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_stocks_created ON stocks (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_symbol_date ON transactions (symbol, date, id)',
+]
+
+# 迁移 7 起所有列表查询都限定在一个账户内，索引以 account_id 开头，替换上面的全局索引
+ACCOUNT_INDEXES = [
+    'DROP INDEX IF EXISTS idx_stocks_created',
+    'DROP INDEX IF EXISTS idx_transactions_date',
+    'DROP INDEX IF EXISTS idx_transactions_symbol_date',
+    'CREATE INDEX IF NOT EXISTS idx_stocks_account_created ON stocks (account_id, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_account_symbol_date '
+    'ON transactions (account_id, symbol, date, id)',
+]
+
+TRANSACTION_FIELDS = ('id', 'symbol', 'type', 'price', 'quantity', 'date')
+
+
+def create_indexes(c):
+    for sql in LIST_INDEXES:
+        c.execute(sql)
+
+
+def create_account_indexes(c):
+    for sql in ACCOUNT_INDEXES:
+        c.execute(sql)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('cursor 无效')
+    # 排序键为 [时间文本, 行编号]，类型不符时不能直接作为查询参数
+    if (not isinstance(key, list) or len(key) != 2 or not isinstance(key[0], str)
+            or not isinstance(key[1], int) or isinstance(key[1], bool)):
+        raise ValueError('cursor 无效')
+    return key
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit 必须是整数')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def parse_fields(value, allowed):
+    # fields=a,b,c；不传时返回全部字段
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError('未知字段: ' + ', '.join(unknown))
+    return fields
+
+
+def project(rows, fields):
+    if fields is None:
+        return rows
+    return [{field: row[field] for field in fields} for row in rows]
+
+
+def _date_range(conditions, params, column, date_from, date_to):
+    # 时间按 'YYYY-MM-DD HH:MM:SS' 文本比较；只给日期的结束时间包含当天
+    if date_from:
+        conditions.append(f'{column} >= ?')
+        params.append(_normalize_time(date_from))
+    if date_to:
+        value = _normalize_time(date_to)
+        if len(date_to) == 10:
+            next_day = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+            conditions.append(f'{column} < ?')
+            params.append(next_day.strftime('%Y-%m-%d'))
+        else:
+            conditions.append(f'{column} <= ?')
+            params.append(value)
+
+
+def _normalize_time(value):
+    try:
+        if len(value) == 10:
+            return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise ValueError(f'时间格式错误: {value}')
+
+
+def _page(c, sql, conditions, params, order_columns, cursor, limit):
+    # 按 order_columns 倒序分页，多取一行判断是否还有下一页
+    if cursor:
+        key = decode_cursor(cursor)
+        conditions.append(f'({", ".join(order_columns)}) < (?, ?)')
+        params.extend(key)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY ' + ', '.join(f'{column} DESC' for column in order_columns)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    c.execute(sql, params)
+    rows = c.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]
+    return rows, next_cursor
+
+
+def query_stocks(c, account_id, symbol=None, date_from=None, date_to=None, cursor=None, limit=None):
+    # 返回 (stocks 行, 下一页游标)，排序与监控列表一致：created_at, id 倒序
+    conditions = ['account_id = ?']
+    params = [account_id]
+    if symbol:
+        conditions.append('symbol = ?')
+        params.append(symbol)
+    _date_range(conditions, params, 'created_at', date_from, date_to)
+    rows, last = _page(c, 'SELECT * FROM stocks', conditions, params,
+                       ('created_at', 'id'), cursor, limit)
+    return rows, encode_cursor([last[5], last[0]]) if last else None
+
+
+def query_transactions(c, account_id, symbol=None, trade_type=None, date_from=None, date_to=None,
+                       cursor=None, limit=DEFAULT_LIMIT):
+    conditions = ['account_id = ?']
+    params = [account_id]
+    if symbol:
+        conditions.append('symbol = ?')
+        params.append(symbol)
+    if trade_type:
+        if trade_type not in ('buy', 'sell'):
+            raise ValueError('type 必须是 buy 或 sell')
+        conditions.append('type = ?')
+        params.append(trade_type)
+    _date_range(conditions, params, 'date', date_from, date_to)
+    rows, last = _page(c, f'SELECT {", ".join(TRANSACTION_FIELDS)} FROM transactions',
+                       conditions, params, ('date', 'id'), cursor, limit)
+    items = [dict(zip(TRANSACTION_FIELDS, row)) for row in rows]
+    return items, encode_cursor([last[5], last[0]]) if last else None
@@ -0,0 +1,444 @@
+# 持仓批次（lot）核算：每笔买入形成一个批次，卖出按成本法消耗批次并计算已实现盈亏
+# 成本法由 COST_METHOD 配置：fifo（默认，先进先出）/ lifo（后进先出）/ average（移动加权平均，每个代码一个批次）
+# positions 表保存每个账户每个代码的持仓数量、未平仓批次的成本和累计已实现盈亏，lots 表保存未平仓批次
+# 卖出数量超过持仓时拒绝（OversellError），该笔交易不写入
+# 批次按交易写入的顺序（transactions.id）排列，增量处理与全量重建使用同一顺序
+import importlib.util
+import os
+from collections import deque
+from itertools import groupby
+
+import accounts
+
+# numpy 为可选依赖，没有时全量重建逐行计算；只有全量重建用到，首次使用时才导入，不计入启动时间
+np = None
+HAVE_NUMPY = importlib.util.find_spec('numpy') is not None
+
+
+def _load_numpy():
+    global np
+    if np is None and HAVE_NUMPY:
+        import numpy
+        np = numpy
+    return np
+
+METHODS = ('fifo', 'lifo', 'average')
+
+# 从数据库按消耗顺序分页读取批次的页大小
+PAGE_SIZE = 256
+
+LOTS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS lots (
+        id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_lots_symbol ON lots (symbol, id)',
+    # 记录当前批次数据对应的成本法，成本法变化后需要全量重建
+    'CREATE TABLE IF NOT EXISTS ledger_settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)',
+]
+
+# 迁移 7 添加 account_id 列后，批次按 (account_id, symbol, id) 索引
+ACCOUNT_LOTS_INDEX = 'CREATE INDEX IF NOT EXISTS idx_lots_account_symbol ON lots (account_id, symbol, id)'
+
+_UPSERT_POSITION = '''
+    INSERT INTO positions (account_id, symbol, quantity, cost, realized) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(account_id, symbol) DO UPDATE SET
+        quantity = excluded.quantity, cost = excluded.cost, realized = excluded.realized
+'''
+
+
+class OversellError(ValueError):
+    def __init__(self, symbol, quantity, available):
+        super().__init__(f'{symbol} 卖出数量 {quantity} 超过持仓 {available}')
+        self.symbol = symbol
+        self.quantity = quantity
+        self.available = available
+
+
+def create_tables(c):
+    for sql in LOTS_SCHEMA:
+        c.execute(sql)
+
+
+def method_from_env():
+    method = os.environ.get('COST_METHOD', 'fifo').lower()
+    if method not in METHODS:
+        raise ValueError(f'未知的成本法: {method}')
+    return method
+
+
+class _SymbolState:
+    # 单个代码在本批处理中的状态；loaded 为按消耗顺序从数据库读出的批次 [id, 数量, 价格]
+    __slots__ = ('quantity', 'cost', 'realized', 'loaded', 'boundary', 'exhausted',
+                 'new_lots', 'deleted', 'updated')
+
+    def __init__(self, quantity, cost, realized):
+        self.quantity = quantity
+        self.cost = cost
+        self.realized = realized
+        self.loaded = deque()
+        self.boundary = None  # 已读取到的批次 id
+        self.exhausted = False
+        self.new_lots = deque()  # 本批新建、尚未写入的批次
+        self.deleted = []
+        self.updated = {}
+
+
+class LotBook:
+    # 在一个写事务内逐笔处理一个账户的交易，flush() 时把变化的批次和持仓写回数据库
+    # 每笔交易只读取消耗端需要的批次（按索引分页），代价与被消耗的批次数成正比
+    def __init__(self, c, method='fifo', account_id=accounts.DEFAULT_ACCOUNT):
+        if method not in METHODS:
+            raise ValueError(f'未知的成本法: {method}')
+        self.c = c
+        self.method = method
+        self.account_id = account_id
+        self._states = {}
+        self._next_id = None
+
+    def _state(self, symbol):
+        state = self._states.get(symbol)
+        if state is None:
+            self.c.execute('SELECT quantity, cost, realized FROM positions WHERE account_id = ? AND symbol = ?',
+                           (self.account_id, symbol))
+            row = self.c.fetchone()
+            state = self._states[symbol] = _SymbolState(*(row or (0, 0.0, 0.0)))
+        return state
+
+    def _new_id(self):
+        if self._next_id is None:
+            self.c.execute('SELECT COALESCE(MAX(id), 0) FROM lots')
+            self._next_id = self.c.fetchone()[0]
+        self._next_id += 1
+        return self._next_id
+
+    def position(self, symbol):
+        state = self._state(symbol)
+        return state.quantity, state.cost, state.realized
+
+    def trade(self, symbol, trade_type, price, quantity):
+        # 返回该笔交易产生的已实现盈亏；卖出超过持仓时抛出 OversellError，状态不变
+        state = self._state(symbol)
+        if trade_type == 'buy':
+            if self.method != 'average':
+                state.new_lots.append([self._new_id(), quantity, price])
+            state.quantity += quantity
+            state.cost += price * quantity
+            return 0.0
+
+        if quantity > state.quantity:
+            raise OversellError(symbol, quantity, state.quantity)
+        if quantity == state.quantity:
+            basis = state.cost
+        elif self.method == 'average':
+            basis = state.cost * quantity / state.quantity
+        else:
+            basis = self._consume(symbol, state, quantity)
+        if self.method != 'average' and quantity == state.quantity:
+            self._consume(symbol, state, quantity)
+        realized = price * quantity - basis
+        state.quantity -= quantity
+        state.cost = state.cost - basis if state.quantity else 0.0
+        state.realized += realized
+        return realized
+
+    def _load_page(self, symbol, state):
+        if self.method == 'fifo':
+            sql = ('SELECT id, quantity, price FROM lots WHERE account_id = ? AND symbol = ? AND id > ? '
+                   'ORDER BY id LIMIT ?')
+            boundary = state.boundary if state.boundary is not None else 0
+        else:
+            sql = ('SELECT id, quantity, price FROM lots WHERE account_id = ? AND symbol = ? AND id < ? '
+                   'ORDER BY id DESC LIMIT ?')
+            boundary = state.boundary if state.boundary is not None else float('inf')
+        self.c.execute(sql, (self.account_id, symbol, boundary, PAGE_SIZE))
+        rows = self.c.fetchall()
+        state.loaded.extend([list(row) for row in rows])
+        if rows:
+            state.boundary = rows[-1][0]
+        state.exhausted = len(rows) < PAGE_SIZE
+
+    def _next_lot(self, symbol, state):
+        # fifo：先消耗数据库中较早的批次，再消耗本批新建的；lifo 相反
+        if self.method == 'lifo' and state.new_lots:
+            return state.new_lots, state.new_lots[-1], False
+        if not state.loaded and not state.exhausted:
+            self._load_page(symbol, state)
+        if state.loaded:
+            return state.loaded, state.loaded[0], True
+        return state.new_lots, state.new_lots[0], False
+
+    def _consume(self, symbol, state, quantity):
+        basis = 0.0
+        while quantity > 0:
+            lots, lot, stored = self._next_lot(symbol, state)
+            take = min(quantity, lot[1])
+            basis += take * lot[2]
+            lot[1] -= take
+            quantity -= take
+            if lot[1] == 0:
+                if lots is state.new_lots and self.method == 'lifo':
+                    lots.pop()
+                else:
+                    lots.popleft()
+                if stored:
+                    state.deleted.append(lot[0])
+                    state.updated.pop(lot[0], None)
+            elif stored:
+                state.updated[lot[0]] = lot
+        return basis
+
+    def flush(self):
+        deleted = []
+        updated = []
+        inserted = []
+        average_symbols = []
+        rows = []
+        account_id = self.account_id
+        for symbol, state in self._states.items():
+            rows.append((account_id, symbol, state.quantity, state.cost, state.realized))
+            if self.method == 'average':
+                average_symbols.append((account_id, symbol))
+                if state.quantity:
+                    inserted.append((self._new_id(), account_id, symbol, state.quantity,
+                                     state.cost / state.quantity))
+                continue
+            deleted.extend((lot_id,) for lot_id in state.deleted)
+            updated.extend((lot[1], lot[0]) for lot in state.updated.values())
+            inserted.extend((lot[0], account_id, symbol, lot[1], lot[2]) for lot in state.new_lots)
+        c = self.c
+        if average_symbols:
+            c.executemany('DELETE FROM lots WHERE account_id = ? AND symbol = ?', average_symbols)
+        if deleted:
+            c.executemany('DELETE FROM lots WHERE id = ?', deleted)
+        if updated:
+            c.executemany('UPDATE lots SET quantity = ? WHERE id = ?', updated)
+        if inserted:
+            c.executemany('INSERT INTO lots (id, account_id, symbol, quantity, price) VALUES (?, ?, ?, ?, ?)',
+                          inserted)
+        if rows:
+            c.executemany(_UPSERT_POSITION, rows)
+        self._states.clear()
+
+
+def apply_trade(c, symbol, trade_type, price, quantity, method='fifo', account_id=accounts.DEFAULT_ACCOUNT):
+    # 单笔交易；调用方负责在同一事务中写入交易记录并提交
+    book = LotBook(c, method, account_id)
+    realized = book.trade(symbol, trade_type, price, quantity)
+    book.flush()
+    return realized
+
+
+def open_lots(c, account_id, symbol):
+    c.execute('SELECT id, quantity, price FROM lots WHERE account_id = ? AND symbol = ? ORDER BY id',
+              (account_id, symbol))
+    return [{'id': row[0], 'quantity': row[1], 'price': row[2]} for row in c.fetchall()]
+
+
+# ---- 全量重建 ----
+
+def _replay(key, trades, method):
+    # 逐笔计算一个账户一个代码的结果：(持仓行, 未平仓批次 [(数量, 价格)], 被拒绝的卖出笔数)
+    # key 为 (账户, 代码)
+    lots = deque()
+    quantity = 0
+    cost = 0.0
+    realized = 0.0
+    rejected = 0
+    for trade_type, price, qty in trades:
+        if trade_type == 'buy':
+            quantity += qty
+            cost += price * qty
+            if method != 'average':
+                lots.append([qty, price])
+            continue
+        if qty > quantity:
+            rejected += 1
+            continue
+        if qty == quantity:
+            basis = cost
+            lots.clear()
+        elif method == 'average':
+            basis = cost * qty / quantity
+        else:
+            basis = 0.0
+            remaining = qty
+            while remaining:
+                lot = lots[0] if method == 'fifo' else lots[-1]
+                take = min(remaining, lot[0])
+                basis += take * lot[1]
+                lot[0] -= take
+                remaining -= take
+                if lot[0] == 0:
+                    lots.popleft() if method == 'fifo' else lots.pop()
+        realized += price * qty - basis
+        quantity -= qty
+        cost = cost - basis if quantity else 0.0
+    if method == 'average':
+        open_lots = [(quantity, cost / quantity)] if quantity else []
+    else:
+        open_lots = [tuple(lot) for lot in lots]
+    return key + (quantity, cost, realized), open_lots, rejected
+
+
+def _group_cumsum(values, starts, counts):
+    # 组内累加：全局累加减去每组起点之前的累计值
+    total = np.cumsum(values)
+    offsets = np.repeat(total[starts] - values[starts], counts)
+    return total - offsets
+
+
+def _fifo_vectorized(account_ids, symbols, types, prices, quantities):
+    # 先进先出的批量计算：每个 (账户, 代码) 为一组，行已按组排序
+    # 把每组买入看作数量轴上首尾相接的区间，成本函数 F(x) 为前 x 股的总成本
+    # 第 j 笔卖出消耗区间 [S(j-1), S(j)]，成本 = F(S(j)) - F(S(j-1))，S 为组内累计卖出数量
+    # 有超卖的组需要逐笔跳过被拒绝的卖出，交给 _replay 处理
+    acc = np.asarray(account_ids)
+    sym = np.asarray(symbols)
+    n = len(sym)
+    change = np.empty(n, dtype=bool)
+    change[0] = True
+    np.not_equal(sym[1:], sym[:-1], out=change[1:])
+    change[1:] |= acc[1:] != acc[:-1]
+    starts = np.flatnonzero(change)
+    counts = np.diff(np.append(starts, n))
+    group = np.repeat(np.arange(len(starts)), counts)
+
+    is_buy = np.asarray(types) == 'buy'
+    price = np.asarray(prices, dtype=np.float64)
+    qty = np.asarray(quantities, dtype=np.float64)
+    buy_qty = np.where(is_buy, qty, 0.0)
+    sell_qty = qty - buy_qty
+    cum_buy = _group_cumsum(buy_qty, starts, counts)
+    cum_sell = _group_cumsum(sell_qty, starts, counts)
+    cum_cost = _group_cumsum(buy_qty * price, starts, counts)
+
+    oversold = np.zeros(len(starts), dtype=bool)
+    oversold[group[~is_buy & (cum_sell > cum_buy)]] = True
+
+    # 各组的数量轴错开 stride，使所有组的区间端点整体有序，可一次 searchsorted
+    total_buy = cum_buy[starts + counts - 1]
+    total_sell = cum_sell[starts + counts - 1]
+    stride = float(total_buy.max()) + 1.0
+    valid = ~oversold[group]
+    buys = np.flatnonzero(is_buy & valid)
+    local_ends = cum_buy[buys]
+    ends = local_ends + group[buys] * stride
+    end_costs = cum_cost[buys]
+    buy_prices = price[buys]
+
+    def cost_at(x, g):
+        # 组 g 内前 x 股的成本；x = 0 时落在该组第一个批次上，结果为 0
+        i = np.searchsorted(ends, x + g * stride, side='left')
+        return end_costs[i] - (local_ends[i] - x) * buy_prices[i]
+
+    sells = np.flatnonzero(~is_buy & valid)
+    realized = np.zeros(len(starts))
+    if len(sells):
+        g = group[sells]
+        basis = cost_at(cum_sell[sells], g) - cost_at(cum_sell[sells] - sell_qty[sells], g)
+        realized = np.bincount(g, weights=price[sells] * sell_qty[sells] - basis, minlength=len(starts))
+
+    quantity = total_buy - total_sell
+    group_cost = np.zeros(len(starts))
+    open_groups = np.flatnonzero(valid[starts] & (quantity > 0))
+    if len(open_groups):
+        group_cost[open_groups] = (cum_cost[starts + counts - 1][open_groups]
+                                   - cost_at(total_sell[open_groups], open_groups))
+
+    # 未平仓批次：区间终点超过累计卖出数量的买入，第一个可能只剩一部分
+    buy_groups = group[buys]
+    remaining = np.minimum(qty[buys], cum_buy[buys] - total_sell[buy_groups])
+    keep = remaining > 0
+
+    positions = []
+    replay = []
+    for i in range(len(starts)):
+        if oversold[i]:
+            replay.append(i)
+            continue
+        start = starts[i]
+        positions.append((account_ids[start], symbols[start], int(quantity[i]),
+                          float(group_cost[i]) if quantity[i] else 0.0, float(realized[i])))
+    lots = [(account_ids[starts[g]], symbols[starts[g]], int(q), float(p))
+            for g, q, p in zip(buy_groups[keep].tolist(), remaining[keep].tolist(), buy_prices[keep].tolist())]
+    return positions, lots, [(starts[i], counts[i]) for i in replay]
+
+
+def compute(c, method='fifo'):
+    # 从全部交易记录计算持仓和未平仓批次，返回
+    # ([(账户, 代码, 数量, 成本, 已实现盈亏)], [(账户, 代码, 数量, 价格)], 被拒绝笔数)
+    c.execute('SELECT account_id, symbol, type, price, quantity FROM transactions ORDER BY account_id, symbol, id')
+    rows = c.fetchall()
+    if not rows:
+        return [], [], 0
+    positions = []
+    lots = []
+    rejected = 0
+    if method == 'fifo' and _load_numpy() is not None:
+        positions, lots, replay = _fifo_vectorized(*zip(*rows))
+        groups = [(rows[start][:2], [row[2:] for row in rows[start:start + count]]) for start, count in replay]
+    else:
+        groups = [(key, [row[2:] for row in trades]) for key, trades in groupby(rows, key=lambda r: r[:2])]
+    for key, trades in groups:
+        position, symbol_lots, symbol_rejected = _replay(key, trades, method)
+        positions.append(position)
+        lots.extend(key + (q, p) for q, p in symbol_lots)
+        rejected += symbol_rejected
+    return positions, lots, rejected
+
+
+def partial_history(c):
+    # 库由日志快照恢复时快照之前的交易记录不在库中（recovery.restore_snapshot 写入该标记），不能按交易记录重算
+    c.execute("SELECT EXISTS(SELECT 1 FROM ledger_settings WHERE name = 'history_from')")
+    return bool(c.fetchone()[0])
+
+
+def _require_full_history(c):
+    if partial_history(c):
+        raise ValueError('库由快照恢复，交易记录不完整，不能按交易记录重算持仓')
+
+
+def rebuild(c, method='fifo'):
+    # 全量重建 positions 和 lots，返回 (持仓行数, 被拒绝的卖出笔数)；调用方负责提交事务
+    _require_full_history(c)
+    positions, lots, rejected = compute(c, method)
+    c.execute('DELETE FROM lots')
+    c.execute('DELETE FROM positions')
+    c.executemany('INSERT INTO positions (account_id, symbol, quantity, cost, realized) VALUES (?, ?, ?, ?, ?)',
+                  positions)
+    c.executemany('INSERT INTO lots (account_id, symbol, quantity, price) VALUES (?, ?, ?, ?)', lots)
+    c.execute("INSERT INTO ledger_settings (name, value) VALUES ('cost_method', ?) "
+              "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (method,))
+    return len(positions), rejected
+
+
+def ensure_method(c, method):
+    # 成本法与已有批次数据不一致时全量重建，返回是否重建
+    c.execute("SELECT value FROM ledger_settings WHERE name = 'cost_method'")
+    row = c.fetchone()
+    if row is not None and row[0] == method:
+        return False
+    rebuild(c, method)
+    return True
+
+
+def verify(c, method='fifo', tolerance=1e-6):
+    # 对比持仓表与交易记录重算的结果，返回不一致的 ((账户, 代码), 期望值, 实际值) 列表
+    _require_full_history(c)
+    positions, _, _ = compute(c, method)
+    expected = {row[:2]: row[2:] for row in positions}
+    c.execute('SELECT account_id, symbol, quantity, cost, realized FROM positions')
+    actual = {row[:2]: row[2:] for row in c.fetchall()}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        exp = expected.get(key, (0, 0.0, 0.0))
+        act = actual.get(key, (0, 0.0, 0.0))
+        if exp[0] != act[0] or any(abs(e - a) > tolerance * max(1.0, abs(e)) for e, a in zip(exp[1:], act[1:])):
+            mismatches.append((key, exp, act))
+    return mismatches
@@ -0,0 +1,223 @@
+# 运行指标：计数器与直方图，输出 Prometheus 文本格式
+# 热路径上不加锁：每个线程写自己的分片，抓取时再合并；线程退出后其分片并入 retired 汇总
+import bisect
+import os
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 分片数超过该值时，注册新分片前先合并已退出线程的分片
+_MAX_SHARDS = 64
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    # 每个线程一个 {标签值元组: 数值列表} 的分片；列表按元素相加合并
+    def __init__(self, name, help_text, labels, size):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                if len(self._shards) >= _MAX_SHARDS:
+                    self._fold_dead()
+                self._shards.append((threading.current_thread(), shard))
+            self._local.shard = shard
+        return shard
+
+    def _slot(self, labels):
+        shard = self._shard()
+        values = shard.get(labels)
+        if values is None:
+            values = shard[labels] = [0] * self._size
+        return values
+
+    @staticmethod
+    def _merge(target, shard):
+        for labels, values in list(shard.items()):
+            total = target.get(labels)
+            if total is None:
+                target[labels] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    total[i] += value
+
+    def _fold_dead(self):
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = alive
+
+    def collect(self):
+        with self._lock:
+            self._fold_dead()
+            result = {labels: list(values) for labels, values in self._retired.items()}
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            self._merge(result, shard)
+        return result
+
+
+class Counter(_Sharded):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels, 1)
+
+    def inc(self, *labels, amount=1):
+        self._slot(labels)[0] += amount
+
+    def render(self):
+        lines = []
+        for labels, (value,) in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(_Sharded):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # 数值列表：各桶计数（含 +Inf），最后一个元素为总和
+        super().__init__(name, help_text, labels, len(self.buckets) + 2)
+
+    def observe(self, value, *labels):
+        values = self._slot(labels)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def render(self):
+        lines = []
+        for labels, values in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                bucket_labels = _format_labels(self.labels, labels, 'le="%s"' % le)
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(values[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Gauge:
+    # 抓取时调用 callback 取值；callback 返回数值，或 [(标签值元组, 数值)]
+    # 回调读取的是其他对象已有的累计值时 kind 设为 counter
+    def __init__(self, name, help_text, callback, labels=(), kind='gauge'):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+
+    def render(self):
+        value = self.callback()
+        samples = value if isinstance(value, list) else [((), value)]
+        return [f'{self.name}{_format_labels(self.labels, labels)} {_format_value(sample)}'
+                for labels, sample in samples if sample is not None]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, callback, labels=(), kind='gauge'):
+        # 同名 gauge 以最后注册的回调为准（应用重新初始化时会重新绑定）
+        metric = Gauge(name, help_text, callback, labels, kind)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.render()
+            except Exception as e:
+                lines.append(f'# {metric.name} 采集失败: {_escape(e)}')
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+def process_memory():
+    # 当前常驻内存（字节）；没有 /proc 时退回到峰值常驻内存
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'stock_monitor_http_requests_total', '按路由统计的请求数', ('route', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'stock_monitor_http_request_duration_seconds', '按路由统计的请求耗时', ('route', 'method'))
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    'stock_monitor_sqlite_query_duration_seconds', '按语句类型统计的 SQLite 执行耗时', ('kind',))
+PROVIDER_LATENCY = REGISTRY.histogram(
+    'stock_monitor_quote_provider_duration_seconds', '报价源调用耗时', ('provider',))
+PROVIDER_ERRORS = REGISTRY.counter(
+    'stock_monitor_quote_provider_errors_total', '报价源调用失败次数', ('provider',))
+REGISTRY.gauge('stock_monitor_process_resident_memory_bytes', '进程常驻内存', process_memory)
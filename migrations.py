@@ -0,0 +1,285 @@
+# 数据库结构的版本化迁移，由 db.Database.migrate 按版本号依次执行
+# 新的结构变更只能追加新版本，已发布的版本不要修改
+import itertools
+import unicodedata
+from collections import deque
+
+import accounts
+import alerts
+import listing
+import lots
+import positions
+import recovery
+import shared
+
+
+def initial_schema(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS stocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            name TEXT,
+            high_price REAL,
+            low_price REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            type TEXT,
+            price REAL,
+            quantity INTEGER,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    positions.create_tables(c)
+
+
+def alert_rules(c):
+    alerts.create_tables(c)
+    # 监控列表里已有的高/低价提醒转为提醒规则
+    c.execute('''
+        INSERT INTO alert_rules (symbol, direction, threshold, stock_id)
+        SELECT symbol, 'above', high_price, id FROM stocks WHERE high_price IS NOT NULL
+    ''')
+    c.execute('''
+        INSERT INTO alert_rules (symbol, direction, threshold, stock_id)
+        SELECT symbol, 'below', low_price, id FROM stocks WHERE low_price IS NOT NULL
+    ''')
+
+
+def unique_stock_symbols(c):
+    # 同一代码只保留最早的一行，提醒规则指向保留的行，之后由唯一索引保证不再重复
+    c.execute('''
+        UPDATE alert_rules SET stock_id = (
+            SELECT MIN(s2.id) FROM stocks s1 JOIN stocks s2 ON s2.symbol = s1.symbol
+            WHERE s1.id = alert_rules.stock_id
+        )
+        WHERE stock_id IS NOT NULL
+    ''')
+    c.execute('DELETE FROM stocks WHERE id NOT IN (SELECT MIN(id) FROM stocks GROUP BY symbol)')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_stocks_symbol ON stocks (symbol)')
+
+
+def list_indexes(c):
+    listing.create_indexes(c)
+
+
+def shared_quotes(c):
+    shared.create_tables(c)
+
+
+def lot_accounting(c):
+    # 持仓成本改为按批次核算（原先卖出金额直接从成本中扣除），并记录已实现盈亏
+    lots.create_tables(c)
+    c.execute('ALTER TABLE positions ADD COLUMN realized REAL NOT NULL DEFAULT 0')
+    _rebuild_lots_by_symbol(c, lots.method_from_env())
+
+
+def _replay(trades, method):
+    # 迁移 6、7 发布时 lots._replay 的核算规则，迁移使用这个固定的版本
+    # trades 为按交易顺序的 [(类型, 价格, 数量)]，返回 (数量, 成本, 已实现盈亏, 未平仓批次 [(数量, 价格)])
+    open_lots = deque()
+    quantity = 0
+    cost = 0.0
+    realized = 0.0
+    for trade_type, price, qty in trades:
+        if trade_type == 'buy':
+            quantity += qty
+            cost += price * qty
+            if method != 'average':
+                open_lots.append([qty, price])
+            continue
+        if qty > quantity:
+            continue
+        if qty == quantity:
+            basis = cost
+            open_lots.clear()
+        elif method == 'average':
+            basis = cost * qty / quantity
+        else:
+            basis = 0.0
+            remaining = qty
+            while remaining:
+                lot = open_lots[0] if method == 'fifo' else open_lots[-1]
+                take = min(remaining, lot[0])
+                basis += take * lot[1]
+                lot[0] -= take
+                remaining -= take
+                if lot[0] == 0:
+                    open_lots.popleft() if method == 'fifo' else open_lots.pop()
+        realized += price * qty - basis
+        quantity -= qty
+        cost = cost - basis if quantity else 0.0
+    if method == 'average':
+        return quantity, cost, realized, [(quantity, cost / quantity)] if quantity else []
+    return quantity, cost, realized, [tuple(lot) for lot in open_lots]
+
+
+def _save_cost_method(c, method):
+    c.execute("INSERT INTO ledger_settings (name, value) VALUES ('cost_method', ?) "
+              "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (method,))
+
+
+def _rebuild_lots_by_symbol(c, method):
+    # 迁移 6 发布时 lots.rebuild 的行为：此时各表还没有 account_id 列，按代码重建批次和持仓
+    # lots.rebuild 之后改为按账户重建，迁移 6 使用这个固定的版本
+    c.execute('SELECT symbol, type, price, quantity FROM transactions ORDER BY symbol, id')
+    positions = []
+    open_lots = []
+    for symbol, trades in itertools.groupby(c.fetchall(), key=lambda row: row[0]):
+        quantity, cost, realized, symbol_lots = _replay([row[1:] for row in trades], method)
+        positions.append((symbol, quantity, cost, realized))
+        open_lots.extend((symbol, lot_quantity, price) for lot_quantity, price in symbol_lots)
+    c.execute('DELETE FROM lots')
+    c.execute('DELETE FROM positions')
+    c.executemany('INSERT INTO positions (symbol, quantity, cost, realized) VALUES (?, ?, ?, ?)', positions)
+    c.executemany('INSERT INTO lots (symbol, quantity, price) VALUES (?, ?, ?)', open_lots)
+    _save_cost_method(c, method)
+
+
+def _rebuild_lots_by_account(c, method):
+    # 迁移 7 发布时 lots.rebuild 的行为：按 (账户, 代码) 重建批次和持仓，迁移 7 使用这个固定的版本
+    c.execute('SELECT account_id, symbol, type, price, quantity FROM transactions ORDER BY account_id, symbol, id')
+    positions = []
+    open_lots = []
+    for key, trades in itertools.groupby(c.fetchall(), key=lambda row: row[:2]):
+        quantity, cost, realized, key_lots = _replay([row[2:] for row in trades], method)
+        positions.append(key + (quantity, cost, realized))
+        open_lots.extend(key + lot for lot in key_lots)
+    c.execute('DELETE FROM lots')
+    c.execute('DELETE FROM positions')
+    c.executemany('INSERT INTO positions (account_id, symbol, quantity, cost, realized) VALUES (?, ?, ?, ?, ?)',
+                  positions)
+    c.executemany('INSERT INTO lots (account_id, symbol, quantity, price) VALUES (?, ?, ?, ?)', open_lots)
+    _save_cost_method(c, method)
+
+
+def account_partitions(c):
+    # 数据按账户分区，已有数据归入默认账户；代码唯一性改为账户内唯一
+    accounts.create_tables(c)
+    for table in ('stocks', 'transactions', 'lots', 'alert_rules', 'alert_events'):
+        c.execute(f'ALTER TABLE {table} ADD COLUMN account_id INTEGER NOT NULL DEFAULT {accounts.DEFAULT_ACCOUNT}')
+    c.execute('DROP INDEX IF EXISTS idx_stocks_symbol')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_stocks_account_symbol ON stocks (account_id, symbol)')
+    c.execute('DROP INDEX IF EXISTS idx_lots_symbol')
+    c.execute(lots.ACCOUNT_LOTS_INDEX)
+    listing.create_account_indexes(c)
+    alerts.create_account_indexes(c)
+    positions.partition_by_account(c, accounts.DEFAULT_ACCOUNT)
+    _rebuild_lots_by_account(c, lots.method_from_env())
+
+
+def journal_state(c):
+    # 记录库中已应用到的操作日志位置
+    recovery.create_tables(c)
+
+
+# 迁移 9 发布时 symbols.clean / split_exchange / qualify 的规范化规则（不依赖证券主数据）
+_EXCHANGES_V9 = {
+    'SH': 'SH', 'SS': 'SH', 'SSE': 'SH', 'XSHG': 'SH',
+    'SZ': 'SZ', 'SZSE': 'SZ', 'XSHE': 'SZ',
+    'BJ': 'BJ', 'BSE': 'BJ',
+}
+
+
+def _normalize_symbol_v9(symbol):
+    text = ''.join(unicodedata.normalize('NFKC', symbol).split()).upper()
+    code, exchange = text, None
+    for sep in ('.', ':'):
+        if sep in text:
+            left, _, right = text.partition(sep)
+            if right in _EXCHANGES_V9:
+                code, exchange = left, _EXCHANGES_V9[right]
+                break
+            if left in _EXCHANGES_V9:
+                code, exchange = right, _EXCHANGES_V9[left]
+                break
+    else:
+        if text[:2] in _EXCHANGES_V9 and text[2:].isdigit():
+            code, exchange = text[2:], _EXCHANGES_V9[text[:2]]
+    return f'{code}.{exchange}' if exchange else code
+
+
+def symbol_renames_v9(c):
+    # 迁移 9 要改写的代码 {原写法: 标准写法}
+    renames = {}
+    for table in ('stocks', 'transactions', 'positions', 'lots', 'alert_rules', 'alert_events'):
+        c.execute(f'SELECT DISTINCT symbol FROM {table}')
+        for (symbol,) in c.fetchall():
+            normalized = _normalize_symbol_v9(symbol)
+            if normalized and normalized != symbol:
+                renames[symbol] = normalized
+    return renames
+
+
+def normalize_symbols(c):
+    # 新写入的代码统一为标准写法（600000.SH），已有数据中的 sh600000、SH:600000 等写法改为标准写法
+    # 改名后同一账户内重复的监控行、持仓和批次合并，规则同迁移发布时的 recovery.rename_symbols
+    renames = symbol_renames_v9(c)
+    if not renames:
+        return
+    c.execute("SELECT value FROM ledger_settings WHERE name = 'cost_method'")
+    row = c.fetchone()
+    method = row[0] if row else lots.method_from_env()
+    c.execute('CREATE TEMP TABLE symbol_renames_v9 (old TEXT PRIMARY KEY, new TEXT NOT NULL)')
+    c.executemany('INSERT INTO symbol_renames_v9 (old, new) VALUES (?, ?)', list(renames.items()))
+
+    c.execute('SELECT id, account_id, symbol FROM stocks ORDER BY id')
+    kept = {}
+    merged = []
+    renamed = []
+    for stock_id, account_id, symbol in c.fetchall():
+        new = renames.get(symbol, symbol)
+        if (account_id, new) in kept:
+            merged.append((kept[account_id, new], stock_id))
+            continue
+        kept[account_id, new] = stock_id
+        if new != symbol:
+            renamed.append((new, stock_id))
+    c.executemany('UPDATE alert_rules SET stock_id = ? WHERE stock_id = ?', merged)
+    c.executemany('DELETE FROM stocks WHERE id = ?', [(stock_id,) for _, stock_id in merged])
+    c.executemany('UPDATE stocks SET symbol = ? WHERE id = ?', renamed)
+
+    for table in ('transactions', 'lots', 'alert_rules', 'alert_events'):
+        c.execute(f'''
+            UPDATE {table} SET symbol = (SELECT new FROM symbol_renames_v9 WHERE old = {table}.symbol)
+            WHERE symbol IN (SELECT old FROM symbol_renames_v9)
+        ''')
+    c.execute('''
+        SELECT p.account_id, r.new, p.quantity, p.cost, p.realized
+        FROM positions p JOIN symbol_renames_v9 r ON r.old = p.symbol
+    ''')
+    moved = c.fetchall()
+    c.execute('DELETE FROM positions WHERE symbol IN (SELECT old FROM symbol_renames_v9)')
+    c.executemany('''
+        INSERT INTO positions (account_id, symbol, quantity, cost, realized) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(account_id, symbol) DO UPDATE SET quantity = quantity + excluded.quantity,
+            cost = cost + excluded.cost, realized = realized + excluded.realized
+    ''', moved)
+    if method == 'average':
+        keys = list({row[:2] for row in moved})
+        c.executemany('DELETE FROM lots WHERE account_id = ? AND symbol = ?', keys)
+        c.executemany('''
+            INSERT INTO lots (account_id, symbol, quantity, price)
+            SELECT account_id, symbol, quantity, cost / quantity FROM positions
+            WHERE account_id = ? AND symbol = ? AND quantity > 0
+        ''', keys)
+    c.execute('DROP TABLE symbol_renames_v9')
+
+
+MIGRATIONS = [
+    (1, initial_schema),
+    (2, alert_rules),
+    (3, unique_stock_symbols),
+    (4, list_indexes),
+    (5, shared_quotes),
+    (6, lot_accounting),
+    (7, account_partitions),
+    (8, journal_state),
+    (9, normalize_symbols),
+]
@@ -0,0 +1,433 @@
+# 提醒通知：提醒事件异步发送到 webhook 和邮件（SMTP）
+# 配置通过环境变量完成，没有配置任何目标时不启用：
+#   NOTIFY_WEBHOOKS        webhook 地址，多个用逗号分隔；每批通知以 {"notifications": [...]} POST 到该地址
+#   NOTIFY_SMTP            邮件服务器 host[:port]；NOTIFY_SMTP_FROM、NOTIFY_SMTP_TO（逗号分隔）为发件人和收件人
+#   NOTIFY_SMTP_USER / NOTIFY_SMTP_PASSWORD 登录账号，NOTIFY_SMTP_STARTTLS=1 时先升级为 TLS
+#   NOTIFY_QUEUE_SIZE      每个目标的队列长度，默认 1000，队列满时丢弃新通知并计数
+#   NOTIFY_BATCH_SIZE      每批最多几条，默认 50；NOTIFY_BATCH_WAIT 收到第一条后最多再等几秒凑批，默认 0.5
+#   NOTIFY_MAX_RETRIES     发送失败后的重试次数，默认 5，间隔从 NOTIFY_BACKOFF 秒（默认 1）起指数增长，最长 60 秒
+#   NOTIFY_DEDUP_SECONDS   同一条规则的同一事件在这段时间内只通知一次，默认 60
+#   NOTIFY_RATE_LIMIT      每条规则在 NOTIFY_RATE_PERIOD 秒（默认 3600）内最多通知几次，默认 20，0 为不限
+# submit() 只做去重、限流检查并放入各目标的队列，不会阻塞调用方
+# 每个目标有独立的队列和发送线程，某个目标响应慢或不可用时只影响它自己的队列
+#
+# 本地测试用的接收端：python notify.py webhook 8002 / python notify.py smtp 8025
+import email.message
+import json
+import logging
+import os
+import queue
+import random
+import smtplib
+import socketserver
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from datetime import datetime
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+EVENT_TEXT = {'triggered': '触发', 'cleared': '解除'}
+DIRECTION_TEXT = {'above': '高于', 'below': '低于'}
+
+
+def notification(rule, event, price, ts=None):
+    return {
+        'rule_id': rule.id,
+        'account_id': rule.account_id,
+        'stock_id': rule.stock_id,
+        'symbol': rule.symbol,
+        'direction': rule.direction,
+        'threshold': rule.threshold,
+        'event': event,
+        'price': price,
+        'ts': time.time() if ts is None else ts,
+    }
+
+
+def describe(item):
+    return (f'{datetime.fromtimestamp(item["ts"]).strftime("%Y-%m-%d %H:%M:%S")} {item["symbol"]} '
+            f'价格 {item["price"]} {DIRECTION_TEXT.get(item["direction"], item["direction"])} '
+            f'{item["threshold"]} {EVENT_TEXT.get(item["event"], item["event"])}')
+
+
+# ---- 发送目标 ----
+
+class WebhookSink:
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+        parsed = urllib.parse.urlparse(url)
+        self.name = f'webhook:{parsed.netloc}{parsed.path}'
+
+    def send(self, batch):
+        # 状态码不是 2xx 时 urlopen 抛出 HTTPError，由调用方重试
+        body = json.dumps({'notifications': batch}, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SmtpSink:
+    # 每批通知合并为一封邮件
+    def __init__(self, host, port=25, sender='stock-monitor@localhost', recipients=(), username=None,
+                 password=None, starttls=False, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.name = f'smtp:{host}:{port}'
+
+    def message(self, batch):
+        msg = email.message.EmailMessage()
+        if len(batch) == 1:
+            item = batch[0]
+            msg['Subject'] = f'[股票监控] {item["symbol"]} 提醒{EVENT_TEXT.get(item["event"], item["event"])}'
+        else:
+            msg['Subject'] = f'[股票监控] {len(batch)} 条提醒'
+        msg['From'] = self.sender
+        msg['To'] = ', '.join(self.recipients)
+        msg.set_content('\n'.join(describe(item) for item in batch) + '\n')
+        return msg
+
+    def send(self, batch):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or '')
+            smtp.send_message(self.message(batch))
+
+
+# ---- 分发 ----
+
+class Destination:
+    # 一个发送目标：有界队列 + 发送线程，凑批后发送，失败按指数退避重试
+    def __init__(self, sink, queue_size=1000, batch_size=50, batch_wait=0.5, max_retries=5, backoff=1.0,
+                 max_backoff=60.0):
+        self.sink = sink
+        self.name = sink.name
+        self.queue = queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.batches = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _collect(self):
+        # 取到第一条后在 batch_wait 内尽量凑满一批；停止时返回空列表
+        while not self._stop.is_set():
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+                break
+            except queue.Empty:
+                continue
+        else:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def deliver(self, batch, retries=None):
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                self.sink.send(batch)
+            except Exception as e:
+                if attempt >= retries or self._stop.is_set():
+                    self.failed += len(batch)
+                    logger.error('通知发送到 %s 失败，丢弃 %s 条: %s', self.name, len(batch), e)
+                    return False
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                self.retries += 1
+                logger.warning('通知发送到 %s 失败，%.1f 秒后第 %s 次重试: %s', self.name, delay, attempt, e)
+                if self._stop.wait(delay):
+                    self.failed += len(batch)
+                    return False
+                continue
+            self.sent += len(batch)
+            self.batches += 1
+            return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self.deliver(batch)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f'notify-{self.name}', daemon=True)
+        self._thread.start()
+
+    def close(self, timeout=5.0):
+        # 停止发送线程，队列中剩余的通知各尝试发送一次
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            self.deliver(batch, retries=0)
+
+
+class Dispatcher:
+    def __init__(self, destinations, dedup_seconds=60.0, rate_limit=20, rate_period=3600.0):
+        self.destinations = list(destinations)
+        self.dedup_seconds = dedup_seconds
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rate_limited = 0
+        self._last = {}  # (规则, 事件) -> 最近一次通知时间
+        self._history = {}  # 规则 -> 限流窗口内的通知时间
+        self._lock = threading.Lock()
+
+    def _allow(self, item):
+        rule_id = item['rule_id']
+        ts = item['ts']
+        key = (rule_id, item['event'])
+        last = self._last.get(key)
+        if last is not None and ts - last < self.dedup_seconds:
+            self.deduplicated += 1
+            return False
+        if self.rate_limit > 0:
+            history = self._history.get(rule_id)
+            if history is None:
+                history = self._history[rule_id] = deque()
+            while history and ts - history[0] >= self.rate_period:
+                history.popleft()
+            if len(history) >= self.rate_limit:
+                self.rate_limited += 1
+                return False
+            history.append(ts)
+        self._last[key] = ts
+        return True
+
+    def submit(self, item):
+        # 去重和限流后放入各目标的队列，立即返回；返回是否放入
+        with self._lock:
+            self.submitted += 1
+            if not self._allow(item):
+                return False
+        for destination in self.destinations:
+            destination.offer(item)
+        return True
+
+    def submit_events(self, events, now=None):
+        # events 为提醒引擎产生的 [(规则, 事件, 价格)]
+        now = time.time() if now is None else now
+        for rule, event, price in events:
+            self.submit(notification(rule, event, price, now))
+
+    def start(self):
+        for destination in self.destinations:
+            destination.start()
+
+    def close(self, timeout=5.0):
+        for destination in self.destinations:
+            destination.close(timeout)
+
+    def stats(self):
+        return {destination.name: {
+            'queued': destination.queue.qsize(),
+            'sent': destination.sent,
+            'failed': destination.failed,
+            'dropped': destination.dropped,
+            'retries': destination.retries,
+            'batches': destination.batches,
+        } for destination in self.destinations}
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def create_dispatcher_from_env():
+    sinks = [WebhookSink(url, float(os.environ.get('NOTIFY_WEBHOOK_TIMEOUT', 5)))
+             for url in _split(os.environ.get('NOTIFY_WEBHOOKS'))]
+    smtp = os.environ.get('NOTIFY_SMTP')
+    if smtp:
+        host, _, port = smtp.partition(':')
+        sinks.append(SmtpSink(
+            host, int(port or 25),
+            sender=os.environ.get('NOTIFY_SMTP_FROM', 'stock-monitor@localhost'),
+            recipients=_split(os.environ.get('NOTIFY_SMTP_TO')),
+            username=os.environ.get('NOTIFY_SMTP_USER'),
+            password=os.environ.get('NOTIFY_SMTP_PASSWORD'),
+            starttls=os.environ.get('NOTIFY_SMTP_STARTTLS') == '1',
+        ))
+    if not sinks:
+        return None
+    destinations = [Destination(
+        sink,
+        queue_size=int(os.environ.get('NOTIFY_QUEUE_SIZE', 1000)),
+        batch_size=int(os.environ.get('NOTIFY_BATCH_SIZE', 50)),
+        batch_wait=float(os.environ.get('NOTIFY_BATCH_WAIT', 0.5)),
+        max_retries=int(os.environ.get('NOTIFY_MAX_RETRIES', 5)),
+        backoff=float(os.environ.get('NOTIFY_BACKOFF', 1)),
+    ) for sink in sinks]
+    return Dispatcher(
+        destinations,
+        dedup_seconds=float(os.environ.get('NOTIFY_DEDUP_SECONDS', 60)),
+        rate_limit=int(os.environ.get('NOTIFY_RATE_LIMIT', 20)),
+        rate_period=float(os.environ.get('NOTIFY_RATE_PERIOD', 3600)),
+    )
+
+
+# ---- 本地接收端，用于在没有真实 webhook / 邮件服务时测试 ----
+
+class WebhookReceiver:
+    # 记录收到的每批通知；delay 模拟慢速服务，status 不为 200 时模拟失败
+    def __init__(self, port=0, host='127.0.0.1', delay=0.0, status=200):
+        self.delay = delay
+        self.status = status
+        self.batches = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if receiver.delay:
+                    time.sleep(receiver.delay)
+                if receiver.status == 200:
+                    receiver.batches.append(json.loads(body)['notifications'])
+                self.send_response(receiver.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}/'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SmtpReceiver:
+    # 只实现发送邮件需要的 SMTP 命令，收到的邮件解析后保存在 messages 中
+    def __init__(self, port=0, host='127.0.0.1'):
+        self.messages = []
+        receiver = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode('ascii') + b'\r\n')
+
+            def handle(self):
+                self.reply('220 localhost stock-monitor test SMTP')
+                sender, recipients = None, []
+                for raw in self.rfile:
+                    command = raw.decode('utf-8', 'replace').strip()
+                    verb = command[:4].upper()
+                    if verb in ('HELO', 'EHLO'):
+                        self.reply('250 localhost')
+                    elif verb == 'MAIL':
+                        sender, recipients = command[10:].strip('<> '), []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        recipients.append(command[8:].strip('<> '))
+                        self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        lines = []
+                        for line in self.rfile:
+                            if line.rstrip(b'\r\n') == b'.':
+                                break
+                            lines.append(line[1:] if line.startswith(b'..') else line)
+                        receiver.messages.append((sender, recipients, message_from_bytes(b''.join(lines))))
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    elif verb in ('RSET', 'NOOP'):
+                        self.reply('250 OK')
+                    else:
+                        self.reply('502 Command not implemented')
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host = host
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2 or sys.argv[1] not in ('webhook', 'smtp'):
+        print('用法: python notify.py webhook|smtp [端口]')
+        sys.exit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else (8002 if sys.argv[1] == 'webhook' else 8025)
+    if sys.argv[1] == 'webhook':
+        receiver = WebhookReceiver(port).start()
+        print(f'webhook 接收端已启动: {receiver.url}')
+    else:
+        receiver = SmtpReceiver(port).start()
+        print(f'SMTP 接收端已启动: {receiver.host}:{receiver.port}')
+    try:
+        seen = 0
+        while True:
+            time.sleep(0.5)
+            items = receiver.batches if sys.argv[1] == 'webhook' else receiver.messages
+            for item in items[seen:]:
+                if sys.argv[1] == 'webhook':
+                    print('\n'.join(describe(n) for n in item))
+                else:
+                    print(f'{item[2]["Subject"]} -> {", ".join(item[1])}\n{item[2].get_payload(decode=True).decode()}')
+            seen = len(items)
+    except KeyboardInterrupt:
+        receiver.close()
@@ -0,0 +1,180 @@
+# 后台行情轮询：请求处理线程不再直接获取报价，只读取内存中的价格快照
+# 配置通过环境变量完成：
+#   QUOTE_POLL_INTERVAL 每轮刷新全部代码的周期（秒），默认 5
+#   QUOTE_POLL_SLICES   每轮把代码分成几批、均匀错开在周期内请求，默认 10
+#   QUOTE_STALE_AFTER   报价超过多少秒未更新视为过期，默认 3 个周期
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class PriceSnapshot:
+    # 带版本号的价格快照：写入时整体替换字典，读取无需加锁
+    def __init__(self, stale_after=15.0):
+        self.stale_after = stale_after
+        self.version = 0
+        self._prices = {}  # 代码 -> (价格, 更新时间戳)
+        self._versions = {}  # 代码 -> 最后一次写入时的版本号
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._recorders = []
+
+    def subscribe(self, listener):
+        # listener(changed, version)，changed 为本次价格有变化的 {代码: (价格, 时间戳)}
+        self._listeners.append(listener)
+
+    def add_recorder(self, recorder):
+        # recorder(prices, ts, version) 收到每次更新的全部报价（包括价格未变的代码），用于复制到其他进程
+        self._recorders.append(recorder)
+
+    def update(self, prices, ts=None):
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            current = self._prices
+            merged = dict(current)
+            versions = dict(self._versions)
+            version = self.version + 1
+            changed = {}
+            for symbol, price in prices.items():
+                old = current.get(symbol)
+                merged[symbol] = (price, ts)
+                versions[symbol] = version
+                if old is None or old[0] != price:
+                    changed[symbol] = (price, ts)
+            self._prices = merged
+            self._versions = versions
+            self.version = version
+        for recorder in self._recorders:
+            try:
+                recorder(prices, ts, version)
+            except Exception:
+                logger.exception('价格快照记录器执行失败')
+        for listener in self._listeners:
+            try:
+                listener(changed, version)
+            except Exception:
+                logger.exception('价格快照监听器执行失败')
+        return version
+
+    def get(self, symbol):
+        return self._prices.get(symbol)
+
+    def get_many(self, symbols):
+        prices = self._prices
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+    def symbols_version(self, symbols):
+        # 这些代码中最近一次写入的版本号；其他代码的报价更新不改变结果
+        versions = self._versions
+        return max((versions.get(symbol, 0) for symbol in symbols), default=0)
+
+    def price(self, symbol):
+        entry = self._prices.get(symbol)
+        return entry[0] if entry else None
+
+    def describe(self, entry, now=None):
+        # 返回接口 JSON 中使用的报价字段
+        if entry is None:
+            return {'current_price': None, 'price_time': None, 'stale': True}
+        now = time.time() if now is None else now
+        price, ts = entry
+        return {
+            'current_price': price,
+            'price_time': datetime.fromtimestamp(ts).isoformat(timespec='seconds'),
+            'stale': now - ts > self.stale_after,
+        }
+
+
+class QuotePoller:
+    # 后台线程按周期刷新 symbol_source() 返回的所有代码，并把各批请求错开在周期内
+    def __init__(self, cache, snapshot, symbol_source, interval=5.0, slices=10):
+        self.cache = cache
+        self.snapshot = snapshot
+        self.symbol_source = symbol_source
+        self.interval = interval
+        self.slices = slices
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='quote-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def request_refresh(self, symbols):
+        # 新加入的代码不必等到下一轮，唤醒后台线程尽快获取
+        with self._pending_lock:
+            self._pending.update(symbols)
+        self._wake.set()
+
+    def refresh(self, symbols):
+        if not symbols:
+            return
+        prices = self.cache.refresh(list(symbols))
+        if prices:
+            self.snapshot.update(prices)
+
+    def _drain_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        return pending
+
+    def _safe_refresh(self, symbols):
+        try:
+            self.refresh(symbols)
+        except Exception:
+            logger.exception('刷新报价失败')
+
+    def _wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self._wake.wait(remaining):
+                self._wake.clear()
+                self._safe_refresh(self._drain_pending())
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                symbols = sorted(set(self.symbol_source()))
+            except Exception:
+                logger.exception('读取监控代码失败')
+                symbols = []
+            if not symbols:
+                self._safe_refresh(self._drain_pending())
+                self._wait(self.interval)
+                continue
+
+            count = max(1, min(self.slices, len(symbols)))
+            step = self.interval / count
+            for i in range(count):
+                if self._stop.is_set():
+                    return
+                batch = set(symbols[i::count]) | self._drain_pending()
+                self._safe_refresh(batch)
+                self._wait(step)
+
+
+def create_poller_from_env(cache, symbol_source):
+    interval = float(os.environ.get('QUOTE_POLL_INTERVAL', 5))
+    snapshot = PriceSnapshot(stale_after=float(os.environ.get('QUOTE_STALE_AFTER', interval * 3)))
+    poller = QuotePoller(cache, snapshot, symbol_source,
+                         interval=interval,
+                         slices=int(os.environ.get('QUOTE_POLL_SLICES', 10)))
+    return snapshot, poller
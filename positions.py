@@ -0,0 +1,63 @@
+# 持仓物化表：按账户和股票代码汇总的持仓数量、未平仓批次的成本和累计已实现盈亏
+# 由 lots.LotBook 在写入交易的同一个数据库事务里增量更新，/api/portfolio 只读取本账户未平仓的行
+# realized 列由迁移 6 添加，迁移 7 把主键改为 (account_id, symbol)
+
+POSITIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS positions (
+        symbol TEXT PRIMARY KEY,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        cost REAL NOT NULL DEFAULT 0
+    )
+'''
+
+# 部分索引：只覆盖未平仓的持仓，查询代价与持仓数成正比
+POSITIONS_OPEN_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_positions_open
+    ON positions (symbol) WHERE quantity > 0
+'''
+
+ACCOUNT_POSITIONS_SCHEMA = '''
+    CREATE TABLE positions_by_account (
+        account_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        cost REAL NOT NULL DEFAULT 0,
+        realized REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (account_id, symbol)
+    )
+'''
+
+ACCOUNT_POSITIONS_OPEN_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_positions_open
+    ON positions (account_id, symbol) WHERE quantity > 0
+'''
+
+
+def create_tables(c):
+    c.execute(POSITIONS_SCHEMA)
+    c.execute(POSITIONS_OPEN_INDEX)
+
+
+def partition_by_account(c, account_id):
+    # SQLite 不能修改主键，新建表复制数据后替换；已有持仓归入 account_id
+    c.execute(ACCOUNT_POSITIONS_SCHEMA)
+    c.execute('''
+        INSERT INTO positions_by_account (account_id, symbol, quantity, cost, realized)
+        SELECT ?, symbol, quantity, cost, realized FROM positions
+    ''', (account_id,))
+    c.execute('DROP TABLE positions')
+    c.execute('ALTER TABLE positions_by_account RENAME TO positions')
+    c.execute(ACCOUNT_POSITIONS_OPEN_INDEX)
+
+
+def open_positions(c, account_id):
+    c.execute('SELECT symbol, quantity, cost, realized FROM positions WHERE account_id = ? AND quantity > 0',
+              (account_id,))
+    return c.fetchall()
+
+
+def pnl_positions(c, account_id):
+    # 未平仓或有已实现盈亏的持仓，已全部卖出的代码也计入盈亏汇总
+    c.execute('SELECT symbol, quantity, cost, realized FROM positions '
+              'WHERE account_id = ? AND (quantity > 0 OR realized != 0)', (account_id,))
+    return c.fetchall()
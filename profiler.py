@@ -0,0 +1,64 @@
+# 采样分析器：后台线程按固定间隔抓取所有线程的调用栈，按折叠格式（flamegraph collapsed）计数
+# 用于在运行中的实例上临时找出热点，默认关闭，由 PROFILER_ENABLED=1 打开 /debug/profile 接口
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_SECONDS = 60
+
+
+def _stack_key(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[_stack_key(frame)] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self):
+        # 每行 "栈帧;栈帧;... 次数"，可直接交给 flamegraph.pl / speedscope
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+_busy = threading.Lock()
+
+
+def profile(seconds, interval=0.005):
+    # 同一时间只允许一次采样；正在采样时返回 None
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        sampler = Sampler(interval)
+        sampler.start()
+        time.sleep(min(max(seconds, 0), MAX_SECONDS))
+        sampler.stop()
+        return sampler
+    finally:
+        _busy.release()
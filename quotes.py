@@ -0,0 +1,248 @@
+# 行情数据层：可替换的报价源 + 带 TTL 的共享缓存
+# 配置通过环境变量完成：
+#   QUOTE_PROVIDER   random（默认，模拟数据）/ file / http
+#   QUOTE_SOURCE     file 模式下的本地文件路径，http 模式下的接口地址
+#   QUOTE_TTL        缓存有效期（秒），默认 5
+#   QUOTE_CACHE_SIZE 缓存最多保存的代码数，默认 10000
+import csv
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteProvider:
+    # 报价源接口：一次请求批量获取多个代码的价格
+    # 返回 {代码: 价格}，取不到的代码直接省略
+    name = 'base'
+
+    def get_prices(self, symbols):
+        raise NotImplementedError
+
+
+class RandomQuoteProvider(QuoteProvider):
+    # 模拟数据，您可替换为真实接口
+    name = 'random'
+
+    def get_prices(self, symbols):
+        return {symbol: round(10 + random.random() * 20, 2) for symbol in symbols}
+
+
+class FileQuoteProvider(QuoteProvider):
+    # 从本地文件读取报价，文件修改后自动重新加载
+    # 支持 JSON 对象 {"600000": 10.5} 或两列 CSV（symbol,price）
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._prices = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            if self.path.endswith('.csv'):
+                prices = {}
+                for row in csv.reader(f):
+                    if len(row) < 2 or row[0] == 'symbol':
+                        continue
+                    prices[row[0].strip()] = float(row[1])
+                return prices
+            return {str(k): float(v) for k, v in json.load(f).items()}
+
+    def all_prices(self):
+        mtime = os.stat(self.path).st_mtime
+        with self._lock:
+            if mtime != self._mtime:
+                self._prices = self._load()
+                self._mtime = mtime
+            return self._prices
+
+    def get_prices(self, symbols):
+        prices = self.all_prices()
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+
+class HTTPQuoteProvider(QuoteProvider):
+    # 通过 HTTP 批量获取：GET <url>?symbols=a,b,c，返回 JSON 对象 {代码: 价格}
+    name = 'http'
+
+    def __init__(self, url, timeout=3.0):
+        self.url = url
+        self.timeout = timeout
+
+    def get_prices(self, symbols):
+        if not symbols:
+            return {}
+        query = urllib.parse.urlencode({'symbols': ','.join(symbols)})
+        separator = '&' if '?' in self.url else '?'
+        with urllib.request.urlopen(self.url + separator + query, timeout=self.timeout) as resp:
+            data = json.load(resp)
+        wanted = set(symbols)
+        return {k: float(v) for k, v in data.items() if k in wanted and v is not None}
+
+
+class _Flight:
+    # 正在向报价源请求中的代码，并发的相同请求等待同一个结果
+    def __init__(self):
+        self.event = threading.Event()
+        self.price = None
+
+
+class QuoteCache:
+    # 所有接口共享的报价缓存：TTL 过期、按 LRU 限制容量、并发未命中合并为一次请求
+    def __init__(self, provider, ttl=5.0, max_size=10000, wait_timeout=10.0):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()  # 代码 -> (价格, 过期时间)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_prices(self, symbols):
+        now = time.monotonic()
+        result = {}
+        owned = []
+        waiting = {}
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                entry = self._entries.get(symbol)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(symbol)
+                    result[symbol] = entry[0]
+                    self.hits += 1
+                    continue
+                self.misses += 1
+                flight = self._inflight.get(symbol)
+                if flight is not None:
+                    waiting[symbol] = flight
+                else:
+                    self._inflight[symbol] = _Flight()
+                    owned.append(symbol)
+
+        if owned:
+            result.update(self._fetch(owned))
+
+        for symbol, flight in waiting.items():
+            if flight.event.wait(self.wait_timeout) and flight.price is not None:
+                result[symbol] = flight.price
+        return result
+
+    def _fetch(self, symbols):
+        provider_name = getattr(self.provider, 'name', type(self.provider).__name__)
+        start = time.perf_counter()
+        try:
+            prices = self.provider.get_prices(symbols)
+        except Exception:
+            metrics.PROVIDER_ERRORS.inc(provider_name)
+            logger.exception('获取报价失败: %s', ','.join(symbols[:10]))
+            prices = {}
+        metrics.PROVIDER_LATENCY.observe(time.perf_counter() - start, provider_name)
+
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for symbol in symbols:
+                flight = self._inflight.pop(symbol)
+                price = prices.get(symbol)
+                if price is not None:
+                    self._entries[symbol] = (price, expires)
+                    self._entries.move_to_end(symbol)
+                flight.price = price
+                flight.event.set()
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return {symbol: prices[symbol] for symbol in symbols if prices.get(symbol) is not None}
+
+    def get_price(self, symbol):
+        return self.get_prices([symbol]).get(symbol)
+
+    def refresh(self, symbols):
+        # 忽略未过期的缓存强制向报价源取数，供后台轮询使用；正在请求中的代码不重复请求
+        owned = []
+        waiting = {}
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                flight = self._inflight.get(symbol)
+                if flight is not None:
+                    waiting[symbol] = flight
+                else:
+                    self._inflight[symbol] = _Flight()
+                    owned.append(symbol)
+
+        result = self._fetch(owned) if owned else {}
+        for symbol, flight in waiting.items():
+            if flight.event.wait(self.wait_timeout) and flight.price is not None:
+                result[symbol] = flight.price
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def create_provider(name=None, source=None):
+    name = (name or os.environ.get('QUOTE_PROVIDER', 'random')).lower()
+    source = source or os.environ.get('QUOTE_SOURCE')
+    if name == 'random':
+        return RandomQuoteProvider()
+    if name == 'file':
+        return FileQuoteProvider(source or 'quotes.json')
+    if name == 'http':
+        if not source:
+            raise ValueError('QUOTE_PROVIDER=http 需要设置 QUOTE_SOURCE')
+        return HTTPQuoteProvider(source)
+    raise ValueError(f'未知的报价源: {name}')
+
+
+def create_cache_from_env():
+    return QuoteCache(
+        create_provider(),
+        ttl=float(os.environ.get('QUOTE_TTL', 5)),
+        max_size=int(os.environ.get('QUOTE_CACHE_SIZE', 10000)),
+    )
+
+
+# 本地 HTTP 报价服务，用于在没有真实行情源时测试 HTTPQuoteProvider
+# 用法: python quotes.py quotes.json 8001
+def serve_quotes(path, port=8001, host='127.0.0.1'):
+    provider = FileQuoteProvider(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            symbols = [s for s in ','.join(query.get('symbols', [])).split(',') if s]
+            prices = provider.get_prices(symbols) if symbols else provider.all_prices()
+            body = json.dumps(prices).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f'报价服务已启动: http://{host}:{port}/?symbols=...')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('用法: python quotes.py <报价文件.json|.csv> [端口]')
+        sys.exit(1)
+    serve_quotes(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 8001)
@@ -0,0 +1,309 @@
+# 日志恢复：数据库记录已应用到的日志位置（journal_state.lsn），与写操作在同一个事务中更新
+# 启动时重放该位置之后的日志；内存库或新建的空库先载入最近的快照，再只重放快照之后的日志
+# 日志记录带有写入时的行编号和时间，重放结果与原库一致；持仓和批次由交易记录按成本法重新核算
+# 快照只包含压缩后的当前状态，交易记录和提醒事件等历史保存在数据库中；从快照恢复的库只有快照之后的交易记录，
+# 库中记下恢复时的快照位置（ledger_settings.history_from），之后不能再按交易记录全量重算持仓
+import logging
+
+import journal
+import lots
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_STATE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS journal_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        lsn INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# sqlite_sequence 也写入快照，恢复后新插入的行编号（包括交易记录和提醒事件）与原库一致
+SNAPSHOT_TABLES = ('accounts', 'stocks', 'positions', 'lots', 'alert_rules', 'ledger_settings', 'sqlite_sequence')
+
+STOCK_COLUMNS = ('id', 'account_id', 'symbol', 'name', 'created_at')
+
+
+def create_tables(c):
+    c.execute(JOURNAL_STATE_SCHEMA)
+    c.execute('INSERT OR IGNORE INTO journal_state (id, lsn) VALUES (1, 0)')
+
+
+def applied_lsn(c):
+    c.execute('SELECT lsn FROM journal_state WHERE id = 1')
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+def set_lsn(c, lsn):
+    c.execute('UPDATE journal_state SET lsn = ? WHERE id = 1', (lsn,))
+
+
+def rule_record(c, rule_id):
+    # 提醒规则按库中的整行记录（包括创建时间），重放时按编号 upsert
+    c.execute('SELECT * FROM alert_rules WHERE id = ?', (rule_id,))
+    return dict(zip([d[0] for d in c.description], c.fetchone()))
+
+
+# ---- 代码规范化 ----
+
+def stored_symbols(c):
+    # 库中出现的全部代码；交易记录和批次的代码都在持仓表中，提醒事件的代码按规则处理，不扫描这些历史表
+    c.execute('SELECT symbol FROM stocks UNION SELECT symbol FROM positions UNION SELECT symbol FROM alert_rules')
+    return [row[0] for row in c.fetchall()]
+
+
+def rename_symbols(c, renames, method):
+    # renames 为 {原代码: 新代码}，同一证券的不同写法改为同一个代码后合并：
+    #   监控列表同一账户内重复的行只保留编号最小的一行，提醒规则改指向保留的行
+    #   持仓的数量、成本和已实现盈亏相加；批次按编号（建仓顺序）归入新代码，平均成本法合并为一个批次
+    # method 为库中批次数据对应的成本法
+    if not renames:
+        return
+    c.execute('CREATE TEMP TABLE IF NOT EXISTS symbol_renames (old TEXT PRIMARY KEY, new TEXT NOT NULL)')
+    c.execute('DELETE FROM symbol_renames')
+    c.executemany('INSERT INTO symbol_renames (old, new) VALUES (?, ?)', list(renames.items()))
+
+    c.execute('SELECT id, account_id, symbol FROM stocks ORDER BY id')
+    kept = {}
+    merged = []
+    renamed = []
+    for stock_id, account_id, symbol in c.fetchall():
+        new = renames.get(symbol, symbol)
+        if (account_id, new) in kept:
+            merged.append((kept[account_id, new], stock_id))
+            continue
+        kept[account_id, new] = stock_id
+        if new != symbol:
+            renamed.append((new, stock_id))
+    c.executemany('UPDATE alert_rules SET stock_id = ? WHERE stock_id = ?', merged)
+    c.executemany('DELETE FROM stocks WHERE id = ?', [(stock_id,) for _, stock_id in merged])
+    c.executemany('UPDATE stocks SET symbol = ? WHERE id = ?', renamed)
+
+    for table in ('transactions', 'lots', 'alert_rules', 'alert_events'):
+        c.execute(f'''
+            UPDATE {table} SET symbol = (SELECT new FROM symbol_renames WHERE old = {table}.symbol)
+            WHERE symbol IN (SELECT old FROM symbol_renames)
+        ''')
+
+    c.execute('''
+        SELECT p.account_id, r.new, p.quantity, p.cost, p.realized
+        FROM positions p JOIN symbol_renames r ON r.old = p.symbol
+    ''')
+    moved = c.fetchall()
+    c.execute('DELETE FROM positions WHERE symbol IN (SELECT old FROM symbol_renames)')
+    c.executemany('''
+        INSERT INTO positions (account_id, symbol, quantity, cost, realized) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(account_id, symbol) DO UPDATE SET quantity = quantity + excluded.quantity,
+            cost = cost + excluded.cost, realized = realized + excluded.realized
+    ''', moved)
+    if method == 'average':
+        keys = list({row[:2] for row in moved})
+        c.executemany('DELETE FROM lots WHERE account_id = ? AND symbol = ?', keys)
+        c.executemany('''
+            INSERT INTO lots (account_id, symbol, quantity, price)
+            SELECT account_id, symbol, quantity, cost / quantity FROM positions
+            WHERE account_id = ? AND symbol = ? AND quantity > 0
+        ''', keys)
+    c.execute('DROP TABLE symbol_renames')
+
+
+# ---- 重放 ----
+
+def _upsert_rule(c, rule):
+    columns = list(rule)
+    updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column != 'id')
+    c.execute(f'''
+        INSERT INTO alert_rules ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})
+        ON CONFLICT(id) DO UPDATE SET {updates}
+    ''', [rule[column] for column in columns])
+
+
+def _apply_account(c, record, method):
+    c.execute('INSERT OR REPLACE INTO accounts (id, name, created_at) VALUES (?, ?, ?)',
+              (record['id'], record['name'], record['created_at']))
+
+
+def _apply_stocks(c, record, method):
+    # 新增和批量导入：按编号 upsert，已存在的代码只更新名称
+    c.executemany(f'''
+        INSERT INTO stocks ({", ".join(STOCK_COLUMNS)}) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET name = excluded.name
+    ''', [(row[0], record['account'], row[1], row[2], row[3]) for row in record['rows']])
+
+
+def _apply_stock_delete(c, record, method):
+    c.execute('DELETE FROM stocks WHERE id = ?', (record['id'],))
+    c.execute('DELETE FROM alert_rules WHERE stock_id = ?', (record['id'],))
+
+
+def _apply_trades(c, record, method):
+    # 单笔交易和批量导入：按原顺序核算批次，交易记录使用原编号和成交时间
+    book = lots.LotBook(c, method, record['account'])
+    accepted = []
+    for row in record['rows']:
+        try:
+            book.trade(*row[1:5])
+        except lots.OversellError as e:
+            logger.warning('重放交易 %s 失败: %s', row[0], e)
+            continue
+        accepted.append((row[0], record['account']) + tuple(row[1:6]))
+    c.executemany('''
+        INSERT INTO transactions (id, account_id, symbol, type, price, quantity, date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', accepted)
+    book.flush()
+
+
+def _apply_thresholds(c, record, method):
+    c.execute('UPDATE stocks SET high_price = ?, low_price = ? WHERE id = ?',
+              (record['high_price'], record['low_price'], record['stock_id']))
+    for rule in record['rules']:
+        _upsert_rule(c, rule)
+    c.executemany('DELETE FROM alert_rules WHERE id = ?', [(rule_id,) for rule_id in record['removed']])
+
+
+def _apply_rule(c, record, method):
+    _upsert_rule(c, record['rule'])
+
+
+def _apply_rule_delete(c, record, method):
+    c.executemany('DELETE FROM alert_rules WHERE id = ?', [(rule_id,) for rule_id in record['ids']])
+
+
+def _apply_symbols(c, record, method):
+    rename_symbols(c, record['renames'], method)
+
+
+APPLIERS = {
+    'account': _apply_account,
+    'stocks': _apply_stocks,
+    'stock_delete': _apply_stock_delete,
+    'trades': _apply_trades,
+    'thresholds': _apply_thresholds,
+    'rule': _apply_rule,
+    'rule_delete': _apply_rule_delete,
+    'symbols': _apply_symbols,
+}
+
+
+def _ledger_method(c, default):
+    # 重放使用库中批次数据对应的成本法，成本法变更由之后的 lots.ensure_method 统一重建
+    c.execute("SELECT value FROM ledger_settings WHERE name = 'cost_method'")
+    row = c.fetchone()
+    return row[0] if row else default
+
+
+def aborted(directory, after):
+    # LSN 大于 after 的作废标记所列出的记录；作废标记写在回滚事务的记录之后，需要先扫描一遍
+    return {lsn for _, _, record in journal.read(directory, after) if record['op'] == journal.ABORT_OP
+            for lsn in record['lsns']}
+
+
+def replay(c, directory, after, method, until_ts=None):
+    # 依次应用 LSN 大于 after 的日志记录，跳过已作废的记录，返回 (最后读取的 LSN, 应用的记录数)
+    method = _ledger_method(c, method)
+    skipped = aborted(directory, after)
+    lsn = after
+    count = 0
+    for lsn, _, record in journal.read(directory, after, until_ts):
+        if record['op'] == journal.ABORT_OP or lsn in skipped:
+            continue
+        applier = APPLIERS.get(record['op'])
+        if applier is None:
+            logger.warning('未知的日志记录类型 %s，已跳过', record['op'])
+            continue
+        applier(c, record, method)
+        count += 1
+    return lsn, count
+
+
+# ---- 快照 ----
+
+def capture(c):
+    # 读取快照内容；调用方负责在一个读事务内调用，保证各表与 LSN 一致
+    tables = {}
+    for table in SNAPSHOT_TABLES:
+        c.execute(f'SELECT * FROM {table}')
+        columns = [d[0] for d in c.description]
+        tables[table] = (columns, [list(row) for row in c.fetchall()])
+    return applied_lsn(c), tables
+
+
+def restore_snapshot(c, header, tables):
+    for table in SNAPSHOT_TABLES:
+        if table not in tables:
+            continue
+        columns, rows = tables[table]
+        c.execute(f'DELETE FROM {table}')
+        c.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                      rows)
+    # 快照来自一个同样由快照恢复的库时已带有该标记，保留更早的位置
+    c.execute("INSERT OR IGNORE INTO ledger_settings (name, value) VALUES ('history_from', ?)",
+              (str(header['lsn']),))
+
+
+def is_empty(c):
+    # 新建的库只有默认账户，没有任何用户数据
+    c.execute('''
+        SELECT EXISTS(SELECT 1 FROM stocks) OR EXISTS(SELECT 1 FROM transactions)
+            OR EXISTS(SELECT 1 FROM alert_rules) OR (SELECT COUNT(*) FROM accounts) > 1
+    ''')
+    return not c.fetchone()[0]
+
+
+def latest_snapshot(directory, until_ts=None):
+    # 最近一个完整的快照，损坏的快照跳过；until_ts 指定时只考虑该时间之前的快照
+    for lsn, path in reversed(journal.snapshot_files(directory)):
+        try:
+            header, tables = journal.load_snapshot(path)
+        except (OSError, ValueError) as e:
+            logger.warning('快照 %s 无法读取: %s', path, e)
+            continue
+        if until_ts is not None and header['ts'] > until_ts:
+            continue
+        return header, tables
+    return None, None
+
+
+def _require_log_from(directory, lsn):
+    # 早于最旧快照的日志段会被清理，从更早的位置重放时缺少记录
+    all_segments = journal.segments(directory)
+    if all_segments and all_segments[0][0] > lsn:
+        raise ValueError(f'日志位置 {all_segments[0][0]} 之前的日志段已清理，无法从位置 {lsn} 重放')
+
+
+def recover(c, directory, method):
+    # 在 init_db 的写事务中调用；返回 {'snapshot': 载入的快照 LSN 或 None, 'replayed': 重放的记录数, 'lsn': ...}
+    lsn = applied_lsn(c)
+    snapshot_lsn = None
+    if lsn == 0 and is_empty(c):
+        header, tables = latest_snapshot(directory)
+        if header is not None:
+            restore_snapshot(c, header, tables)
+            lsn = snapshot_lsn = header['lsn']
+    # 库中的日志位置之前的记录都已提交，只需检查其后的部分
+    end = journal.valid_end(directory, lsn)
+    if end < lsn:
+        # 日志比数据库旧（日志目录被清理过），新的记录从数据库的位置接着写
+        logger.warning('日志末尾 %s 落后于数据库位置 %s，从数据库位置开始新的日志段', end, lsn)
+        journal.start_segment(directory, lsn)
+    _require_log_from(directory, lsn)
+    lsn, replayed = replay(c, directory, lsn, method)
+    set_lsn(c, lsn)
+    return {'snapshot': snapshot_lsn, 'replayed': replayed, 'lsn': lsn}
+
+
+def reconstruct(c, directory, until_ts, method, full=False):
+    # 按时间点重建：c 为一个已迁移的空库；从 until_ts 之前最近的快照开始（full 时从日志开头）重放到 until_ts
+    # 提醒事件不记日志，重建的结果中没有提醒事件；从快照开始时只有快照之后的交易记录
+    # 需要的日志段已被清理（full，或 until_ts 早于保留的快照）时抛出 ValueError
+    lsn = 0
+    if not full:
+        header, tables = latest_snapshot(directory, until_ts)
+        if header is not None:
+            restore_snapshot(c, header, tables)
+            lsn = header['lsn']
+    _require_log_from(directory, lsn)
+    lsn, replayed = replay(c, directory, lsn, method, until_ts)
+    set_lsn(c, lsn)
+    return lsn, replayed
@@ -0,0 +1,370 @@
+# 行情回放 / 回测：不连接行情源，把本地记录的报价按时间顺序送入与线上相同的价格更新路径
+# （poller.PriceSnapshot.update → 提醒引擎），输出提醒事件和持仓权益曲线，并统计每秒处理的报价数
+# 同时可作为价格快照和提醒判断热点路径的压力测试
+#
+# 报价来源（三选一）：
+#   CSV 文件      表头包含 ts（或 time / timestamp）、symbol、price，ts 为 Unix 时间戳或 ISO 时间
+#   价格历史      history 模块的列式文件：HISTORY_DIR 目录，或其中某个代码的单个 <YYYYMMDD>.ts 段
+#   --synthetic N 为账户关注的代码生成 N 条随机游走报价
+# 提醒规则和交易记录读自数据库（只读打开）：规则从未触发状态开始评估，交易按成交时间与报价交错，
+# 用与线上相同的批次核算（lots.LotBook，在内存库中进行）更新持仓
+#
+# 用法示例：
+#   python replay.py ticks.csv --db stock_monitor.db --events events.csv --equity equity.csv
+#   python replay.py history --symbols 600000,600519 --speed 60     # 按 60 倍实际速度回放
+#   python replay.py --synthetic 1000000                             # 压力测试
+import argparse
+import csv
+import heapq
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from itertools import groupby
+
+import accounts
+import alerts
+import db
+import lots
+import migrations
+import poller
+
+
+def parse_ts(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_db_time(value):
+    # 库中的时间为 CURRENT_TIMESTAMP 格式（UTC）
+    return datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+# ---- 报价来源，都产出按时间排序的 (ts, symbol, price) ----
+
+class TickError(ValueError):
+    # 报价文件无法读取，消息中带有文件名和行号
+    pass
+
+
+def read_csv(path):
+    # 时间或价格无法解析的行抛出 TickError（报价要按顺序回放，不能跳过）
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        try:
+            fields = set(reader.fieldnames or ())
+            ts_field = next((name for name in ('ts', 'time', 'timestamp') if name in fields), None)
+            if ts_field is None or not {'symbol', 'price'} <= fields:
+                raise TickError(f'{path}: CSV 表头需要包含 ts、symbol、price')
+            for row in reader:
+                try:
+                    ts = parse_ts(row[ts_field])
+                    price = float(row['price'])
+                except (TypeError, ValueError):
+                    ts = price = math.nan
+                if not (math.isfinite(ts) and math.isfinite(price)) or price <= 0 or not row['symbol']:
+                    raise TickError(f'{path} 第 {reader.line_num} 行: 时间、代码或价格格式错误')
+                yield ts, row['symbol'], price
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise TickError(f'{path} 第 {reader.line_num} 行: {e}') from None
+
+
+def _read_segment(base):
+    # 一个代码一天的列式文件：<base>.ts 与 <base>.px
+    with open(base + '.ts', 'rb') as f:
+        ts = array('d', f.read())
+    with open(base + '.px', 'rb') as f:
+        prices = array('d', f.read())
+    return ts, prices[:len(ts)]
+
+
+def _symbol_ticks(symbol, bases, start, end):
+    for base in bases:
+        ts, prices = _read_segment(base)
+        for t, price in zip(ts, prices):
+            if (start is None or t >= start) and (end is None or t <= end):
+                yield t, symbol, price
+
+
+def read_history(path, symbols=None, start=None, end=None):
+    # path 为价格历史目录（每个代码一个子目录）或单个 .ts 段文件；各代码按时间归并
+    import urllib.parse
+    if path.endswith('.ts'):
+        symbol = urllib.parse.unquote(os.path.basename(os.path.dirname(os.path.abspath(path))))
+        return _symbol_ticks(symbol, [path[:-3]], start, end)
+    streams = []
+    for name in sorted(os.listdir(path)):
+        directory = os.path.join(path, name)
+        symbol = urllib.parse.unquote(name)
+        if not os.path.isdir(directory) or (symbols and symbol not in symbols):
+            continue
+        bases = [os.path.join(directory, day[:-3]) for day in sorted(os.listdir(directory)) if day.endswith('.ts')]
+        streams.append(_symbol_ticks(symbol, bases, start, end))
+    return heapq.merge(*streams)
+
+
+def synthetic(symbols, count, start_prices, seed=1, start_ts=None, step=1.0):
+    # 各代码轮流产生一条报价，价格按 ±1% 以内随机游走，保留两位小数
+    rng = random.Random(seed)
+    prices = {symbol: start_prices.get(symbol) or 10.0 for symbol in symbols}
+    ts = time.time() - count * step if start_ts is None else start_ts
+    for i in range(count):
+        symbol = symbols[i % len(symbols)]
+        price = max(0.01, round(prices[symbol] * (1 + rng.uniform(-0.01, 0.01)), 2))
+        prices[symbol] = price
+        yield ts + i * step / len(symbols), symbol, price
+
+
+# ---- 回放 ----
+
+class Portfolio:
+    # 按时间应用交易并按最新价格计算持仓市值；批次核算在一个内存库上由 LotBook 完成，与线上使用同一套逻辑
+    def __init__(self, method, account_id):
+        self.database = db.Database(':memory:')
+        self.database.migrate(migrations.MIGRATIONS)
+        # 批次只保留在 LotBook 内存中，不写回内存库
+        self.book = lots.LotBook(self.database.cursor(), method, account_id)
+        self.holdings = {}  # 代码 -> (数量, 成本)
+        self.prices = {}
+        self.market_value = 0.0
+        self.cost = 0.0
+        self.realized = 0.0
+        self.rejected = 0
+
+    def _value(self, symbol):
+        quantity, cost = self.holdings.get(symbol, (0, 0.0))
+        price = self.prices.get(symbol)
+        # 还没有报价的持仓按成本计价
+        return quantity * price if price is not None else cost
+
+    def trade(self, symbol, trade_type, price, quantity):
+        before = self._value(symbol)
+        old_cost = self.holdings.get(symbol, (0, 0.0))[1]
+        try:
+            self.realized += self.book.trade(symbol, trade_type, price, quantity)
+        except lots.OversellError:
+            self.rejected += 1
+            return
+        quantity, cost, _ = self.book.position(symbol)
+        self.holdings[symbol] = (quantity, cost)
+        self.cost += cost - old_cost
+        self.market_value += self._value(symbol) - before
+
+    def on_prices(self, changed):
+        holdings = self.holdings
+        for symbol, (price, _) in changed.items():
+            if symbol in holdings:
+                before = self._value(symbol)
+                self.prices[symbol] = price
+                self.market_value += self._value(symbol) - before
+            else:
+                self.prices[symbol] = price
+
+    def point(self, ts):
+        return {
+            'ts': ts,
+            'market_value': round(self.market_value, 2),
+            'cost': round(self.cost, 2),
+            'unrealized': round(self.market_value - self.cost, 2),
+            'realized': round(self.realized, 2),
+        }
+
+
+class Replay:
+    def __init__(self, rules, trades, method='fifo', account_id=accounts.DEFAULT_ACCOUNT, sample=60.0):
+        # rules 为 alerts.AlertRule 列表，trades 为按时间排序的 [(ts, symbol, type, price, quantity)]
+        self.snapshot = poller.PriceSnapshot(stale_after=math.inf)
+        self.engine = alerts.AlertEngine()
+        for rule in rules:
+            self.engine.upsert(rule)
+        self.portfolio = Portfolio(method, account_id)
+        self.trades = trades
+        self.sample = sample
+        self.events = []
+        self.equity = []
+        self.ticks = 0
+        self.updates = 0
+        self.seconds = 0.0
+        self._next_trade = 0
+        self._next_sample = None
+        # 与线上相同：提醒引擎和持仓作为价格快照的监听器
+        self.snapshot.subscribe(self._on_alerts)
+        self.snapshot.subscribe(lambda changed, version: self.portfolio.on_prices(changed))
+
+    def _on_alerts(self, changed, version):
+        if not changed:
+            return
+        now = next(iter(changed.values()))[1]
+        for rule, event, price in self.engine.on_prices({symbol: entry[0] for symbol, entry in changed.items()}, now):
+            self.events.append((now, rule, event, price))
+
+    def _apply_trades(self, until):
+        trades = self.trades
+        while self._next_trade < len(trades) and trades[self._next_trade][0] <= until:
+            self.portfolio.trade(*trades[self._next_trade][1:])
+            self._next_trade += 1
+
+    def _record(self, ts):
+        if self._next_sample is None:
+            self._next_sample = ts
+        if ts >= self._next_sample:
+            self.equity.append(self.portfolio.point(ts))
+            self._next_sample = ts + self.sample if self.sample > 0 else ts
+
+    def run(self, ticks, speed=0.0):
+        # 同一时间戳的报价合并为一次快照更新（相当于一轮轮询）；speed > 0 时按 speed 倍实际速度回放
+        first_ts = None
+        wall_start = time.perf_counter()
+        slept = 0.0
+        ts = None
+        for ts, batch in groupby(ticks, key=lambda tick: tick[0]):
+            prices = {symbol: price for _, symbol, price in batch}
+            if first_ts is None:
+                first_ts = ts
+            if speed > 0:
+                delay = (ts - first_ts) / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+                    slept += delay
+            self._apply_trades(ts)
+            self.snapshot.update(prices, ts)
+            self.ticks += len(prices)
+            self.updates += 1
+            self._record(ts)
+        if ts is not None and (not self.equity or self.equity[-1]['ts'] != ts):
+            self.equity.append(self.portfolio.point(ts))
+        self.seconds = time.perf_counter() - wall_start - slept
+        return self.summary()
+
+    def summary(self):
+        counts = {'triggered': 0, 'cleared': 0}
+        for _, _, event, _ in self.events:
+            counts[event] += 1
+        return {
+            'ticks': self.ticks,
+            'updates': self.updates,
+            'seconds': round(self.seconds, 3),
+            'ticks_per_second': round(self.ticks / self.seconds, 1) if self.seconds else None,
+            'rules': self.engine.rule_count,
+            'events': counts,
+            'trades_applied': self._next_trade,
+            'trades_rejected': self.portfolio.rejected,
+            'final': self.equity[-1] if self.equity else None,
+        }
+
+
+# ---- 数据库读取 ----
+
+def open_database(path):
+    return sqlite3.connect(f'file:{os.path.abspath(path)}?mode=ro', uri=True)
+
+
+def load_rules(c, account_id):
+    c.execute(f'SELECT {", ".join(alerts.RULE_FIELDS)} FROM alert_rules WHERE account_id = ? AND enabled = 1',
+              (account_id,))
+    return [alerts.AlertRule(*row) for row in c.fetchall()]
+
+
+def load_trades(c, account_id):
+    c.execute('SELECT date, symbol, type, price, quantity FROM transactions WHERE account_id = ? ORDER BY id',
+              (account_id,))
+    trades = [(parse_db_time(date), symbol, trade_type, price, quantity)
+              for date, symbol, trade_type, price, quantity in c.fetchall()]
+    # 成交时间相同的交易保持写入顺序
+    trades.sort(key=lambda trade: trade[0])
+    return trades
+
+
+def load_method(c):
+    c.execute("SELECT value FROM ledger_settings WHERE name = 'cost_method'")
+    row = c.fetchone()
+    return row[0] if row else lots.method_from_env()
+
+
+def watched_symbols(c, account_id):
+    # 账户关注的代码及参考价格（持仓均价），用于生成模拟报价
+    c.execute('''
+        SELECT symbol FROM stocks WHERE account_id = ?
+        UNION SELECT symbol FROM positions WHERE account_id = ? AND quantity > 0
+        UNION SELECT symbol FROM alert_rules WHERE account_id = ? AND enabled = 1
+    ''', (account_id, account_id, account_id))
+    symbols = sorted(row[0] for row in c.fetchall())
+    c.execute('SELECT symbol, cost / quantity FROM positions WHERE account_id = ? AND quantity > 0', (account_id,))
+    return symbols, dict(c.fetchall())
+
+
+def write_events(path, events):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('ts', 'time', 'rule_id', 'symbol', 'direction', 'threshold', 'event', 'price'))
+        for ts, rule, event, price in events:
+            writer.writerow((ts, datetime.fromtimestamp(ts).isoformat(timespec='seconds'), rule.id, rule.symbol,
+                             rule.direction, rule.threshold, event, price))
+
+
+def write_equity(path, points):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('ts', 'time', 'market_value', 'cost', 'unrealized', 'realized'))
+        for point in points:
+            writer.writerow((point['ts'], datetime.fromtimestamp(point['ts']).isoformat(timespec='seconds'),
+                             point['market_value'], point['cost'], point['unrealized'], point['realized']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='行情回放 / 回测')
+    parser.add_argument('source', nargs='?', help='CSV 报价文件、价格历史目录或单个 .ts 段文件')
+    parser.add_argument('--synthetic', type=int, default=0, help='不读取文件，生成这么多条模拟报价')
+    parser.add_argument('--db', default=os.environ.get('DB_PATH', 'stock_monitor.db'), help='读取提醒规则和交易记录的数据库')
+    parser.add_argument('--account', type=int, default=accounts.DEFAULT_ACCOUNT)
+    parser.add_argument('--method', choices=lots.METHODS, help='成本法，默认与数据库中的一致')
+    parser.add_argument('--symbols', type=lambda v: {s for s in v.split(',') if s}, help='只回放这些代码（价格历史）')
+    parser.add_argument('--start', type=parse_ts, help='起始时间（价格历史）')
+    parser.add_argument('--end', type=parse_ts, help='结束时间（价格历史）')
+    parser.add_argument('--speed', type=float, default=0.0, help='回放速度倍数，0 为尽可能快')
+    parser.add_argument('--sample', type=float, default=60.0, help='权益曲线的采样间隔（报价时间，秒）')
+    parser.add_argument('--events', help='提醒事件写入的 CSV 文件')
+    parser.add_argument('--equity', help='权益曲线写入的 CSV 文件')
+    args = parser.parse_args(argv)
+
+    if not args.source and not args.synthetic:
+        parser.error('需要指定报价文件或 --synthetic')
+    conn = open_database(args.db)
+    try:
+        c = conn.cursor()
+        rules = load_rules(c, args.account)
+        trades = load_trades(c, args.account)
+        method = args.method or load_method(c)
+        symbols, reference = watched_symbols(c, args.account) if args.synthetic else ([], {})
+    finally:
+        conn.close()
+
+    if args.synthetic:
+        ticks = synthetic(symbols or ['000001'], args.synthetic, reference)
+    elif os.path.isdir(args.source) or args.source.endswith('.ts'):
+        ticks = read_history(args.source, args.symbols, args.start, args.end)
+    else:
+        ticks = read_csv(args.source)
+
+    replay = Replay(rules, trades, method, args.account, args.sample)
+    try:
+        summary = replay.run(ticks, args.speed)
+    except TickError as e:
+        sys.exit(f'报价读取失败，{e}')
+    if args.events:
+        write_events(args.events, replay.events)
+    if args.equity:
+        write_equity(args.equity, replay.equity)
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# 按数据版本缓存序列化后的接口响应
+# 写操作递增相关的版本号；缓存键包含版本号，数据不变时重复请求只需一次字典查找
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class DataVersions:
+    # 命名的数据版本计数器，例如 watchlist / ledger / alerts
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *names):
+        with self._lock:
+            for name in names:
+                self._counters[name] = self._counters.get(name, 0) + 1
+
+    def get(self, name):
+        return self._counters.get(name, 0)
+
+    def key(self, names):
+        counters = self._counters
+        return tuple(counters.get(name, 0) for name in names)
+
+
+class CachedResponse:
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    # 有界缓存，按写入顺序淘汰；版本变化后旧键不会再被访问，很快被挤出
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, body):
+        entry = CachedResponse(body)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,260 @@
+# 生产环境启动入口：多个 worker 进程共用同一个数据库文件，状态通过 shared 模块保持一致
+# 配置通过环境变量完成：
+#   WORKERS           worker 进程数，默认 CPU 核数
+#   THREADS           gunicorn 模式下每个 worker 的线程数，默认 8
+#   PORT              监听端口，默认 80
+#   GRACEFUL_TIMEOUT  平滑重启或退出时等待处理中请求的秒数，默认 30
+#   SERVER            auto（默认，安装了 gunicorn 时使用 gunicorn）/ gunicorn / builtin
+#   ACCESS_LOG        内置服务是否打印访问日志，默认 0
+# 内置服务为 pre-fork 模型：主进程执行迁移、创建监听 socket 后 fork 出 worker，各 worker 在同一个 socket 上 accept
+# 主进程信号：HUP 平滑重启（新一批 worker 就绪后，旧 worker 处理完请求再退出），TERM / INT 停止服务
+#
+# 用法：python serve.py          启动服务
+#       python serve.py migrate  只执行数据库迁移
+import importlib.util
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 空闲的 keep-alive 连接保持的秒数，平滑退出时最多因此多等待这么久
+KEEPALIVE_TIMEOUT = 15
+READY_TIMEOUT = 60
+
+logger = logging.getLogger('serve')
+
+
+def migrate():
+    sys.path.insert(0, ROOT)
+    import db
+    import migrations
+    database = db.open_from_env()
+    try:
+        database.migrate(migrations.MIGRATIONS)
+    finally:
+        database.close()
+
+
+def run_migrations():
+    # 在子进程中迁移，主进程不导入应用代码，平滑重启时 worker 能加载到新代码
+    subprocess.run([sys.executable, os.path.abspath(__file__), 'migrate'], cwd=ROOT, check=True)
+
+
+def run_gunicorn(workers, threads, port, graceful_timeout):
+    args = [sys.executable, '-m', 'gunicorn',
+            '--workers', str(workers),
+            '--worker-class', 'gthread',
+            '--threads', str(threads),
+            '--bind', f'0.0.0.0:{port}',
+            '--graceful-timeout', str(graceful_timeout),
+            '--keep-alive', '5',
+            '--chdir', ROOT,
+            'wsgi:app']
+    os.execv(sys.executable, args)
+
+
+def run_worker(sock, ready_fd, graceful_timeout):
+    # fork 继承了主进程的信号处理，加载应用期间收到 TERM 直接退出
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    access_log = os.environ.get('ACCESS_LOG', '0') == '1'
+
+    class Handler(WSGIRequestHandler):
+        timeout = KEEPALIVE_TIMEOUT
+
+        def log_request(self, *args, **kwargs):
+            if access_log:
+                super().log_request(*args, **kwargs)
+
+    server = make_server('0.0.0.0', sock.getsockname()[1], app_module.app, threaded=True,
+                         request_handler=Handler, fd=sock.fileno())
+    # 退出时等待请求线程处理完成
+    server.daemon_threads = False
+    server.block_on_close = True
+    stopping = threading.Event()
+    stopped = threading.Event()
+
+    def stop():
+        # 停止 accept，结束推送连接；serve_forever 返回前会等待其余请求处理完成
+        server.shutdown()
+        app_module.shutdown()
+        stopped.set()
+
+    def on_term(signum, frame):
+        if not stopping.is_set():
+            stopping.set()
+            threading.Thread(target=stop, daemon=True).start()
+            # 超过等待时间仍未结束的请求直接放弃
+            timer = threading.Timer(graceful_timeout, os._exit, (0,))
+            timer.daemon = True
+            timer.start()
+
+    signal.signal(signal.SIGTERM, on_term)
+    if ready_fd is not None:
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+    server.serve_forever()
+    stopped.wait()
+
+
+class Arbiter:
+    # 主进程：维持 worker 数量，处理平滑重启和停止
+    def __init__(self, sock, workers, graceful_timeout):
+        self.sock = sock
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.children = {}  # pid -> 所属批次
+        self.generation = 0
+        self.signals = []
+
+    def spawn(self, ready_fd=None, close_fd=None):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return pid
+        code = 0
+        try:
+            if close_fd is not None:
+                os.close(close_fd)
+            run_worker(self.sock, ready_fd, self.graceful_timeout)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def spawn_generation(self):
+        # 启动新一批 worker，等待每个 worker 通过管道报告就绪
+        self.generation += 1
+        r, w = os.pipe()
+        for _ in range(self.workers):
+            self.spawn(w, r)
+        os.close(w)
+        ready = 0
+        deadline = time.monotonic() + READY_TIMEOUT
+        try:
+            while ready < self.workers and time.monotonic() < deadline:
+                readable, _, _ = select.select([r], [], [], 0.5)
+                if readable:
+                    data = os.read(r, 64)
+                    if not data:
+                        break
+                    ready += len(data)
+        finally:
+            os.close(r)
+        return ready >= self.workers
+
+    def pids(self, generation):
+        return [pid for pid, g in self.children.items() if g == generation]
+
+    def signal_all(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation = self.children.pop(pid, None)
+            if generation == self.generation and status:
+                logger.warning('worker %s 异常退出 (status=%s)', pid, status)
+
+    def reload(self):
+        logger.info('平滑重启：启动新的 worker')
+        try:
+            run_migrations()
+        except subprocess.CalledProcessError:
+            logger.error('迁移失败，保留当前 worker')
+            return
+        old_generation = self.generation
+        if not self.spawn_generation():
+            # 新代码启动失败时继续由旧 worker 提供服务
+            logger.error('新 worker 未能就绪，保留当前 worker')
+            self.signal_all(self.pids(self.generation), signal.SIGKILL)
+            self.generation = old_generation
+            return
+        self.signal_all(self.pids(old_generation), signal.SIGTERM)
+
+    def stop(self):
+        logger.info('停止服务')
+        self.signal_all(list(self.children), signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.signal_all(list(self.children), signal.SIGKILL)
+        self.reap()
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.signals.append('reload'))
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.signals.append('stop'))
+        signal.signal(signal.SIGINT, lambda signum, frame: self.signals.append('stop'))
+        if not self.spawn_generation():
+            logger.error('worker 启动失败')
+            self.stop()
+            sys.exit(1)
+        logger.info('已启动 %s 个 worker，监听端口 %s', self.workers, self.sock.getsockname()[1])
+        while True:
+            self.reap()
+            if 'stop' in self.signals:
+                self.stop()
+                return
+            if 'reload' in self.signals:
+                self.signals.clear()
+                self.reload()
+            # 补齐意外退出的 worker
+            for _ in range(self.workers - len(self.pids(self.generation))):
+                self.spawn()
+            time.sleep(0.5)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(process)d] %(message)s')
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        migrate()
+        return
+
+    workers = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+    threads = int(os.environ.get('THREADS', 8))
+    port = int(os.environ.get('PORT', 80))
+    graceful_timeout = float(os.environ.get('GRACEFUL_TIMEOUT', 30))
+    server = os.environ.get('SERVER', 'auto')
+    if os.environ.get('DB_PATH') == ':memory:':
+        sys.exit('多进程模式需要使用数据库文件，请设置 DB_PATH')
+    os.environ['SHARED_STATE'] = '1'
+    # 启动优化模式下迁移由各 worker 在后台执行（迁移可以安全地并发执行），不再先启动一个迁移进程
+    if os.environ.get('FAST_START', '0') != '1':
+        run_migrations()
+
+    if server == 'gunicorn' or (server == 'auto' and importlib.util.find_spec('gunicorn')):
+        run_gunicorn(workers, threads, port, int(graceful_timeout))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('0.0.0.0', port))
+    sock.listen(2048)
+    Arbiter(sock, workers, graceful_timeout).run()
+
+
+if __name__ == '__main__':
+    main()
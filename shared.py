@@ -0,0 +1,143 @@
+# 多进程共享状态：多个 worker 进程使用同一个数据库文件时，让数据版本、价格快照和提醒状态保持一致
+#   SharedVersions  数据版本计数器放在内存映射文件里，所有进程读到同一份，读取不需要系统调用
+#   LeaderLock      用 flock 选出一个 leader 进程，负责轮询行情、评估提醒和刷写价格历史；leader 退出后其他进程接手
+#   quotes 表       leader 把每次刷新的报价连同递增序号写入 quotes 表，其他进程按序号增量读取
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 各版本在文件中的位置由顺序决定，只能在末尾追加
+VERSION_NAMES = ('watchlist', 'ledger', 'alerts', 'prices')
+_SLOT_COUNT = 64
+_SLOT = struct.Struct('<q')
+
+QUOTES_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS quotes (
+        symbol TEXT PRIMARY KEY,
+        price REAL NOT NULL,
+        ts REAL NOT NULL,
+        seq INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_quotes_seq ON quotes (seq)',
+]
+
+
+def create_tables(c):
+    for sql in QUOTES_SCHEMA:
+        c.execute(sql)
+
+
+class SharedVersions:
+    # 与 respcache.DataVersions 接口相同；递增时加文件锁，读取直接从映射内存解码
+    def __init__(self, path, names=VERSION_NAMES):
+        self.path = path
+        self._slots = {name: i * _SLOT.size for i, name in enumerate(names)}
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = _SLOT.size * _SLOT_COUNT
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+        # 本进程最后一次递增后的值，用来区分其他进程的修改
+        self._own = {}
+
+    def bump(self, *names):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                for name in names:
+                    offset = self._slots[name]
+                    value = _SLOT.unpack_from(self._map, offset)[0] + 1
+                    _SLOT.pack_into(self._map, offset, value)
+                    self._own[name] = value
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def get(self, name):
+        return _SLOT.unpack_from(self._map, self._slots[name])[0]
+
+    def key(self, names):
+        data = self._map
+        slots = self._slots
+        return tuple(_SLOT.unpack_from(data, slots[name])[0] for name in names)
+
+    def remote_changes(self, seen):
+        # 与上次看到的版本 seen 比较并更新 seen，返回被其他进程修改过的名称集合
+        changed = set()
+        for name in self._slots:
+            value = self.get(name)
+            if seen.get(name) != value:
+                seen[name] = value
+                if self._own.get(name) != value:
+                    changed.add(name)
+        return changed
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class LeaderLock:
+    # 非阻塞地尝试获取排他文件锁；进程退出（包括崩溃）时由操作系统释放
+    def __init__(self, path):
+        self.path = path
+        self.held = False
+        self._fd = None
+
+    def try_acquire(self):
+        if self.held:
+            return True
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self.held = True
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.held = False
+
+
+def write_quotes(c, prices, ts):
+    # 在调用方的写事务中执行，序号取表内最大值加一，提交顺序与序号顺序一致
+    seq = c.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM quotes').fetchone()[0]
+    c.executemany('''
+        INSERT INTO quotes (symbol, price, ts, seq) VALUES (?, ?, ?, ?)
+        ON CONFLICT (symbol) DO UPDATE SET price = excluded.price, ts = excluded.ts, seq = excluded.seq
+    ''', [(symbol, price, ts, seq) for symbol, price in prices.items()])
+    return seq
+
+
+def read_quotes(c, since):
+    # 返回 ([(时间戳, {代码: 价格})], 最大序号)，同一批刷新的报价合并为一组
+    c.execute('SELECT symbol, price, ts, seq FROM quotes WHERE seq > ? ORDER BY seq', (since,))
+    batches = []
+    last_seq = since
+    for symbol, price, ts, seq in c.fetchall():
+        if seq != last_seq or not batches or batches[-1][0] != ts:
+            batches.append((ts, {}))
+        batches[-1][1][symbol] = price
+        last_seq = seq
+    return batches, last_seq
+
+
+def run_sync(step, interval, stop_event):
+    # 各 worker 的同步线程：周期性执行 step（竞选 leader、拉取其他进程的变化）
+    while not stop_event.is_set():
+        try:
+            step()
+        except Exception:
+            logger.exception('同步共享状态失败')
+        stop_event.wait(interval)
@@ -0,0 +1,98 @@
+# Server-Sent Events 推送：连接时先发完整快照，之后只推送变化的部分
+# 事件类型：snapshot / price / alert / position / stock_added / stock_removed
+# 订阅时可以指定主题（账户），按主题发布的事件只发给该主题的订阅者，不指定主题的事件发给所有人
+import json
+import queue
+import threading
+
+# 没有事件时定期发送注释行，防止代理和浏览器断开空闲连接
+KEEPALIVE_SECONDS = 15
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+class EventBroker:
+    # 每个订阅者一个有界队列；队列满说明客户端太慢，直接断开让它重连后重新拿快照
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self._subscribers = {}  # 队列 -> 主题
+        self._topics = {}  # 主题 -> 队列集合
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def topics(self):
+        # 当前有订阅者的主题
+        return list(self._topics)
+
+    def subscribe(self, topic=None):
+        q = queue.Queue(self.max_queue)
+        with self._lock:
+            self._subscribers[q] = topic
+            self._topics.setdefault(topic, set()).add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q not in self._subscribers:
+                return
+            topic = self._subscribers.pop(q)
+            queues = self._topics[topic]
+            queues.discard(q)
+            if not queues:
+                del self._topics[topic]
+
+    def publish(self, event, data, topic=None):
+        # topic 为 None 时发给所有订阅者，否则只发给该主题的订阅者
+        if not self._subscribers or (topic is not None and topic not in self._topics):
+            return
+        # 每个事件只序列化一次，所有订阅者共享
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers if topic is None else self._topics.get(topic, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                self.unsubscribe(q)
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(None)
+
+    def close(self):
+        # 服务停止时结束所有推送连接，客户端会按 retry 间隔重连到其他 worker
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, {}
+            self._topics = {}
+        for q in subscribers:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(None)
+
+    def stream(self, q, initial):
+        # initial 为连接建立时发送的快照数据；None 表示服务端要求断开
+        try:
+            yield 'retry: 3000\n\n'
+            yield format_event('snapshot', initial)
+            while True:
+                try:
+                    message = q.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(q)
@@ -0,0 +1,232 @@
+# 证券主数据：代码、交易所、名称、拼音首字母，从本地 CSV 文件加载（表头 code,exchange,name[,pinyin]）
+# 配置通过环境变量完成：
+#   SYMBOLS_FILE             主数据文件路径，默认 symbols.csv；文件不存在时不校验代码，只做格式规范化
+#   SYMBOLS_RELOAD_INTERVAL  检查文件是否修改的周期（秒），默认 5
+# 同一代码可能在不同交易所各有一只证券（如 000001.SH 上证指数、000001.SZ 平安银行），证券按 (代码, 交易所) 区分
+# 库中保存、报价和提醒使用带交易所的标准写法 qualify(代码, 交易所)，例如 600000.SH
+# 索引为代码、名称、拼音首字母三个排序数组，前缀查询用二分定位区间，代价与返回条数成正比
+# 文件修改后在后台线程构建新索引，构建完成后整体替换引用，请求线程读取时不加锁
+# pinyin 列为空时，如果安装了 pypinyin 则自动生成首字母
+import csv
+import logging
+import os
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+try:
+    import pypinyin
+except ImportError:  # pypinyin 为可选依赖
+    pypinyin = None
+
+logger = logging.getLogger(__name__)
+
+Symbol = namedtuple('Symbol', ('code', 'exchange', 'name', 'pinyin'))
+
+# 交易所写法 -> 标准写法
+EXCHANGES = {
+    'SH': 'SH', 'SS': 'SH', 'SSE': 'SH', 'XSHG': 'SH',
+    'SZ': 'SZ', 'SZSE': 'SZ', 'XSHE': 'SZ',
+    'BJ': 'BJ', 'BSE': 'BJ',
+}
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# 匹配类型，数值越小排名越靠前
+_EXACT_CODE, _CODE_PREFIX, _EXACT_NAME, _NAME_PREFIX, _PINYIN_PREFIX = range(5)
+
+
+def clean(text):
+    # 全角字符转半角、去掉空白、字母转大写
+    return ''.join(unicodedata.normalize('NFKC', text).split()).upper()
+
+
+def split_exchange(text):
+    # 拆出交易所前缀或后缀：sh600000、SH.600000、SH:600000、600000.SH、600000.SS -> ('600000', 'SH')
+    # 没有交易所部分时返回 (text, None)；text 应已经过 clean()
+    for sep in ('.', ':'):
+        if sep in text:
+            left, _, right = text.partition(sep)
+            if right in EXCHANGES:
+                return left, EXCHANGES[right]
+            if left in EXCHANGES:
+                return right, EXCHANGES[left]
+    if text[:2] in EXCHANGES and text[2:].isdigit():
+        return text[2:], EXCHANGES[text[:2]]
+    return text, None
+
+
+def qualify(code, exchange):
+    # 标准写法：代码.交易所；交易所未知时只有代码
+    return f'{code}.{exchange}' if exchange else code
+
+
+def initials(name):
+    if pypinyin is None:
+        return ''
+    return ''.join(item[0] for item in pypinyin.lazy_pinyin(name, style=pypinyin.Style.FIRST_LETTER)
+                   if item).upper()
+
+
+def _sorted_keys(pairs):
+    pairs.sort()
+    return [key for key, _ in pairs], [i for _, i in pairs]
+
+
+class SymbolIndex:
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+        # (代码, 交易所) -> 证券；代码 -> 各交易所的证券，按交易所排序
+        self.by_symbol = {}
+        self.by_code = {}
+        by_name = {}
+        for entry in sorted(self.entries, key=lambda e: e.exchange):
+            self.by_symbol[(entry.code, entry.exchange)] = entry
+            self.by_code.setdefault(entry.code, []).append(entry)
+            by_name.setdefault(clean(entry.name), []).append(entry)
+        # 只有唯一的名称可以直接换算成代码
+        self.by_name = {name: matches[0] for name, matches in by_name.items() if len(matches) == 1}
+        self._codes = _sorted_keys([(entry.code, i) for i, entry in enumerate(self.entries)])
+        self._names = _sorted_keys([(clean(entry.name), i) for i, entry in enumerate(self.entries)])
+        self._pinyin = _sorted_keys([(entry.pinyin, i) for i, entry in enumerate(self.entries) if entry.pinyin])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _prefix(self, index, prefix):
+        keys, ids = index
+        lo = bisect_left(keys, prefix)
+        hi = bisect_left(keys, prefix + '\uffff', lo)
+        for i in range(lo, hi):
+            yield keys[i], self.entries[ids[i]]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        # 返回 [(匹配类型, Symbol)]：代码完全匹配、代码前缀、名称完全匹配、名称前缀、拼音首字母前缀，
+        # 同一类型内按键的字典序；每个证券（代码 + 交易所）只出现一次；查询带交易所时代码完全匹配只取该交易所
+        text = clean(query)
+        if not text or limit <= 0:
+            return []
+        code, exchange = split_exchange(text)
+        results = []
+        seen = set()
+
+        def take(kind, matches):
+            for _, entry in matches:
+                key = (entry.code, entry.exchange)
+                if key not in seen:
+                    seen.add(key)
+                    results.append((kind, entry))
+                    if len(results) >= limit:
+                        return True
+            return False
+
+        exact = [(code, entry) for entry in self.by_code.get(code, ())
+                 if exchange is None or entry.exchange == exchange]
+        if take(_EXACT_CODE, exact):
+            return results
+        if take(_CODE_PREFIX, self._prefix(self._codes, code)):
+            return results
+        name_matches = list(self._prefix(self._names, text))
+        if take(_EXACT_NAME, [m for m in name_matches if m[0] == text]):
+            return results
+        if take(_NAME_PREFIX, name_matches):
+            return results
+        take(_PINYIN_PREFIX, self._prefix(self._pinyin, text))
+        return results
+
+    def resolve(self, symbol, name=None):
+        # 规范化用户输入的代码，返回 (标准写法, 名称)；主数据中没有时抛出 ValueError
+        # 不带交易所的代码只在一个交易所上市时才能确定；也接受唯一的证券名称；name 为空时使用主数据中的名称
+        text = clean(symbol)
+        if not text:
+            raise ValueError('缺少股票代码')
+        code, exchange = split_exchange(text)
+        if not self.entries:
+            symbol = qualify(code, exchange)
+            return symbol, name or symbol
+        listings = self.by_code.get(code, [])
+        if exchange is not None:
+            entry = self.by_symbol.get((code, exchange))
+            if entry is None and listings:
+                raise ValueError(f'{code} 不在交易所 {exchange}')
+        elif len(listings) > 1:
+            choices = '、'.join(qualify(e.code, e.exchange) for e in listings)
+            raise ValueError(f'{code} 在多个交易所上市，请指定交易所: {choices}')
+        else:
+            entry = listings[0] if listings else self.by_name.get(text)
+        if entry is None:
+            raise ValueError(f'未知的股票代码: {symbol}')
+        return qualify(entry.code, entry.exchange), name or entry.name
+
+
+def load(path):
+    entries = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+            code, exchange = split_exchange(clean(row.get('code') or ''))
+            name = (row.get('name') or '').strip()
+            if not code or not name:
+                logger.warning('证券主数据 %s 第 %s 行缺少代码或名称，已跳过', path, line)
+                continue
+            exchange = EXCHANGES.get(clean(row.get('exchange') or ''), exchange) or ''
+            pinyin = clean(row.get('pinyin') or '') or initials(name)
+            entries.append(Symbol(code, exchange, name, pinyin))
+    return SymbolIndex(entries)
+
+
+class SymbolMaster:
+    # 持有当前索引；reload() 在文件修改后重建并替换
+    def __init__(self, path=None):
+        self.path = path
+        self.index = SymbolIndex()
+        self.loaded_at = None
+        self.reloads = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        # 文件有变化时重新加载，返回是否替换了索引；加载失败时保留旧索引
+        if not self.path:
+            return False
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._mtime:
+                return False
+            try:
+                index = load(self.path) if mtime is not None else SymbolIndex()
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                logger.error('证券主数据 %s 加载失败: %s', self.path, e)
+                return False
+            self._mtime = mtime
+            self.index = index
+            self.loaded_at = mtime / 1e9 if mtime is not None else None
+            self.reloads += 1
+            logger.info('证券主数据已加载: %s 条', len(index))
+            return True
+
+    def run_watcher(self, interval, stop_event, on_reload=None):
+        # on_reload 在每次替换索引后调用
+        while not stop_event.wait(interval):
+            if self.reload() and on_reload is not None:
+                try:
+                    on_reload()
+                except Exception:
+                    logger.exception('证券主数据重新加载后的处理失败')
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        return self.index.search(query, limit)
+
+    def resolve(self, symbol, name=None):
+        return self.index.resolve(symbol, name)
+
+
+def create_master_from_env(load=True):
+    master = SymbolMaster(os.environ.get('SYMBOLS_FILE', 'symbols.csv'))
+    if load:
+        master.reload()
+    return master
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    database = db.Database(':memory:')
+    database.migrate(migrations.MIGRATIONS)
+    yield database
+    database.close()
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    # 应用在导入时读取环境变量：内存库 + 临时目录下的操作日志，不写历史行情，不加载证券主数据
+    directory = tmp_path_factory.mktemp('app')
+    os.environ.update({
+        'DB_PATH': ':memory:',
+        'JOURNAL_DIR': str(directory / 'journal'),
+        'JOURNAL_SNAPSHOT_INTERVAL': '3600',
+        'HISTORY_DIR': '',
+        'SYMBOLS_FILE': str(directory / 'symbols.csv'),
+        'FAST_START': '0',
+    })
+    import app
+    yield app
@@ -0,0 +1,76 @@
+import json
+import time
+
+
+def new_account(client, name):
+    return {'X-Account-Id': str(client.post('/api/accounts', json={'name': name}).get_json()['id'])}
+
+
+def test_accounts_do_not_see_or_modify_each_others_data(app_module):
+    client = app_module.app.test_client()
+    a, b = new_account(client, 'A'), new_account(client, 'B')
+    assert client.post('/api/stock/add', headers=a, json={'symbol': 'ISO'}).get_json()['success']
+    stock_id = client.get('/api/stocks', headers=a).get_json()[0]['id']
+    assert client.post('/api/transaction/add', headers=a,
+                       json={'symbol': 'ISO', 'type': 'buy', 'price': 10, 'quantity': 100}).status_code == 200
+    rule = client.post('/api/alerts', headers=a,
+                       json={'symbol': 'ISO', 'direction': 'above', 'threshold': 20}).get_json()['rule']
+
+    assert client.get('/api/stocks', headers=b).get_json() == []
+    assert client.get('/api/transactions', headers=b).get_json()['items'] == []
+    assert client.get('/api/portfolio', headers=b).get_json() == []
+    assert client.get('/api/lots/ISO', headers=b).get_json()['lots'] == []
+    assert client.get('/api/alerts', headers=b).get_json() == []
+    assert client.get('/api/alerts/events', headers=b).get_json() == []
+
+    # 另一个账户的修改和删除不生效
+    assert client.put(f'/api/alerts/{rule["id"]}', headers=b, json={'threshold': 1}).status_code == 404
+    assert client.delete(f'/api/alerts/{rule["id"]}', headers=b).status_code == 404
+    assert client.put(f'/api/stock/{stock_id}/thresholds', headers=b, json={'high_price': 1}).status_code == 404
+    client.delete(f'/api/stock/delete/{stock_id}', headers=b)
+    # 同一代码在 B 中是独立的持仓，不能卖出 A 的持仓
+    assert client.post('/api/transaction/add', headers=b,
+                       json={'symbol': 'ISO', 'type': 'sell', 'price': 10, 'quantity': 10}).status_code == 400
+
+    assert [stock['id'] for stock in client.get('/api/stocks', headers=a).get_json()] == [stock_id]
+    assert len(client.get('/api/transactions', headers=a).get_json()['items']) == 1
+    assert [p['quantity'] for p in client.get('/api/portfolio', headers=a).get_json()] == [100]
+    assert [r['threshold'] for r in client.get('/api/alerts', headers=a).get_json()] == [20]
+
+
+def drain(q):
+    # 取出队列中的推送，返回 [(事件, 数据)]
+    events = []
+    while not q.empty():
+        message = q.get_nowait()
+        lines = message.splitlines()
+        events.append((lines[0][len('event: '):], json.loads(lines[1][len('data: '):])))
+    return events
+
+
+def test_price_events_only_reach_accounts_watching_the_symbol(app_module):
+    client = app_module.app.test_client()
+    a, b = new_account(client, 'A'), new_account(client, 'B')
+    assert client.post('/api/stock/add', headers=a, json={'symbol': 'PXA'}).get_json()['success']
+    assert client.post('/api/transaction/add', headers=b,
+                       json={'symbol': 'PXB', 'type': 'buy', 'price': 10, 'quantity': 100}).status_code == 200
+    queues = {name: app_module.event_broker.subscribe(int(headers['X-Account-Id']))
+              for name, headers in (('a', a), ('b', b))}
+    try:
+        now = time.time()
+        app_module.on_price_update({'PXA': (11.0, now), 'PXB': (12.0, now), 'PXN': (13.0, now)}, 1)
+        quotes = {name: {} for name in queues}
+        positions = {name: [] for name in queues}
+        for name, q in queues.items():
+            for event, data in drain(q):
+                if event == 'price':
+                    quotes[name].update(data['quotes'])
+                elif event == 'position':
+                    positions[name].append(data['symbol'])
+    finally:
+        for q in queues.values():
+            app_module.event_broker.unsubscribe(q)
+    assert set(quotes['a']) & {'PXA', 'PXB', 'PXN'} == {'PXA'}
+    assert quotes['a']['PXA']['current_price'] == 11.0
+    assert set(quotes['b']) & {'PXA', 'PXB', 'PXN'} == {'PXB'}
+    assert 'PXB' in positions['b'] and 'PXB' not in positions['a']
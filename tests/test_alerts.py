@@ -0,0 +1,95 @@
+import random
+
+import alerts
+
+
+def account_headers(client):
+    return {'X-Account-Id': str(client.post('/api/accounts', json={'name': '测试'}).get_json()['id'])}
+
+
+def test_delete_rule_of_other_account_is_rejected(app_module):
+    client = app_module.app.test_client()
+    owner, other = account_headers(client), account_headers(client)
+    rule = client.post('/api/alerts', headers=owner,
+                       json={'symbol': 'RULE', 'direction': 'above', 'threshold': 10}).get_json()['rule']
+    # 内存中的规则与库不一致时也不能删除其他账户的规则
+    app_module.alert_engine.remove(rule['id'])
+    assert client.delete(f'/api/alerts/{rule["id"]}', headers=other).status_code == 404
+    c = app_module.database.cursor()
+    c.execute('SELECT COUNT(*) FROM alert_rules WHERE id = ?', (rule['id'],))
+    assert c.fetchone()[0] == 1
+    assert client.delete(f'/api/alerts/{rule["id"]}', headers=owner).status_code == 200
+    c.execute('SELECT COUNT(*) FROM alert_rules WHERE id = ?', (rule['id'],))
+    assert c.fetchone()[0] == 0
+
+
+def test_non_finite_threshold_is_rejected(app_module):
+    client = app_module.app.test_client()
+    for value in ('nan', 'inf', '-inf'):
+        response = client.post('/api/alerts', json={'symbol': 'RULE', 'direction': 'above', 'threshold': value})
+        assert response.status_code == 400
+
+
+def events(engine, symbol, price, now):
+    return [(rule.id, event) for rule, event, _ in engine.on_price(symbol, price, now)]
+
+
+def test_rule_fires_rearms_after_hysteresis_and_respects_cooldown():
+    engine = alerts.AlertEngine()
+    engine.upsert(alerts.AlertRule(1, 'A', 'above', 10.0, hysteresis=1.0, cooldown=60.0))
+    engine.upsert(alerts.AlertRule(2, 'A', 'below', 5.0, hysteresis=0.5))
+    assert events(engine, 'A', 9.0, 0) == []
+    assert events(engine, 'A', 10.0, 1) == [(1, 'triggered')]
+    # 已触发的规则不重复触发；回落未越过解除线（10 - 1）时不解除
+    assert events(engine, 'A', 10.5, 2) == []
+    assert events(engine, 'A', 9.2, 3) == []
+    assert events(engine, 'A', 10.2, 4) == []
+    assert events(engine, 'A', 8.9, 5) == [(1, 'cleared')]
+    # 冷却期内再次穿越：状态变为已触发但不产生事件，冷却期从上次记录的触发算起
+    assert events(engine, 'A', 10.1, 30) == []
+    assert engine.get(1).active
+    assert events(engine, 'A', 8.0, 40) == [(1, 'cleared')]
+    assert events(engine, 'A', 11.0, 61) == [(1, 'triggered')]
+    assert engine.get(1).last_fired == 61
+    # 一次大跌同时解除 above 规则并触发 below 规则
+    assert sorted(events(engine, 'A', 4.0, 70)) == [(1, 'cleared'), (2, 'triggered')]
+    assert events(engine, 'A', 5.4, 71) == []
+    assert events(engine, 'A', 5.6, 72) == [(2, 'cleared')]
+
+
+def test_upsert_evaluates_against_last_price():
+    engine = alerts.AlertEngine()
+    assert [event for _, event, _ in engine.upsert(alerts.AlertRule(1, 'A', 'below', 5.0), 4.0, 0)] == ['triggered']
+    # 同一方向修改阈值保留触发状态和冷却时间，不重复触发
+    assert engine.upsert(alerts.AlertRule(1, 'A', 'below', 4.5, cooldown=60.0), now=1) == []
+    assert [event for _, event, _ in engine.upsert(alerts.AlertRule(1, 'A', 'below', 3.0), now=2)] == ['cleared']
+    assert engine.upsert(alerts.AlertRule(1, 'A', 'below', 4.5, enabled=False), now=3) == []
+    assert events(engine, 'A', 1.0, 4) == []
+
+
+def test_incremental_evaluation_matches_per_rule_state_machine():
+    # 二分查找只处理被穿越的阈值，结果应与逐条规则按状态机判断一致
+    rng = random.Random(7)
+    rules = [alerts.AlertRule(i, 'A', rng.choice(('above', 'below')), rng.randint(80, 120) / 2,
+                              rng.choice((0.0, 0.5, 2.0)), rng.choice((0.0, 5.0)))
+             for i in range(1, 41)]
+    engine = alerts.AlertEngine()
+    for rule in rules:
+        engine.upsert(alerts.AlertRule(rule.id, rule.symbol, rule.direction, rule.threshold,
+                                       rule.hysteresis, rule.cooldown))
+    price = 50.0
+    for now in range(2000):
+        price = max(1.0, price + rng.choice((-3, -1, -0.5, 0, 0.5, 1, 3)))
+        expected = []
+        for rule in rules:
+            hit = price >= rule.threshold if rule.direction == 'above' else price <= rule.threshold
+            clear = price < rule.clear_key if rule.direction == 'above' else price > rule.clear_key
+            if hit and not rule.active:
+                rule.active = True
+                if rule.last_fired is None or now - rule.last_fired >= rule.cooldown:
+                    rule.last_fired = now
+                    expected.append((rule.id, 'triggered'))
+            elif clear and rule.active:
+                rule.active = False
+                expected.append((rule.id, 'cleared'))
+        assert sorted(events(engine, 'A', price, now)) == sorted(expected)
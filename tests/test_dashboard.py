@@ -0,0 +1,53 @@
+import gzip
+
+from werkzeug.http import parse_accept_header
+
+import dashboard
+
+
+def test_precompressed_variant_is_negotiated(app_module):
+    client = app_module.app.test_client()
+    plain = client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+    with open(dashboard.TEMPLATE_PATH, 'rb') as f:
+        assert plain.data == f.read()
+
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    # 各压缩版本的 ETag 不同
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert 'Content-Encoding' not in client.get('/', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+
+
+def test_etag_revalidation_returns_304(app_module):
+    client = app_module.app.test_client()
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    etag = response.headers['ETag']
+    not_modified = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert not_modified.headers['ETag'] == etag
+    # 持有另一个压缩版本的 ETag 同样说明内容未变
+    identity_etag = client.get('/').headers['ETag']
+    assert client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': identity_etag}).status_code == 304
+    assert client.get('/', headers={'If-None-Match': '*'}).status_code == 304
+    assert client.get('/', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_choose_encoding_follows_quality_values():
+    page = dashboard.StaticPage(b'<html></html>')
+    # 没有安装 brotli 时也测试 br 版本的选择
+    page.variants.setdefault('br', b'br')
+
+    def choose(header):
+        return page.choose_encoding(parse_accept_header(header))
+
+    assert choose('gzip, br') == 'br'
+    assert choose('gzip;q=1, br;q=0.5') == 'gzip'
+    assert choose('br;q=0, gzip;q=0') == 'identity'
+    assert choose('') == 'identity'
+    assert choose('*') == 'br'
+    assert page.etag_for('gzip') == page.etag + '-gzip'
@@ -0,0 +1,33 @@
+import os
+import threading
+
+import db
+
+
+def count_from_other_thread(database):
+    result = []
+    thread = threading.Thread(target=lambda: (result.append(
+        database.cursor().execute('SELECT COUNT(*) FROM stocks').fetchone()[0]), database.release()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_memory_readers_do_not_see_uncommitted_writes(database):
+    try:
+        with database.transaction() as c:
+            c.execute("INSERT INTO stocks (symbol, name) VALUES ('AAA', 'a')")
+            assert count_from_other_thread(database) == 0
+            raise RuntimeError('rollback')
+    except RuntimeError:
+        pass
+    assert count_from_other_thread(database) == 0
+
+
+def test_memory_database_files_removed_on_close():
+    database = db.Database(':memory:')
+    path = database._target[len('file:'):]
+    database.cursor().execute('CREATE TABLE t (x)')
+    assert os.path.exists(path)
+    database.close()
+    assert not os.path.exists(path)
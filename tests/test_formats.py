@@ -0,0 +1,114 @@
+import json
+import struct
+
+import pytest
+
+import formats
+
+ROWS = [
+    {'id': i, 'symbol': f'{600000 + i}.SH', 'name': '浦发银行' * (i % 3), 'current_price': 10.5 + i,
+     'change': -i, 'volume': 2 ** (i * 3), 'stale': i % 2 == 0, 'alert': None}
+    for i in range(20)
+]
+
+
+def unpack(data):
+    # 测试用的 MessagePack 解码，覆盖 formats.pack 产生的类型
+    value, offset = _unpack(data, 0)
+    assert offset == len(data)
+    return value
+
+
+def _unpack(data, offset):
+    tag = data[offset]
+    offset += 1
+    if tag < 0x80:
+        return tag, offset
+    if tag >= 0xe0:
+        return tag - 0x100, offset
+    if tag & 0xe0 == 0xa0:
+        return _str(data, offset, tag & 0x1f)
+    if tag & 0xf0 == 0x90:
+        return _array(data, offset, tag & 0x0f)
+    if tag & 0xf0 == 0x80:
+        return _map(data, offset, tag & 0x0f)
+    if tag in (0xc0, 0xc2, 0xc3):
+        return {0xc0: None, 0xc2: False, 0xc3: True}[tag], offset
+    if tag == 0xcb:
+        return struct.unpack_from('>d', data, offset)[0], offset + 8
+    fixed = {0xcc: 'B', 0xcd: 'H', 0xce: 'I', 0xcf: 'Q', 0xd0: 'b', 0xd1: 'h', 0xd2: 'i', 0xd3: 'q'}
+    if tag in fixed:
+        fmt = '>' + fixed[tag]
+        return struct.unpack_from(fmt, data, offset)[0], offset + struct.calcsize(fmt)
+    sized = {0xd9: ('B', _str), 0xda: ('H', _str), 0xdb: ('I', _str), 0xdc: ('H', _array), 0xdd: ('I', _array),
+             0xde: ('H', _map), 0xdf: ('I', _map), 0xc4: ('B', _bin), 0xc5: ('H', _bin), 0xc6: ('I', _bin)}
+    fmt, read = sized[tag]
+    n = struct.unpack_from('>' + fmt, data, offset)[0]
+    return read(data, offset + struct.calcsize(fmt), n)
+
+
+def _str(data, offset, n):
+    return data[offset:offset + n].decode('utf-8'), offset + n
+
+
+def _bin(data, offset, n):
+    return data[offset:offset + n], offset + n
+
+
+def _array(data, offset, n):
+    items = []
+    for _ in range(n):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _map(data, offset, n):
+    result = {}
+    for _ in range(n):
+        key, offset = _unpack(data, offset)
+        result[key], offset = _unpack(data, offset)
+    return result, offset
+
+
+def rows_from_columns(table):
+    columns = table['columns']
+    return [{field: values[i] for field, values in columns.items()} for i in range(table['length'])]
+
+
+@pytest.mark.parametrize('data', [ROWS, [], {'items': ROWS, 'next_cursor': 'abc'}])
+def test_columnar_and_msgpack_round_trip_to_json(monkeypatch, data):
+    expected = json.loads(formats.encode(data, formats.JSON))
+    columnar = json.loads(formats.encode(data, formats.COLUMNAR))
+    # 纯 Python 编码；安装了 msgpack 时两种编码的结果应能互相解码
+    monkeypatch.setattr(formats, 'msgpack', None)
+    packed = unpack(formats.encode(data, formats.MSGPACK))
+    assert packed == columnar
+    if isinstance(data, dict):
+        assert columnar['next_cursor'] == expected['next_cursor']
+        columnar, expected = columnar['items'], expected['items']
+    assert rows_from_columns(columnar) == expected
+
+
+def test_builtin_pack_edge_values(monkeypatch):
+    monkeypatch.setattr(formats, 'msgpack', None)
+    values = [0, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 64 - 1, -1, -32, -33, -2 ** 31,
+              -2 ** 31 - 1, -2 ** 63, 1.5, -0.0, '', 'x' * 31, 'x' * 32, 'x' * 256, 'x' * 65536, b'\x00' * 300,
+              list(range(16)), [float(i) for i in range(70000)], {str(i): i for i in range(16)}, True, False, None]
+    assert unpack(formats.pack(values)) == values
+    with pytest.raises(TypeError):
+        formats.pack(object())
+
+
+def test_list_endpoints_agree_across_formats(app_module):
+    client = app_module.app.test_client()
+    assert client.post('/api/stock/add', json={'symbol': 'FMT'}).get_json()['success']
+    expected = client.get('/api/stocks').get_json()
+    response = client.get('/api/stocks?format=columnar')
+    assert response.mimetype == formats.MIMETYPES[formats.COLUMNAR]
+    assert rows_from_columns(json.loads(response.data)) == expected
+    response = client.get('/api/stocks', headers={'Accept': 'application/x-msgpack'})
+    assert response.mimetype == formats.MIMETYPES[formats.MSGPACK]
+    assert rows_from_columns(unpack(response.data)) == expected
+    assert client.get('/api/stocks', headers={'Accept': '*/*'}).mimetype == 'application/json'
+    assert client.get('/api/stocks?format=xml').status_code == 406
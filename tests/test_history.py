@@ -0,0 +1,103 @@
+import os
+import random
+import time
+
+import pytest
+
+import history
+
+# 本地时间 2024-01-02 零点，K 线按本地时区对齐
+DAY = time.mktime((2024, 1, 2, 0, 0, 0, 0, 0, -1))
+
+
+def test_ring_buffer_keeps_latest_in_order():
+    buffer = history.RingBuffer(4)
+    for i in range(6):
+        buffer.append(float(i), i * 10.0)
+    ts, prices = buffer.items()
+    assert list(ts) == [2, 3, 4, 5]
+    assert list(prices) == [20, 30, 40, 50]
+    assert list(buffer.items(2)[0]) == [4, 5]
+    # 未落盘的条数不超过容量
+    assert buffer.unflushed == 4
+
+
+def test_record_flush_and_query(tmp_path):
+    store = history.HistoryStore(str(tmp_path), capacity=8)
+    # 跨越本地日期的报价按天写入不同文件
+    quotes = [(DAY - 120 + i * 60, 10.0 + i) for i in range(4)]
+    for ts, price in quotes:
+        store.record({'A/B': (price, ts), 'CCC': (price * 2, ts)})
+    assert store.symbol_count == 2
+    assert store.flush() == 8
+    assert store.flush() == 0
+    assert sorted(os.listdir(tmp_path / 'A%2FB')) == ['20240101.px', '20240101.ts', '20240102.px', '20240102.ts']
+
+    # 落盘之后的新报价只在内存中，查询时与磁盘数据合并且不重复
+    store.record({'A/B': (20.0, DAY + 300)})
+    ts, prices = store.query('A/B')
+    assert list(ts) == [q[0] for q in quotes] + [DAY + 300]
+    assert list(prices) == [q[1] for q in quotes] + [20.0]
+    ts, prices = store.query('A/B', DAY, DAY + 60)
+    assert list(zip(ts, prices)) == [(DAY, 12.0), (DAY + 60, 13.0)]
+
+    # 新的进程只能读到磁盘上的数据
+    reopened = history.HistoryStore(str(tmp_path), capacity=8)
+    assert list(reopened.query('A/B')[1]) == [q[1] for q in quotes]
+    assert list(reopened.query('CCC', DAY - 60)[1]) == [22.0, 24.0, 26.0]
+    assert list(reopened.query('missing')[0]) == []
+
+
+def test_memory_only_store_keeps_capacity(tmp_path):
+    store = history.HistoryStore(None, capacity=3)
+    for i in range(5):
+        store.record({'X': (float(i), DAY + i)})
+    assert store.flush() == 0
+    assert list(store.query('X')[1]) == [2.0, 3.0, 4.0]
+
+
+def expected_bars(ts, prices, seconds):
+    bars = {}
+    for t, p in zip(ts, prices):
+        bars.setdefault(DAY + (t - DAY) // seconds * seconds, []).append(p)
+    return {
+        'time': list(bars),
+        'open': [values[0] for values in bars.values()],
+        'high': [max(values) for values in bars.values()],
+        'low': [min(values) for values in bars.values()],
+        'close': [values[-1] for values in bars.values()],
+        'count': [len(values) for values in bars.values()],
+    }
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+@pytest.mark.parametrize('interval', ['1m', '5m', '1h', '1d'])
+def test_ohlc_buckets(monkeypatch, use_numpy, interval):
+    if use_numpy and not history.HAVE_NUMPY:
+        pytest.skip('需要 numpy')
+    if not use_numpy:
+        monkeypatch.setattr(history, '_load_numpy', lambda: None)
+    rng = random.Random(interval)
+    store = history.HistoryStore(None, capacity=5000)
+    t = DAY
+    for _ in range(3000):
+        t += rng.uniform(0.5, 90)
+        store.record({'K': (round(rng.uniform(5, 15), 2), t)})
+    ts, prices = store.query('K')
+    seconds = history.INTERVALS[interval]
+    bars = history.ohlc(ts, prices, seconds)
+    assert bars == expected_bars(list(ts), list(prices), seconds)
+    assert sum(bars['count']) == len(ts)
+    assert history.ohlc(ts[:0], prices[:0], seconds) == {key: [] for key in bars}
+
+
+def test_history_endpoint(app_module):
+    client = app_module.app.test_client()
+    app_module.history_store.record({'HIST.SH': (10.0, DAY)})
+    app_module.history_store.record({'HIST.SH': (12.0, DAY + 70)})
+    body = client.get('/api/history/HIST.SH?interval=1m').get_json()
+    assert body['time'] == [DAY, DAY + 60]
+    assert body['open'] == [10.0, 12.0] and body['count'] == [1, 1]
+    raw = client.get(f'/api/history/HIST.SH?start={DAY + 1}&limit=5').get_json()
+    assert raw['price'] == [12.0]
+    assert client.get('/api/history/HIST.SH?interval=2m').status_code == 400
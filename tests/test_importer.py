@@ -0,0 +1,38 @@
+import io
+
+import pytest
+
+import importer
+
+
+def records(body, fmt):
+    return list(importer.iter_records(io.BytesIO(body), fmt))
+
+
+def test_csv_invalid_utf8_is_reported_per_row(database):
+    body = b'symbol,type,price,quantity\nAAA,buy,10,100\nBBB,buy,\xff10,100\nCCC,buy,12,100\n'
+    with database.transaction() as c:
+        report = importer.import_transactions(c, importer.iter_records(io.BytesIO(body), 'csv'))
+    assert report.inserted == 2
+    assert report.errors == [{'line': 3, 'message': importer.ENCODING_ERROR}]
+
+
+def test_ndjson_invalid_utf8_is_reported_per_row():
+    body = b'{"symbol": "AAA", "name": "\xe5\xb9\xb3"}\n{"symbol": "BBB", "name": "\xe5\xb9"}\n'
+    result = records(body, 'ndjson')
+    assert result[0] == (1, {'symbol': 'AAA', 'name': '平'})
+    assert result[1] == (2, importer.ENCODING_ERROR)
+
+
+def test_parse_transaction_rejects_non_finite_and_huge_values():
+    for record in ({'price': 'nan', 'quantity': 100}, {'price': 'inf', 'quantity': 100},
+                   {'price': 10, 'quantity': 'nan'}, {'price': 10, 'quantity': 1e30}):
+        with pytest.raises(ValueError):
+            importer.parse_transaction(dict(record, symbol='AAA', type='buy'))
+
+
+def test_add_transaction_with_invalid_numbers_returns_400(app_module):
+    client = app_module.app.test_client()
+    for record in ({'price': 'nan', 'quantity': 100}, {'price': 10, 'quantity': 1e30}):
+        response = client.post('/api/transaction/add', json=dict(record, symbol='AAA', type='buy'))
+        assert response.status_code == 400
@@ -0,0 +1,188 @@
+import io
+import os
+import time
+
+import pytest
+
+import db
+import journal
+import lots
+import migrations
+import recovery
+
+
+def journal_size(directory):
+    return sum(os.path.getsize(path) for _, path in journal.segments(directory))
+
+
+def test_rolled_back_import_is_aborted_in_journal(app_module):
+    client = app_module.app.test_client()
+    body = 'symbol,type,price,quantity\n' + 'AAPL,buy,10,5\n' * 3000
+    end = journal_size(app_module.journal_dir)
+    c = app_module.database.cursor()
+    c.execute('SELECT COUNT(*) FROM transactions')
+    before = c.fetchone()[0]
+    # 声明的长度比实际内容长，读到末尾时视为客户端断开，整个导入回滚
+    response = client.post('/api/transactions/import?chunk=100', input_stream=io.BytesIO(body.encode()),
+                           content_type='text/csv', environ_overrides={'CONTENT_LENGTH': str(len(body) + 100)})
+    assert response.status_code == 400
+    c.execute('SELECT COUNT(*) FROM transactions')
+    assert c.fetchone()[0] == before
+    # 已写入的分块记录逐块追加，最后一条作废标记列出全部这些记录
+    records = list(journal.read(app_module.journal_dir, end))
+    chunks = [lsn for lsn, _, record in records if record['op'] == 'trades']
+    assert len(chunks) > 1
+    assert records[-1][2]['op'] == journal.ABORT_OP
+    assert recovery.aborted(app_module.journal_dir, end) == set(chunks)
+
+
+def new_account(client):
+    return {'X-Account-Id': str(client.post('/api/accounts', json={'name': '测试'}).get_json()['id'])}
+
+
+def restore(app_module):
+    # 从最近的快照和之后的日志恢复一个新的内存库
+    restored = db.Database(':memory:')
+    restored.migrate(migrations.MIGRATIONS)
+    with restored.transaction() as c:
+        state = recovery.recover(c, app_module.journal_dir, app_module.cost_method)
+    return restored, state
+
+
+def rows(database, sql, *params):
+    c = database.cursor()
+    c.execute(sql, params)
+    return c.fetchall()
+
+
+def test_snapshot_restores_compacted_state(app_module):
+    client = app_module.app.test_client()
+    headers = new_account(client)
+    for trade_type, price, quantity in (('buy', 10, 300), ('buy', 11, 200), ('sell', 12, 400)):
+        response = client.post('/api/transaction/add', headers=headers, json={
+            'symbol': 'SNAP', 'type': trade_type, 'price': price, 'quantity': quantity})
+        assert response.status_code == 200
+    with app_module.database.transaction() as c:
+        c.execute("INSERT INTO alert_events (rule_id, symbol, event, direction, threshold, price, created_at) "
+                  "VALUES (1, 'SNAP', 'trigger', 'above', 11, 12, 0)")
+    path = app_module.write_journal_snapshot()
+    assert path is not None
+    # 快照只有当前状态，不含交易记录和提醒事件
+    _, tables = journal.load_snapshot(path)
+    assert 'transactions' not in tables and 'alert_events' not in tables
+    client.post('/api/transaction/add', headers=headers, json={'symbol': 'SNAP', 'type': 'sell', 'price': 13,
+                                                               'quantity': 50})
+
+    restored, state = restore(app_module)
+    assert state['snapshot'] is not None and state['replayed'] > 0
+    for sql in (TABLES['stocks'], TABLES['positions'], TABLES['lots']):
+        assert rows(restored, sql) == rows(app_module.database, sql)
+    # 库中只有快照之后的交易记录，编号与原库一致；不能再按交易记录全量重算
+    ledger = 'SELECT id, account_id, symbol, type, price, quantity, date FROM transactions ORDER BY id'
+    assert rows(restored, ledger) == rows(app_module.database, ledger)[-1:]
+    assert rows(restored, 'SELECT COUNT(*) FROM alert_events') == [(0,)]
+    with restored.transaction() as c:
+        with pytest.raises(ValueError):
+            lots.rebuild(c, app_module.cost_method)
+    restored.close()
+
+
+TABLES = {
+    'stocks': 'SELECT id, account_id, symbol, name, high_price, low_price, created_at FROM stocks ORDER BY id',
+    'transactions': 'SELECT id, account_id, symbol, type, price, quantity, date FROM transactions ORDER BY id',
+    'alert_rules': 'SELECT id, account_id, symbol, direction, threshold, hysteresis, cooldown, enabled, stock_id '
+                   'FROM alert_rules ORDER BY id',
+    'positions': 'SELECT account_id, symbol, quantity, cost, realized FROM positions ORDER BY account_id, symbol',
+    'lots': 'SELECT account_id, symbol, quantity, price FROM lots ORDER BY account_id, symbol, id',
+}
+
+
+def test_snapshot_and_replay_skip_rolled_back_write(app_module, monkeypatch):
+    client = app_module.app.test_client()
+    headers = new_account(client)
+    for symbol in ('RT1', 'RT2'):
+        assert client.post('/api/stock/add', headers=headers, json={'symbol': symbol}).get_json()['success']
+    stock_id = rows(app_module.database, "SELECT id FROM stocks WHERE symbol = 'RT1'")[0][0]
+    client.post('/api/transaction/add', headers=headers, json={'symbol': 'RT1', 'type': 'buy', 'price': 10,
+                                                               'quantity': 100})
+    assert app_module.write_journal_snapshot() is not None
+    snapshot_transaction = rows(app_module.database, 'SELECT MAX(id) FROM transactions')[0][0]
+
+    # 快照之后的写操作由日志重放
+    for trade_type, price, quantity in (('buy', 12, 50), ('sell', 15, 120)):
+        assert client.post('/api/transaction/add', headers=headers, json={
+            'symbol': 'RT1', 'type': trade_type, 'price': price, 'quantity': quantity}).status_code == 200
+    assert client.put(f'/api/stock/{stock_id}/thresholds', headers=headers,
+                      json={'high_price': 20, 'low_price': 8}).status_code == 200
+    rule = client.post('/api/alerts', headers=headers,
+                       json={'symbol': 'RT2', 'direction': 'below', 'threshold': 5}).get_json()['rule']
+    assert client.put(f'/api/alerts/{rule["id"]}', headers=headers, json={'threshold': 6}).status_code == 200
+    body = 'symbol,type,price,quantity\nRT2,buy,7,10\nRT2,buy,8,30\nRT2,sell,9,20\n'
+    assert client.post('/api/transactions/import', headers=headers, data=body,
+                       content_type='text/csv').get_json()['inserted'] == 3
+    assert client.delete(f'/api/alerts/{rule["id"]}', headers=headers).status_code == 200
+
+    # 日志记录已追加、提交之前失败：事务回滚，日志中写入作废标记
+    records = app_module.op_journal.records
+    with monkeypatch.context() as patch:
+        def fail(c, lsn):
+            raise RuntimeError('提交前失败')
+        patch.setattr(recovery, 'set_lsn', fail)
+        response = client.post('/api/transaction/add', headers=headers, json={
+            'symbol': 'RT1', 'type': 'buy', 'price': 11, 'quantity': 1000})
+    assert response.status_code == 500
+    assert app_module.op_journal.records == records + 2
+    assert rows(app_module.database, "SELECT COUNT(*) FROM transactions WHERE quantity = 1000") == [(0,)]
+    client.post('/api/transaction/add', headers=headers, json={'symbol': 'RT1', 'type': 'sell', 'price': 9,
+                                                               'quantity': 10})
+
+    restored, state = restore(app_module)
+    assert state['snapshot'] is not None and state['replayed'] > 0
+    for name, sql in TABLES.items():
+        expected = rows(app_module.database, sql)
+        if name == 'transactions':
+            # 快照之前的交易记录不在快照中
+            expected = [row for row in expected if row[0] > snapshot_transaction]
+        assert rows(restored, sql) == expected
+    restored.close()
+
+    # 不使用快照从日志开头重建同样跳过被作废的记录
+    rebuilt = db.Database(':memory:')
+    rebuilt.migrate(migrations.MIGRATIONS)
+    with rebuilt.transaction() as c:
+        recovery.reconstruct(c, app_module.journal_dir, time.time() + 1, app_module.cost_method, full=True)
+    for sql in TABLES.values():
+        assert rows(rebuilt, sql) == rows(app_module.database, sql)
+    rebuilt.close()
+
+
+def test_segments_before_oldest_snapshot_are_pruned(tmp_path):
+    directory = str(tmp_path)
+    log = journal.Journal(directory, segment_bytes=200)
+    lsns = [log.append('account', {'id': i, 'name': 'x' * 40, 'created_at': ''}) for i in range(20)]
+    log.close()
+    starts = [start for start, _ in journal.segments(directory)]
+    assert len(starts) > 3
+    journal.write_snapshot(directory, lsns[9], {})
+    assert journal.prune_segments(directory, journal.snapshot_files(directory)[0][0]) > 0
+    # 快照位置之后的记录仍然可读，最后一段保留
+    assert journal.segments(directory)[0][0] <= lsns[9]
+    assert [lsn for lsn, _, _ in journal.read(directory, lsns[9])] == lsns[10:]
+    with pytest.raises(ValueError):
+        recovery._require_log_from(directory, 0)
+
+
+def test_valid_end_checks_tail_after_applied_position(tmp_path):
+    directory = str(tmp_path)
+    log = journal.Journal(directory)
+    lsns = [log.append('account', {'id': i, 'name': 'x', 'created_at': ''}) for i in range(5)]
+    log.close()
+    (start, path), = journal.segments(directory)
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+    # 已应用位置之前的内容不再解析：位置之前损坏的字节不影响结果
+    with open(path, 'r+b') as f:
+        f.seek(lsns[1] - start - 1)
+        f.write(b'#')
+    assert journal.valid_end(directory, lsns[2]) == lsns[-1]
+    assert os.path.getsize(path) == lsns[-1] - start
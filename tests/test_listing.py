@@ -0,0 +1,97 @@
+import pytest
+
+import listing
+
+# 同一时间有多笔交易，翻页依靠 (date, id) 排序键区分
+TRADES = [
+    ('AAA', 'buy', 10.0, 100, '2024-01-01 09:30:00'),
+    ('BBB', 'buy', 20.0, 200, '2024-01-01 09:30:00'),
+    ('AAA', 'sell', 11.0, 50, '2024-01-01 09:30:00'),
+    ('AAA', 'buy', 12.0, 10, '2024-01-02 10:00:00'),
+    ('BBB', 'sell', 21.0, 100, '2024-01-02 23:59:59'),
+    ('AAA', 'buy', 13.0, 30, '2024-01-03 00:00:00'),
+    ('CCC', 'buy', 5.0, 1000, '2024-01-03 14:00:00'),
+]
+
+
+@pytest.fixture
+def ledger(database):
+    with database.transaction() as c:
+        c.executemany('INSERT INTO transactions (account_id, symbol, type, price, quantity, date) '
+                      'VALUES (1, ?, ?, ?, ?, ?)', TRADES)
+        c.execute("INSERT INTO transactions (account_id, symbol, type, price, quantity, date) "
+                  "VALUES (2, 'AAA', 'buy', 1, 1, '2024-01-02 10:00:00')")
+    return database
+
+
+def all_pages(c, limit, **filters):
+    items = []
+    cursor = None
+    while True:
+        page, cursor = listing.query_transactions(c, 1, cursor=cursor, limit=limit, **filters)
+        assert len(page) <= limit
+        items.extend(page)
+        if cursor is None:
+            return items
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 100])
+def test_cursor_pages_cover_all_rows_once(ledger, limit):
+    c = ledger.cursor()
+    items = all_pages(c, limit)
+    c.execute('SELECT id FROM transactions WHERE account_id = 1 ORDER BY date DESC, id DESC')
+    assert [item['id'] for item in items] == [row[0] for row in c.fetchall()]
+
+
+def test_cursor_round_trip():
+    key = ['2024-01-02 10:00:00', 42]
+    cursor = listing.encode_cursor(key)
+    assert '=' not in cursor
+    assert listing.decode_cursor(cursor) == key
+
+
+def test_filters(ledger):
+    c = ledger.cursor()
+    assert {item['symbol'] for item in all_pages(c, 2, symbol='AAA')} == {'AAA'}
+    assert len(all_pages(c, 2, symbol='AAA')) == 4
+    assert [item['type'] for item in all_pages(c, 2, trade_type='sell')] == ['sell', 'sell']
+    # 只给日期的结束时间包含当天
+    dates = [item['date'] for item in all_pages(c, 2, date_from='2024-01-02', date_to='2024-01-02')]
+    assert dates == ['2024-01-02 23:59:59', '2024-01-02 10:00:00']
+    assert len(all_pages(c, 2, date_from='2024-01-03T00:00:00')) == 2
+    with pytest.raises(ValueError):
+        listing.query_transactions(c, 1, trade_type='hold')
+    with pytest.raises(ValueError):
+        listing.query_transactions(c, 1, date_from='2024-13-01')
+
+
+def test_fields_projection(app_module):
+    client = app_module.app.test_client()
+    assert client.post('/api/stock/add', json={'symbol': 'LST'}).get_json()['success']
+    client.post('/api/transaction/add', json={'symbol': 'LST', 'type': 'buy', 'price': 10, 'quantity': 100})
+    items = client.get('/api/transactions?symbol=LST&fields=id,price').get_json()['items']
+    assert items and all(set(item) == {'id', 'price'} for item in items)
+    stocks = client.get('/api/stocks?symbol=LST&fields=symbol&limit=5').get_json()
+    assert stocks['items'] == [{'symbol': 'LST'}]
+    response = client.get('/api/transactions?fields=id,secret')
+    assert response.status_code == 400
+    assert 'secret' in response.get_json()['message']
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    listing.encode_cursor({'date': '2024-01-01', 'id': 1}),
+    listing.encode_cursor(['2024-01-01']),
+    listing.encode_cursor([[1], 'x']),
+    listing.encode_cursor(['2024-01-01', '5']),
+    listing.encode_cursor(['2024-01-01', True]),
+    listing.encode_cursor([None, 5]),
+])
+def test_bad_cursor_rejected(app_module, cursor):
+    with pytest.raises(ValueError):
+        listing.decode_cursor(cursor)
+    client = app_module.app.test_client()
+    for path in ('/api/transactions', '/api/stocks'):
+        response = client.get(path, query_string={'cursor': cursor, 'limit': 10})
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
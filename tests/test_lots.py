@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+import lots
+
+KEYS = [(account_id, symbol) for account_id in (1, 2) for symbol in ('AAA', 'BBB', 'CCC')]
+
+
+def random_trades(rng, count):
+    for _ in range(count):
+        account_id, symbol = rng.choice(KEYS)
+        trade_type = 'buy' if rng.random() < 0.55 else 'sell'
+        yield account_id, symbol, trade_type, rng.randint(500, 1500) / 100, rng.randint(1, 40) * 10
+
+
+def trade_incrementally(c, method, trades, rng):
+    # 随机大小的批次经 LotBook 写入（同一批内同一代码多笔交易），超卖的交易不写入交易记录
+    trades = list(trades)
+    while trades:
+        batch = trades[:rng.randint(1, 30)]
+        trades = trades[len(batch):]
+        for account_id in (1, 2):
+            book = lots.LotBook(c, method, account_id)
+            for row in batch:
+                if row[0] != account_id:
+                    continue
+                try:
+                    book.trade(*row[1:])
+                except lots.OversellError:
+                    continue
+                c.execute('INSERT INTO transactions (account_id, symbol, type, price, quantity) VALUES (?, ?, ?, ?, ?)',
+                          row)
+            book.flush()
+
+
+def stored_lots(c):
+    c.execute('SELECT account_id, symbol, quantity, price FROM lots ORDER BY account_id, symbol, id')
+    return c.fetchall()
+
+
+def assert_lots_equal(actual, expected):
+    assert [row[:3] for row in actual] == [row[:3] for row in expected]
+    assert [row[3] for row in actual] == pytest.approx([row[3] for row in expected])
+
+
+@pytest.mark.parametrize('method', lots.METHODS)
+def test_incremental_matches_rebuild(database, monkeypatch, method):
+    # 页大小调小，使增量处理需要分多页读取已有批次
+    monkeypatch.setattr(lots, 'PAGE_SIZE', 3)
+    rng = random.Random(method)
+    with database.transaction() as c:
+        lots.rebuild(c, method)
+        trade_incrementally(c, method, random_trades(rng, 600), rng)
+        assert lots.verify(c, method) == []
+        incremental = stored_lots(c)
+        _, expected, rejected = lots.compute(c, method)
+        assert rejected == 0
+        assert_lots_equal(incremental, expected)
+
+        # 全量重建后继续增量处理，结果仍与重建一致
+        lots.rebuild(c, method)
+        assert_lots_equal(stored_lots(c), incremental)
+        trade_incrementally(c, method, random_trades(rng, 300), rng)
+        assert lots.verify(c, method) == []
+        assert_lots_equal(stored_lots(c), lots.compute(c, method)[1])
+
+
+@pytest.mark.skipif(not lots.HAVE_NUMPY, reason='需要 numpy')
+def test_vectorized_fifo_matches_replay(database, monkeypatch):
+    rng = random.Random(11)
+    with database.transaction() as c:
+        # 直接写入交易记录，包含被拒绝的超卖
+        c.executemany('INSERT INTO transactions (account_id, symbol, type, price, quantity) VALUES (?, ?, ?, ?, ?)',
+                      list(random_trades(rng, 2000)))
+        positions, open_lots, rejected = lots.compute(c, 'fifo')
+        monkeypatch.setattr(lots, '_load_numpy', lambda: None)
+        expected_positions, expected_lots, expected_rejected = lots.compute(c, 'fifo')
+    assert rejected == expected_rejected > 0
+    positions = sorted(positions)
+    expected_positions = sorted(expected_positions)
+    assert [row[:3] for row in positions] == [row[:3] for row in expected_positions]
+    for row, expected in zip(positions, expected_positions):
+        assert row[3:] == pytest.approx(expected[3:])
+    assert_lots_equal(sorted(open_lots, key=lambda row: row[:2]), sorted(expected_lots, key=lambda row: row[:2]))
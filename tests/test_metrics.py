@@ -0,0 +1,137 @@
+import math
+import re
+import threading
+import time
+
+import metrics
+import profiler
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+
+
+def parse_exposition(text):
+    # Prometheus 文本格式：返回 {指标名: {'type': 类型, 'samples': [(样本名, {标签}, 数值)]}}
+    # 每个样本必须属于之前用 # TYPE 声明过的指标
+    assert text.endswith('\n')
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ', 3)
+            assert kind in ('counter', 'gauge', 'histogram'), line
+            assert name not in families, f'{name} 重复声明'
+            current = families[name] = {'type': kind, 'samples': []}
+            continue
+        if line.startswith('#'):
+            # HELP 和其他注释行
+            continue
+        match = _SAMPLE.match(line)
+        assert match, line
+        name, label_text, value = match.groups()
+        labels = {}
+        if label_text:
+            consumed = 0
+            for label in _LABEL.finditer(label_text):
+                assert label.start() == consumed, line
+                labels[label.group(1)] = re.sub(r'\\(.)', lambda m: {'n': '\n'}.get(m.group(1), m.group(1)),
+                                                label.group(2))
+                consumed = label.end()
+            assert consumed == len(label_text), line
+        assert current is not None, line
+        family = next(reversed(families))
+        assert (re.sub(r'_(bucket|sum|count)$', '', name) if current['type'] == 'histogram' else name) == family
+        current['samples'].append((name, labels, float(value)))
+    return families
+
+
+def check_histogram(family):
+    # 各标签组合的桶计数递增，+Inf 桶等于 _count
+    series = {}
+    for name, labels, value in family['samples']:
+        key = tuple(sorted((k, v) for k, v in labels.items() if k != 'le'))
+        series.setdefault(key, {'buckets': [], 'count': None})
+        if name.endswith('_bucket'):
+            series[key]['buckets'].append((float(labels['le']), value))
+        elif name.endswith('_count'):
+            series[key]['count'] = value
+    for data in series.values():
+        bounds = [bound for bound, _ in data['buckets']]
+        counts = [count for _, count in data['buckets']]
+        assert bounds == sorted(bounds) and math.isinf(bounds[-1])
+        assert counts == sorted(counts)
+        assert counts[-1] == data['count']
+    return series
+
+
+def test_registry_exposition_parses():
+    registry = metrics.Registry()
+    requests = registry.counter('test_requests_total', '请求数', ('route', 'status'))
+    latency = registry.histogram('test_latency_seconds', '耗时', ('route',), buckets=(0.1, 1.0))
+    registry.gauge('test_rows', '行数', lambda: [(('a"b\\c\nd',), 3), (('empty',), None)], ('table',))
+    registry.gauge('test_failing', '采集失败', lambda: 1 / 0)
+
+    # 多个线程各写自己的分片，抓取时合并；线程退出后分片并入汇总
+    def work():
+        for i in range(100):
+            requests.inc('/api/stocks', '200')
+            latency.observe(i / 50, '/api/stocks')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    requests.inc('/api/pnl', '500', amount=2)
+
+    families = parse_exposition(registry.render())
+    assert families['test_requests_total']['type'] == 'counter'
+    assert sorted((labels['route'], value) for _, labels, value in families['test_requests_total']['samples']) == \
+        [('/api/pnl', 2.0), ('/api/stocks', 400.0)]
+    series = check_histogram(families['test_latency_seconds'])
+    (buckets,) = [data['buckets'] for data in series.values()]
+    assert buckets == [(0.1, 24.0), (1.0, 204.0), (math.inf, 400.0)]
+    assert families['test_rows']['samples'] == [('test_rows', {'table': 'a"b\\c\nd'}, 3.0)]
+    # 采集失败的指标只留下一行注释
+    assert 'test_failing' not in families
+
+
+def test_app_metrics_endpoint_parses(app_module):
+    client = app_module.app.test_client()
+    client.get('/api/stocks')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    families = parse_exposition(response.get_data(as_text=True))
+    for family in families.values():
+        if family['type'] == 'histogram':
+            check_histogram(family)
+    assert any(labels.get('route') == '/api/stocks'
+               for _, labels, _ in families['stock_monitor_http_requests_total']['samples'])
+    assert families['stock_monitor_process_resident_memory_bytes']['samples'][0][2] > 0
+
+
+def test_profiler_collapsed_stacks():
+    stop = threading.Event()
+
+    def spin_for_profile():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=spin_for_profile)
+    thread.start()
+    try:
+        result = {}
+        # 采样进行中时再次请求返回 None
+        worker = threading.Thread(target=lambda: result.setdefault('sampler', profiler.profile(0.2, 0.002)))
+        worker.start()
+        time.sleep(0.05)
+        assert profiler.profile(0.1) is None
+        worker.join()
+    finally:
+        stop.set()
+        thread.join()
+    sampler = result['sampler']
+    assert sampler.samples > 0
+    lines = sampler.collapsed().splitlines()
+    assert all(re.match(r'^\S.* \d+$', line) for line in lines)
+    assert any('spin_for_profile (test_metrics.py:' in line for line in lines)
@@ -0,0 +1,77 @@
+import pytest
+
+import db
+import lots
+import migrations
+
+
+def test_upgrade_from_version_5_rebuilds_lots(tmp_path):
+    database = db.Database(str(tmp_path / 'old.db'))
+    database.migrate([m for m in migrations.MIGRATIONS if m[0] <= 5])
+    with database.transaction() as c:
+        c.executemany('INSERT INTO transactions (symbol, type, price, quantity) VALUES (?, ?, ?, ?)',
+                      [('AAA', 'buy', 10, 100), ('AAA', 'buy', 20, 100), ('AAA', 'sell', 30, 150)])
+    database.migrate(migrations.MIGRATIONS)
+    c = database.cursor()
+    c.execute('SELECT account_id, symbol, quantity, cost, realized FROM positions')
+    assert c.fetchall() == [(1, 'AAA', 50, 1000.0, 2500.0)]
+    c.execute('SELECT account_id, symbol, quantity, price FROM lots')
+    assert c.fetchall() == [(1, 'AAA', 50, 20.0)]
+    database.close()
+
+
+def test_version_6_migration_runs_against_its_own_schema(tmp_path):
+    database = db.Database(str(tmp_path / 'v6.db'))
+    database.migrate([m for m in migrations.MIGRATIONS if m[0] <= 5])
+    with database.transaction() as c:
+        c.execute("INSERT INTO transactions (symbol, type, price, quantity) VALUES ('AAA', 'buy', 10, 100)")
+    assert database.migrate([m for m in migrations.MIGRATIONS if m[0] <= 6]) == 6
+    c = database.cursor()
+    c.execute('SELECT symbol, quantity, cost, realized FROM positions')
+    assert c.fetchall() == [('AAA', 100, 1000.0, 0.0)]
+    database.close()
+
+
+def test_version_7_partitions_existing_ledger_into_default_account(tmp_path):
+    database = db.Database(str(tmp_path / 'v7.db'))
+    database.migrate([m for m in migrations.MIGRATIONS if m[0] <= 6])
+    with database.transaction() as c:
+        c.executemany('INSERT INTO transactions (symbol, type, price, quantity) VALUES (?, ?, ?, ?)',
+                      [('AAA', 'buy', 10, 100), ('BBB', 'buy', 5, 10), ('AAA', 'buy', 20, 100),
+                       ('AAA', 'sell', 30, 150), ('BBB', 'sell', 6, 20)])
+    assert database.migrate([m for m in migrations.MIGRATIONS if m[0] <= 7]) == 7
+    c = database.cursor()
+    c.execute('SELECT account_id, symbol, quantity, cost, realized FROM positions ORDER BY symbol')
+    assert c.fetchall() == [(1, 'AAA', 50, 1000.0, 2500.0), (1, 'BBB', 10, 50.0, 0.0)]
+    c.execute('SELECT account_id, symbol, quantity, price FROM lots ORDER BY symbol, id')
+    assert c.fetchall() == [(1, 'AAA', 50, 20.0), (1, 'BBB', 10, 5.0)]
+    database.close()
+
+
+@pytest.mark.parametrize('method', ['fifo', 'average'])
+def test_version_9_normalizes_and_merges_stored_symbols(tmp_path, monkeypatch, method):
+    monkeypatch.setenv('COST_METHOD', method)
+    database = db.Database(str(tmp_path / 'v9.db'))
+    database.migrate([m for m in migrations.MIGRATIONS if m[0] <= 8])
+    with database.transaction() as c:
+        for symbol, price, quantity in (('sh600000', 10.0, 100), ('600000.SH', 20.0, 100), ('SZ:000001', 5.0, 10)):
+            lots.apply_trade(c, symbol, 'buy', price, quantity, method)
+            c.execute("INSERT INTO transactions (symbol, type, price, quantity) VALUES (?, 'buy', ?, ?)",
+                      (symbol, price, quantity))
+            c.execute('INSERT INTO stocks (symbol, name) VALUES (?, ?)', (symbol, symbol))
+        c.execute("INSERT INTO alert_rules (symbol, direction, threshold, stock_id) VALUES ('sh600000', 'above', 30, 1)")
+    database.migrate(migrations.MIGRATIONS)
+    c = database.cursor()
+    c.execute('SELECT id, symbol FROM stocks ORDER BY id')
+    assert c.fetchall() == [(1, '600000.SH'), (3, '000001.SZ')]
+    c.execute('SELECT symbol, stock_id FROM alert_rules')
+    assert c.fetchall() == [('600000.SH', 1)]
+    c.execute('SELECT DISTINCT symbol FROM transactions ORDER BY symbol')
+    assert c.fetchall() == [('000001.SZ',), ('600000.SH',)]
+    c.execute('SELECT symbol, quantity, cost FROM positions ORDER BY symbol')
+    assert c.fetchall() == [('000001.SZ', 10, 50.0), ('600000.SH', 200, 3000.0)]
+    c.execute('SELECT symbol, quantity, price FROM lots ORDER BY symbol, id')
+    expected = [(10, 5.0)] + ([(200, 15.0)] if method == 'average' else [(100, 10.0), (100, 20.0)])
+    assert [row[1:] for row in c.fetchall()] == expected
+    assert lots.verify(c, method) == []
+    database.close()
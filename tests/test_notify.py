@@ -0,0 +1,125 @@
+import time
+from email.header import decode_header, make_header
+from types import SimpleNamespace
+
+import pytest
+
+import notify
+
+
+def rule(rule_id=1, symbol='600000.SH'):
+    return SimpleNamespace(id=rule_id, account_id=1, stock_id=None, symbol=symbol, direction='above', threshold=10)
+
+
+def item(rule_id=1, event='triggered', ts=1000.0, price=10.5):
+    return notify.notification(rule(rule_id), event, price, ts)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def webhook():
+    receiver = notify.WebhookReceiver().start()
+    yield receiver
+    receiver.close()
+
+
+def test_dedup_and_rate_limit():
+    dispatcher = notify.Dispatcher([], dedup_seconds=60, rate_limit=3, rate_period=600)
+    # 同一规则的同一事件在去重窗口内只通知一次，不同事件不受影响
+    assert dispatcher.submit(item(ts=1000))
+    assert not dispatcher.submit(item(ts=1030))
+    assert dispatcher.submit(item(event='cleared', ts=1030))
+    assert dispatcher.submit(item(ts=1060))
+    # 每条规则在限流周期内最多 3 次，其他规则不受影响
+    assert not dispatcher.submit(item(event='cleared', ts=1200))
+    assert dispatcher.submit(item(rule_id=2, ts=1200))
+    assert dispatcher.submit(item(ts=1601))
+    assert (dispatcher.submitted, dispatcher.deduplicated, dispatcher.rate_limited) == (7, 1, 1)
+
+
+def test_webhook_receives_batches(webhook):
+    destination = notify.Destination(notify.WebhookSink(webhook.url), batch_size=3, batch_wait=0.2)
+    dispatcher = notify.Dispatcher([destination], dedup_seconds=0, rate_limit=0)
+    dispatcher.start()
+    try:
+        dispatcher.submit_events([(rule(i), 'triggered', 10.0 + i) for i in range(5)], now=1000)
+        assert wait_until(lambda: sum(len(batch) for batch in webhook.batches) == 5)
+    finally:
+        dispatcher.close()
+    assert [len(batch) for batch in webhook.batches] == [3, 2]
+    assert [n['rule_id'] for batch in webhook.batches for n in batch] == list(range(5))
+    assert dispatcher.stats()[destination.name]['sent'] == 5
+
+
+def test_failed_delivery_is_retried(webhook):
+    destination = notify.Destination(notify.WebhookSink(webhook.url), max_retries=5, backoff=0.02)
+    webhook.status = 503
+    original = webhook.server.RequestHandlerClass.do_POST
+    calls = []
+
+    def recover_after_two_failures(handler):
+        calls.append(1)
+        if len(calls) > 2:
+            webhook.status = 200
+        original(handler)
+
+    webhook.server.RequestHandlerClass.do_POST = recover_after_two_failures
+    assert destination.deliver([item()])
+    assert (destination.retries, destination.sent, destination.failed) == (2, 1, 0)
+    assert len(webhook.batches) == 1
+
+    # 超过重试次数后丢弃这一批
+    webhook.status = 500
+    calls.clear()
+    webhook.server.RequestHandlerClass.do_POST = original
+    destination.max_retries = 2
+    assert not destination.deliver([item(), item(rule_id=2)])
+    assert (destination.retries, destination.failed) == (4, 2)
+
+
+def test_full_queue_drops_without_blocking_other_destinations(webhook):
+    slow = notify.WebhookReceiver(delay=0.3).start()
+    try:
+        slow_destination = notify.Destination(notify.WebhookSink(slow.url), queue_size=2, batch_size=1,
+                                              batch_wait=0)
+        fast_destination = notify.Destination(notify.WebhookSink(webhook.url), batch_size=1, batch_wait=0)
+        dispatcher = notify.Dispatcher([slow_destination, fast_destination], dedup_seconds=0, rate_limit=0)
+        dispatcher.start()
+        start = time.monotonic()
+        for i in range(6):
+            assert dispatcher.submit(item(rule_id=i))
+        # submit 不等待慢速目标
+        assert time.monotonic() - start < 0.2
+        assert wait_until(lambda: len(webhook.batches) == 6, timeout=2)
+        dispatcher.close()
+        stats = dispatcher.stats()
+        assert stats[fast_destination.name]['dropped'] == 0
+        assert stats[slow_destination.name]['dropped'] >= 3
+        assert stats[slow_destination.name]['sent'] + stats[slow_destination.name]['dropped'] == 6
+    finally:
+        slow.close()
+
+
+def test_smtp_message():
+    receiver = notify.SmtpReceiver().start()
+    try:
+        sink = notify.SmtpSink(receiver.host, receiver.port, sender='monitor@test', recipients=['a@test', 'b@test'])
+        sink.send([item()])
+        sink.send([item(), item(rule_id=2, event='cleared', price=9.0)])
+    finally:
+        receiver.close()
+    (sender, recipients, single), (_, _, combined) = receiver.messages
+    assert (sender, recipients) == ('monitor@test', ['a@test', 'b@test'])
+    subject = lambda message: str(make_header(decode_header(message['Subject'])))
+    assert subject(single) == '[股票监控] 600000.SH 提醒触发'
+    assert subject(combined) == '[股票监控] 2 条提醒'
+    body = combined.get_payload(decode=True).decode('utf-8')
+    assert '600000.SH 价格 10.5 高于 10 触发' in body and '解除' in body
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import poller
+import quotes
+
+
+class StaticProvider(quotes.QuoteProvider):
+    name = 'static'
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def get_prices(self, symbols):
+        self.calls.append(set(symbols))
+        return {symbol: self.prices[symbol] for symbol in symbols if symbol in self.prices}
+
+
+def test_snapshot_versions_and_changed_prices():
+    snapshot = poller.PriceSnapshot(stale_after=10)
+    updates = []
+    recorded = []
+    snapshot.subscribe(lambda changed, version: updates.append((changed, version)))
+    snapshot.add_recorder(lambda prices, ts, version: recorded.append((dict(prices), version)))
+    assert snapshot.update({'A': 1.0, 'B': 2.0}, ts=100) == 1
+    # 价格未变的代码只更新时间，不算变化；记录器收到全部报价
+    assert snapshot.update({'A': 1.0, 'B': 2.5}, ts=101) == 2
+    assert updates == [({'A': (1.0, 100), 'B': (2.0, 100)}, 1), ({'B': (2.5, 101)}, 2)]
+    assert recorded[-1] == ({'A': 1.0, 'B': 2.5}, 2)
+    assert snapshot.get('A') == (1.0, 101)
+    assert snapshot.get_many(['A', 'X']) == {'A': (1.0, 101)}
+    assert snapshot.price('X') is None
+    assert snapshot.describe(snapshot.get('B'), now=105)['stale'] is False
+    assert snapshot.describe(snapshot.get('B'), now=112)['stale'] is True
+    assert snapshot.describe(None) == {'current_price': None, 'price_time': None, 'stale': True}
+
+
+def test_failing_listener_does_not_stop_others():
+    snapshot = poller.PriceSnapshot()
+    seen = []
+    snapshot.subscribe(lambda changed, version: 1 / 0)
+    snapshot.subscribe(lambda changed, version: seen.append(version))
+    snapshot.update({'A': 1.0})
+    assert seen == [1]
+
+
+def test_poller_refreshes_all_symbols_in_slices():
+    provider = StaticProvider({symbol: float(i) for i, symbol in enumerate('ABCDEF')})
+    cache = quotes.QuoteCache(provider, ttl=60)
+    snapshot = poller.PriceSnapshot()
+    quote_poller = poller.QuotePoller(cache, snapshot, lambda: list('ABCDEF'), interval=0.3, slices=3)
+    quote_poller.start()
+    try:
+        deadline = time.monotonic() + 5
+        while len(snapshot.get_many('ABCDEF')) < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        quote_poller.stop(5)
+    assert snapshot.get_many('ABCDEF') == {s: (float(i), snapshot.get(s)[1]) for i, s in enumerate('ABCDEF')}
+    # 每批请求一部分代码，轮询总是绕过缓存取最新价格
+    assert max(len(call) for call in provider.calls) == 2
+
+
+def test_request_refresh_wakes_poller():
+    provider = StaticProvider({'NEW': 9.0})
+    cache = quotes.QuoteCache(provider, ttl=60)
+    snapshot = poller.PriceSnapshot()
+    updated = threading.Event()
+    snapshot.subscribe(lambda changed, version: updated.set())
+    # 没有监控代码时按很长的周期等待，新代码由 request_refresh 立即触发
+    quote_poller = poller.QuotePoller(cache, snapshot, lambda: [], interval=60)
+    quote_poller.start()
+    try:
+        time.sleep(0.05)
+        quote_poller.request_refresh(['NEW'])
+        assert updated.wait(2)
+    finally:
+        quote_poller.stop(5)
+    assert snapshot.price('NEW') == 9.0
+    assert provider.calls == [{'NEW'}]
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import quotes
+
+
+class CountingProvider(quotes.QuoteProvider):
+    # 记录每次请求的代码；gate 未打开时请求阻塞，用于制造并发未命中
+    name = 'counting'
+
+    def __init__(self, prices, gate=None):
+        self.prices = prices
+        self.gate = gate
+        self.calls = []
+        self.entered = threading.Event()
+
+    def get_prices(self, symbols):
+        self.calls.append(list(symbols))
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        return {symbol: self.prices[symbol] for symbol in symbols if symbol in self.prices}
+
+
+def test_entries_expire_after_ttl():
+    provider = CountingProvider({'A': 1.0, 'B': 2.0})
+    cache = quotes.QuoteCache(provider, ttl=0.2)
+    assert cache.get_prices(['A', 'B', 'A']) == {'A': 1.0, 'B': 2.0}
+    provider.prices['A'] = 1.5
+    assert cache.get_prices(['A']) == {'A': 1.0}
+    assert provider.calls == [['A', 'B']]
+    assert (cache.hits, cache.misses) == (1, 2)
+    time.sleep(0.25)
+    assert cache.get_price('A') == 1.5
+    assert provider.calls == [['A', 'B'], ['A']]
+
+
+def test_missing_prices_and_provider_errors_are_not_cached():
+    provider = CountingProvider({'A': 1.0})
+    cache = quotes.QuoteCache(provider, ttl=60)
+    assert cache.get_prices(['A', 'NONE']) == {'A': 1.0}
+    assert cache.get_prices(['NONE']) == {}
+    assert provider.calls == [['A', 'NONE'], ['NONE']]
+
+    def fail(symbols):
+        raise OSError('报价源不可用')
+
+    provider.get_prices = fail
+    assert cache.get_prices(['C']) == {}
+    # 失败的请求结束后不留下进行中的记录
+    assert cache._inflight == {}
+
+
+def test_lru_capacity():
+    provider = CountingProvider({symbol: 1.0 for symbol in 'ABC'})
+    cache = quotes.QuoteCache(provider, ttl=60, max_size=2)
+    cache.get_prices(['A', 'B'])
+    cache.get_prices(['A'])
+    cache.get_prices(['C'])
+    # 最近最少使用的 B 被淘汰
+    provider.calls.clear()
+    cache.get_prices(['A', 'B', 'C'])
+    assert provider.calls == [['B']]
+
+
+def test_concurrent_misses_share_one_request():
+    gate = threading.Event()
+    provider = CountingProvider({'A': 1.0, 'B': 2.0}, gate)
+    cache = quotes.QuoteCache(provider, ttl=60)
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_prices(['A'])))
+    first.start()
+    assert provider.entered.wait(5)
+    # A 正在请求中：其他线程等待同一个结果，只有 B 另外请求；后台刷新也不重复请求 A
+    others = [threading.Thread(target=lambda: results.append(cache.get_prices(['A', 'B']))) for _ in range(7)]
+    others.append(threading.Thread(target=lambda: results.append(cache.refresh(['A']))))
+    for thread in others:
+        thread.start()
+    time.sleep(0.1)
+    gate.set()
+    for thread in [first] + others:
+        thread.join(5)
+    assert sorted(provider.calls) == [['A'], ['B']]
+    assert len(results) == 9
+    assert all(result['A'] == 1.0 for result in results)
+    assert sum('B' in result for result in results) == 7
+
+
+def test_refresh_ignores_unexpired_entries():
+    provider = CountingProvider({'A': 1.0})
+    cache = quotes.QuoteCache(provider, ttl=60)
+    cache.get_prices(['A'])
+    provider.prices['A'] = 2.0
+    assert cache.refresh(['A']) == {'A': 2.0}
+    assert cache.get_prices(['A']) == {'A': 2.0}
+    assert len(provider.calls) == 2
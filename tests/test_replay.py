@@ -0,0 +1,26 @@
+import pytest
+
+import db
+import migrations
+import replay
+
+
+def test_bad_tick_row_reports_line_number(tmp_path):
+    path = tmp_path / 'ticks.csv'
+    path.write_text('ts,symbol,price\n1,AAA,10\n2,AAA,abc\n', encoding='utf-8')
+    ticks = replay.read_csv(str(path))
+    assert next(ticks) == (1.0, 'AAA', 10.0)
+    with pytest.raises(replay.TickError, match='第 3 行'):
+        next(ticks)
+
+
+def test_bad_tick_file_exits_non_zero(tmp_path):
+    path = tmp_path / 'ticks.csv'
+    path.write_text('ts,symbol,price\nnot-a-time,AAA,10\n', encoding='utf-8')
+    db_path = tmp_path / 'ledger.db'
+    ledger = db.Database(str(db_path))
+    ledger.migrate(migrations.MIGRATIONS)
+    ledger.close()
+    with pytest.raises(SystemExit) as exit_info:
+        replay.main([str(path), '--db', str(db_path)])
+    assert exit_info.value.code != 0
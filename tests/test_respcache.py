@@ -0,0 +1,51 @@
+import poller
+
+
+def test_stock_list_without_price_fields_survives_price_updates(app_module):
+    client = app_module.app.test_client()
+    cache = app_module.response_cache
+    assert client.post('/api/stock/add', json={'symbol': 'CACHE'}).get_json()['success']
+    client.get('/api/stocks?fields=id,symbol,name')
+    app_module.price_snapshot.update({'CACHE': 10.0})
+    hits = cache.hits
+    client.get('/api/stocks?fields=id,symbol,name')
+    assert cache.hits == hits + 1
+    # 含行情字段的响应随所含代码的价格版本失效
+    client.get('/api/stocks?fields=symbol,current_price')
+    app_module.price_snapshot.update({'CACHE': 11.0})
+    hits = cache.hits
+    client.get('/api/stocks?fields=symbol,current_price')
+    assert cache.hits == hits
+    # 没有关注的代码更新报价不影响缓存
+    app_module.price_snapshot.update({'CACHE.OTHER': 1.0})
+    client.get('/api/stocks?fields=symbol,current_price')
+    assert cache.hits == hits + 1
+
+
+def test_quote_only_invalidates_accounts_holding_the_symbol(app_module):
+    client = app_module.app.test_client()
+    a, b = [{'X-Account-Id': str(client.post('/api/accounts', json={'name': name}).get_json()['id'])}
+            for name in ('CA', 'CB')]
+    for headers, symbol in ((a, 'CACHEA'), (b, 'CACHEB')):
+        assert client.post('/api/transaction/add', headers=headers,
+                           json={'symbol': symbol, 'type': 'buy', 'price': 10, 'quantity': 100}).status_code == 200
+    cache = app_module.response_cache
+    for headers in (a, b):
+        client.get('/api/portfolio', headers=headers)
+    app_module.price_snapshot.update({'CACHEB': 12.0})
+    hits = cache.hits
+    assert client.get('/api/portfolio', headers=a).status_code == 200
+    assert cache.hits == hits + 1
+    # 持有该代码的账户重新生成，带上新价格
+    body = client.get('/api/portfolio', headers=b).get_json()
+    assert cache.hits == hits + 1
+    assert body[0]['symbol'] == 'CACHEB' and body[0]['current_price'] == 12.0
+
+
+def test_symbols_version_tracks_last_write():
+    snapshot = poller.PriceSnapshot()
+    snapshot.update({'A': 1.0, 'B': 2.0})
+    snapshot.update({'B': 2.0})
+    assert snapshot.symbols_version(['A']) == 1
+    assert snapshot.symbols_version(['A', 'B']) == 2
+    assert snapshot.symbols_version(['X']) == snapshot.symbols_version([]) == 0
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+import shared
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子进程打开同一个版本文件，递增指定名称若干次
+BUMP = '''
+import sys
+import shared
+versions = shared.SharedVersions(sys.argv[1])
+for _ in range(int(sys.argv[2])):
+    versions.bump(*sys.argv[3:])
+versions.close()
+'''
+
+# 子进程持有 leader 锁，直到标准输入关闭
+HOLD = '''
+import sys
+import shared
+lock = shared.LeaderLock(sys.argv[1])
+print(lock.try_acquire(), flush=True)
+sys.stdin.read()
+'''
+
+
+def spawn(script, *args, **kwargs):
+    return subprocess.Popen([sys.executable, '-c', script] + [str(a) for a in args], cwd=ROOT, **kwargs)
+
+
+def test_versions_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'versions')
+    versions = shared.SharedVersions(path)
+    seen = {}
+    # 第一次比较时所有名称都算变化
+    assert versions.remote_changes(seen) == set(shared.VERSION_NAMES)
+
+    # 两个进程同时递增，文件锁保证不丢失
+    children = [spawn(BUMP, path, 500, 'watchlist', 'prices') for _ in range(2)]
+    assert [child.wait(30) for child in children] == [0, 0]
+    assert versions.key(['watchlist', 'ledger', 'prices']) == (1000, 0, 1000)
+    assert versions.remote_changes(seen) == {'watchlist', 'prices'}
+    assert versions.remote_changes(seen) == set()
+
+    # 本进程自己的修改不算其他进程的变化，其他进程能读到
+    versions.bump('ledger')
+    assert versions.remote_changes(seen) == set()
+    assert spawn(BUMP, path, 1, 'alerts').wait(30) == 0
+    assert versions.remote_changes(seen) == {'alerts'}
+    reopened = shared.SharedVersions(path)
+    assert reopened.key(shared.VERSION_NAMES) == (1000, 1, 1, 1000)
+    reopened.close()
+    versions.close()
+
+
+def test_leader_lock_is_exclusive_between_processes(tmp_path):
+    path = str(tmp_path / 'leader.lock')
+    holder = spawn(HOLD, path, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == 'True'
+        lock = shared.LeaderLock(path)
+        assert not lock.try_acquire()
+    finally:
+        holder.stdin.close()
+        holder.wait(30)
+    # 持有锁的进程退出后由其他进程接手
+    assert lock.try_acquire() and lock.held
+    lock.release()
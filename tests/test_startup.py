@@ -0,0 +1,21 @@
+from werkzeug.routing import Map, Rule
+
+
+def test_lazy_builder_rule_builds_same_urls(app_module):
+    rules = [('/api/stocks/<int:stock_id>', 'stock'), ('/api/history/<symbol>', 'history')]
+    eager = Map([Rule(path, endpoint=endpoint) for path, endpoint in rules]).bind('localhost')
+    lazy = Map([app_module.LazyBuilderRule(path, endpoint=endpoint) for path, endpoint in rules]).bind('localhost')
+    for _ in range(2):
+        for endpoint, values in (('stock', {'stock_id': 7}), ('stock', {'stock_id': 7, 'page': 2}),
+                                 ('history', {'symbol': '600000.SH'})):
+            assert lazy.build(endpoint, values) == eager.build(endpoint, values)
+    assert lazy.match('/api/stocks/7') == ('stock', {'stock_id': 7})
+
+
+def test_deferred_objects_loaded(app_module):
+    # FAST_START=0 时在导入时载入
+    client = app_module.app.test_client()
+    assert client.get('/').status_code == 200
+    response = client.get('/api/stocks?format=columnar')
+    assert response.status_code == 200
+    assert response.mimetype == app_module.formats.MIMETYPES['columnar']
@@ -0,0 +1,88 @@
+import json
+
+import stream
+
+
+def events(q):
+    # 取出队列中的事件，返回 [(事件, 数据)]；None 表示被断开
+    result = []
+    while not q.empty():
+        message = q.get_nowait()
+        if message is None:
+            result.append(None)
+            continue
+        event, data = message.splitlines()[:2]
+        result.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return result
+
+
+def test_topic_routing():
+    broker = stream.EventBroker()
+    a1, a2, b, everyone = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2), broker.subscribe()
+    assert sorted(broker.topics(), key=str) == [1, 2, None]
+    broker.publish('position', {'symbol': 'A'}, 1)
+    broker.publish('position', {'symbol': 'B'}, 2)
+    # 没有订阅者的主题直接丢弃；不指定主题的事件发给所有订阅者
+    broker.publish('position', {'symbol': 'C'}, 3)
+    broker.publish('resync', {})
+    assert events(a1) == events(a2) == [('position', {'symbol': 'A'}), ('resync', {})]
+    assert events(b) == [('position', {'symbol': 'B'}), ('resync', {})]
+    assert events(everyone) == [('resync', {})]
+
+    broker.unsubscribe(b)
+    broker.unsubscribe(b)
+    assert 2 not in broker.topics()
+    broker.publish('position', {'symbol': 'B'}, 2)
+    assert broker.subscriber_count == 3
+
+
+def test_slow_subscriber_is_disconnected():
+    broker = stream.EventBroker(max_queue=3)
+    slow, other = broker.subscribe(1), broker.subscribe(2)
+    for i in range(4):
+        broker.publish('price', {'i': i}, 1)
+    # 队列满时断开：丢掉最早的一条，放入断开标记，之后不再收到事件
+    assert events(slow) == [('price', {'i': 1}), ('price', {'i': 2}), None]
+    broker.publish('price', {'i': 5}, 1)
+    assert events(slow) == []
+    assert broker.topics() == [2] and events(other) == []
+
+
+def test_stream_sends_snapshot_then_events(monkeypatch):
+    monkeypatch.setattr(stream, 'KEEPALIVE_SECONDS', 0.01)
+    broker = stream.EventBroker()
+    q = broker.subscribe(1)
+    output = broker.stream(q, {'stocks': []})
+    assert next(output) == 'retry: 3000\n\n'
+    assert next(output) == stream.format_event('snapshot', {'stocks': []})
+    assert next(output) == ': keepalive\n\n'
+    broker.publish('alert', {'id': 1}, 1)
+    assert next(output) == 'event: alert\ndata: {"id": 1}\n\n'
+    # 服务停止时结束连接并取消订阅
+    broker.close()
+    assert list(output) == []
+    assert broker.subscriber_count == 0
+
+
+def test_stream_endpoint_routes_by_account(app_module):
+    client = app_module.app.test_client()
+    accounts = [str(client.post('/api/accounts', json={'name': name}).get_json()['id']) for name in ('S1', 'S2')]
+    responses = [client.get('/api/stream', headers={'X-Account-Id': account_id}, buffered=False)
+                 for account_id in accounts]
+    outputs = [(chunk.decode('utf-8') for chunk in response.response) for response in responses]
+    try:
+        for output in outputs:
+            assert next(output) == 'retry: 3000\n\n'
+            assert next(output).startswith('event: snapshot\n')
+        assert client.post('/api/stock/add', headers={'X-Account-Id': accounts[0]},
+                           json={'symbol': 'SSE1'}).get_json()['success']
+        # 新代码的报价可能先于 stock_added 推送
+        message = next(message for message in outputs[0]
+                       if not message.startswith(('event: price', 'event: position')))
+        assert message.startswith('event: stock_added\n') and '"SSE1"' in message
+        # 另一个账户只收到发给所有人的事件
+        app_module.event_broker.publish('resync', {})
+        assert next(outputs[1]) == 'event: resync\ndata: {}\n\n'
+    finally:
+        for response in responses:
+            response.close()
@@ -0,0 +1,125 @@
+import os
+import time
+
+import pytest
+
+import db
+import importer
+import lots
+import migrations
+import recovery
+import symbols
+
+
+@pytest.fixture
+def index():
+    return symbols.SymbolIndex([
+        symbols.Symbol('000001', 'SH', '上证指数', 'SZZS'),
+        symbols.Symbol('000001', 'SZ', '平安银行', 'PAYH'),
+        symbols.Symbol('600000', 'SH', '浦发银行', 'PFYH'),
+    ])
+
+
+def test_same_code_on_different_exchanges(index):
+    assert index.resolve('000001.SZ') == ('000001.SZ', '平安银行')
+    assert index.resolve('sh000001') == ('000001.SH', '上证指数')
+    assert [(e.code, e.exchange) for _, e in index.search('000001')] == [('000001', 'SH'), ('000001', 'SZ')]
+    with pytest.raises(ValueError, match='多个交易所'):
+        index.resolve('000001')
+
+
+def test_resolve_qualifies_unique_code_and_name(index):
+    assert index.resolve('600000') == ('600000.SH', '浦发银行')
+    assert index.resolve('平安银行') == ('000001.SZ', '平安银行')
+    with pytest.raises(ValueError):
+        index.resolve('600000.SZ')
+
+
+def test_empty_master_only_normalizes():
+    assert symbols.SymbolIndex().resolve('600000.ss') == ('600000.SH', '600000.SH')
+    assert symbols.SymbolIndex().resolve('AAPL') == ('AAPL', 'AAPL')
+
+
+def holding(app_module, account_id, symbol, quantity):
+    # 按改为标准写法之前的方式写入一笔买入（原样保存代码，并记入操作日志）
+    with app_module.write_transaction() as c:
+        lots.apply_trade(c, symbol, 'buy', 10.0, quantity, app_module.cost_method, account_id)
+        date = importer.timestamp()
+        c.execute('INSERT INTO transactions (account_id, symbol, type, price, quantity, date) '
+                  'VALUES (?, ?, ?, ?, ?, ?)', (account_id, symbol, 'buy', 10.0, quantity, date))
+        row = [c.lastrowid, symbol, 'buy', 10.0, quantity, date]
+        c.execute('INSERT INTO stocks (account_id, symbol, name) VALUES (?, ?, ?)', (account_id, symbol, symbol))
+        app_module.journal_append(c, 'trades', {'account': account_id, 'rows': [row]})
+
+
+def positions(database, account_id):
+    c = database.cursor()
+    c.execute('SELECT symbol, quantity, cost FROM positions WHERE account_id = ? ORDER BY symbol', (account_id,))
+    return c.fetchall()
+
+
+def test_stored_spellings_are_merged_and_replayed(app_module):
+    client = app_module.app.test_client()
+    account_id = client.post('/api/accounts', json={'name': '旧写法'}).get_json()['id']
+    headers = {'X-Account-Id': str(account_id)}
+    holding(app_module, account_id, 'sh600000', 100)
+    holding(app_module, account_id, 'SH:600000', 20)
+    assert app_module.normalize_stored_symbols() == {'sh600000': '600000.SH', 'SH:600000': '600000.SH'}
+    assert positions(app_module.database, account_id) == [('600000.SH', 120, 1200.0)]
+    assert [s['symbol'] for s in client.get('/api/stocks', headers=headers).get_json()] == ['600000.SH']
+    assert not client.post('/api/stock/add', headers=headers, json={'symbol': 'sh600000'}).get_json()['success']
+    response = client.post('/api/transaction/add', headers=headers,
+                           json={'symbol': 'sh600000', 'type': 'sell', 'price': 12, 'quantity': 50})
+    assert response.status_code == 200
+
+    # 从日志开头重建时按日志中的改名记录合并，结果与原库一致
+    rebuilt = db.Database(':memory:')
+    rebuilt.migrate(migrations.MIGRATIONS)
+    with rebuilt.transaction() as c:
+        recovery.reconstruct(c, app_module.journal_dir, time.time() + 1, app_module.cost_method, full=True)
+    assert positions(rebuilt, account_id) == positions(app_module.database, account_id) == [('600000.SH', 70, 700.0)]
+    rebuilt.close()
+
+
+def test_master_reload_renames_bare_codes(app_module):
+    client = app_module.app.test_client()
+    account_id = client.post('/api/accounts', json={'name': '主数据'}).get_json()['id']
+    headers = {'X-Account-Id': str(account_id)}
+    # 没有主数据时不带交易所的代码原样保存
+    assert client.post('/api/transaction/add', headers=headers,
+                       json={'symbol': '600001', 'type': 'buy', 'price': 10, 'quantity': 100}).status_code == 200
+    path = app_module.symbol_master.path
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('code,exchange,name\n600001,SH,邯郸钢铁\n')
+    try:
+        assert app_module.symbol_master.reload()
+        app_module.on_symbols_reloaded()
+        assert positions(app_module.database, account_id) == [('600001.SH', 100, 1000.0)]
+        response = client.post('/api/transaction/add', headers=headers,
+                               json={'symbol': '600001', 'type': 'sell', 'price': 10, 'quantity': 40})
+        assert response.status_code == 200
+        assert positions(app_module.database, account_id) == [('600001.SH', 60, 600.0)]
+    finally:
+        os.remove(path)
+        app_module.symbol_master.reload()
+
+
+def test_symbol_parameters_are_normalized_on_read(app_module):
+    client = app_module.app.test_client()
+    headers = {'X-Account-Id': str(client.post('/api/accounts', json={'name': '查询'}).get_json()['id'])}
+    client.post('/api/stock/add', headers=headers, json={'symbol': '600002.SH'})
+    client.post('/api/transaction/add', headers=headers,
+                json={'symbol': '600002.SH', 'type': 'buy', 'price': 10, 'quantity': 100})
+    client.post('/api/alerts', headers=headers, json={'symbol': '600002.SH', 'direction': 'above', 'threshold': 20})
+    app_module.history_store.record({'600002.SH': (10.0, time.time())})
+    for spelling in ('sh600002', 'SH:600002', '600002.ss'):
+        lots_response = client.get(f'/api/lots/{spelling}', headers=headers).get_json()
+        assert [lot['quantity'] for lot in lots_response['lots']] == [100]
+        assert len(client.get(f'/api/transactions?symbol={spelling}', headers=headers).get_json()['items']) == 1
+        assert len(client.get(f'/api/stocks?symbol={spelling}&limit=10', headers=headers).get_json()['items']) == 1
+        assert len(client.get(f'/api/alerts?symbol={spelling}', headers=headers).get_json()) == 1
+        assert client.get(f'/api/alerts/events?symbol={spelling}', headers=headers).status_code == 200
+        assert 10.0 in client.get(f'/api/history/{spelling}').get_json()['price']
+    for url in ('/api/lots/%20', '/api/transactions?symbol=%20', '/api/stocks?symbol=%20',
+                '/api/alerts?symbol=%20', '/api/alerts/events?symbol=%20', '/api/history/%20'):
+        assert client.get(url, headers=headers).status_code == 400, url
@@ -0,0 +1,5 @@
+# WSGI 入口：gunicorn 等服务器使用 wsgi:app
+# 多个 worker 共享状态时需要设置 SHARED_STATE=1（serve.py 会自动设置）
+from app import app
+
+application = app